@@ -0,0 +1,31 @@
+"""add subscription active lookup index
+
+Revision ID: 004
+Revises: add_paypal_fields
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = 'add_paypal_fields'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """创建 (user_id, end_date DESC) 复合索引，活跃订阅查询可单次索引定位，无需扫描排序"""
+    op.create_index(
+        'ix_sub_user_end_desc',
+        'subscriptions',
+        ['user_id', sa.text('end_date DESC')],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    """删除复合索引"""
+    op.drop_index('ix_sub_user_end_desc', table_name='subscriptions')
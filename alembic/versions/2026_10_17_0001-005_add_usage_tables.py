@@ -0,0 +1,65 @@
+"""add usage records and daily stats tables
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17 00:01:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 创建使用记录表
+    op.create_table(
+        'usage_records',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('action_type', sa.String(length=50), nullable=False),
+        sa.Column('duration_minutes', sa.Float(), nullable=False),
+        sa.Column('cost', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_usage_records_id'), 'usage_records', ['id'], unique=False)
+    op.create_index(op.f('ix_usage_records_action_type'), 'usage_records', ['action_type'], unique=False)
+    op.create_index('ix_usage_records_user_created', 'usage_records', ['user_id', 'created_at'], unique=False)
+    
+    # 创建按天预聚合的使用统计表
+    op.create_table(
+        'usage_daily_stats',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('action_type', sa.String(length=50), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('total_duration', sa.Float(), nullable=False),
+        sa.Column('total_cost', sa.Float(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'action_type', 'day', name='uq_usage_daily_stats_user_action_day')
+    )
+    op.create_index(op.f('ix_usage_daily_stats_id'), 'usage_daily_stats', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    # 删除表（逆序）
+    op.drop_index(op.f('ix_usage_daily_stats_id'), table_name='usage_daily_stats')
+    op.drop_table('usage_daily_stats')
+    
+    op.drop_index('ix_usage_records_user_created', table_name='usage_records')
+    op.drop_index(op.f('ix_usage_records_action_type'), table_name='usage_records')
+    op.drop_index(op.f('ix_usage_records_id'), table_name='usage_records')
+    op.drop_table('usage_records')
@@ -1,4 +1,5 @@
 """角色一致性API端点"""
+import asyncio
 import time
 import tempfile
 import os
@@ -169,8 +170,9 @@ async def generate_storyboard_frame(
                 temp_file.write(content)
                 pose_reference_path = temp_file.name
         
-        # 生成分镜
-        frame_path = engine.generate_storyboard_frame(
+        # 生成分镜（Replicate调用是阻塞的，放到线程池中执行）
+        frame_path = await asyncio.to_thread(
+            engine.generate_storyboard_frame,
             consistency_model=consistency_model,
             scene_description=scene_description,
             pose_reference=pose_reference_path
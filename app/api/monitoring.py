@@ -2,7 +2,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import Dict, List
 
-from app.services.monitoring import monitoring_service
+from app.services.monitoring import get_monitoring_service
 from app.api.dependencies import get_current_user
 from app.models.user import User
 
@@ -17,7 +17,7 @@ async def get_metrics() -> Dict[str, Dict]:
     
     返回所有注册的指标及其当前值
     """
-    return monitoring_service.get_all_metrics()
+    return get_monitoring_service().get_all_metrics()
 
 
 @router.get("/metrics/prometheus")
@@ -27,7 +27,7 @@ async def get_prometheus_metrics() -> str:
     
     返回符合Prometheus格式的指标数据
     """
-    return monitoring_service.export_prometheus_format()
+    return get_monitoring_service().export_prometheus_format()
 
 
 @router.get("/alerts")
@@ -43,7 +43,7 @@ async def get_alerts(
     # if not current_user.is_admin:
     #     raise HTTPException(status_code=403, detail="需要管理员权限")
     
-    return monitoring_service.check_alerts()
+    return get_monitoring_service().check_alerts()
 
 
 @router.get("/alerts/history")
@@ -60,7 +60,7 @@ async def get_alert_history(
     # if not current_user.is_admin:
     #     raise HTTPException(status_code=403, detail="需要管理员权限")
     
-    return monitoring_service.get_alert_history(limit=limit)
+    return get_monitoring_service().get_alert_history(limit=limit)
 
 
 @router.get("/health")
@@ -71,10 +71,10 @@ async def health_check() -> Dict[str, str]:
     返回系统健康状态
     """
     # 检查关键指标
-    metrics = monitoring_service.get_all_metrics()
+    metrics = get_monitoring_service().get_all_metrics()
     
     # 检查是否有严重告警
-    alerts = monitoring_service.check_alerts()
+    alerts = get_monitoring_service().check_alerts()
     critical_alerts = [a for a in alerts if a["level"] == "critical"]
     
     if critical_alerts:
@@ -1,16 +1,31 @@
 """项目导出API端点"""
+import asyncio
+from typing import IO, Iterator
+
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.api.dependencies import get_current_user, get_db
 from app.models.user import User
-from app.services.project_export import ProjectExportService
+from app.services.project_export import ProjectExportService, MEDIA_CHUNK_SIZE
 
 
 router = APIRouter(prefix="/projects", tags=["project-export"])
 
 
+def _iter_archive(archive: IO[bytes]) -> Iterator[bytes]:
+    """按块读取导出的ZIP文件，读完后关闭（磁盘临时文件随之删除）"""
+    try:
+        while True:
+            chunk = archive.read(MEDIA_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        archive.close()
+
+
 @router.get("/{project_id}/export")
 async def export_project(
     project_id: str,
@@ -34,15 +49,15 @@ async def export_project(
         # 创建导出服务
         export_service = ProjectExportService(db)
         
-        # 导出项目
-        zip_buffer = export_service.export_project(project_id, include_media)
+        # 导出项目（下载媒体与压缩是阻塞操作，放到线程池中执行）
+        zip_buffer = await asyncio.to_thread(export_service.export_project, project_id, include_media)
         
         # 获取文件名
         filename = export_service.get_export_filename(project_id)
         
         # 返回文件流
         return StreamingResponse(
-            zip_buffer,
+            _iter_archive(zip_buffer),
             media_type="application/zip",
             headers={
                 "Content-Disposition": f"attachment; filename={filename}"
@@ -84,14 +99,14 @@ async def export_project_metadata_only(
         export_service = ProjectExportService(db)
         
         # 导出项目（不包含媒体）
-        zip_buffer = export_service.export_project(project_id, include_media=False)
+        zip_buffer = await asyncio.to_thread(export_service.export_project, project_id, include_media=False)
         
         # 获取文件名
         filename = export_service.get_export_filename(project_id).replace(".zip", "_metadata.zip")
         
         # 返回文件流
         return StreamingResponse(
-            zip_buffer,
+            _iter_archive(zip_buffer),
             media_type="application/zip",
             headers={
                 "Content-Disposition": f"attachment; filename={filename}"
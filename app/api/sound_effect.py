@@ -23,7 +23,7 @@ from app.schemas.sound_effect import (
     SearchEffectsResponse
 )
 from app.services.sound_effect_matcher import (
-    SoundEffectMatcher,
+    get_sound_effect_matcher,
     SceneSegment,
     SceneType,
     EmotionType
@@ -44,7 +44,7 @@ async def parse_script(
     使用NLP技术提取场景类型、动作、情感等信息
     """
     try:
-        matcher = SoundEffectMatcher()
+        matcher = get_sound_effect_matcher()
         
         # 解析剧本
         segments = matcher.parse_script(request.script)
@@ -89,7 +89,7 @@ async def recommend_sound_effects(
     基于场景内容推荐最相关的音效（默认返回前3个）
     """
     try:
-        matcher = SoundEffectMatcher()
+        matcher = get_sound_effect_matcher()
         
         # 创建场景片段
         scene = SceneSegment(
@@ -146,7 +146,7 @@ async def auto_place_sound_effects(
     根据场景和音效的配对，自动计算放置位置和时长
     """
     try:
-        matcher = SoundEffectMatcher()
+        matcher = get_sound_effect_matcher()
         
         # 解析剧本
         segments = matcher.parse_script(request.script)
@@ -186,7 +186,7 @@ async def upload_custom_effect(
     支持用户上传自己的音效文件并自动标记元数据
     """
     try:
-        matcher = SoundEffectMatcher()
+        matcher = get_sound_effect_matcher()
         
         # 上传音效
         effect = matcher.upload_custom_effect(
@@ -223,7 +223,7 @@ async def search_sound_effects(
     支持按类别和标签搜索音效
     """
     try:
-        matcher = SoundEffectMatcher()
+        matcher = get_sound_effect_matcher()
         
         # 搜索音效
         if request.category:
@@ -266,7 +266,7 @@ async def get_sound_library(
     返回所有可用的音效
     """
     try:
-        matcher = SoundEffectMatcher()
+        matcher = get_sound_effect_matcher()
         effects = matcher.library.get_all_effects()
         
         effect_responses = [
@@ -29,6 +29,18 @@ def create_storyboard_frame(
     service = StoryboardService(db)
     return service.create_frame(frame_data)
 
+@router.post("/bulk", response_model=List[StoryboardFrameResponse], status_code=status.HTTP_201_CREATED)
+def create_storyboard_frames_bulk(
+    frames_data: List[StoryboardFrameCreate],
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    批量创建分镜帧（按传入顺序分配序号）
+    """
+    service = StoryboardService(db)
+    return service.create_frames_bulk(frames_data)
+
 @router.get("", response_model=List[StoryboardFrameResponse])
 def list_storyboard_frames(
     project_id: UUID = Query(..., description="项目ID"),
@@ -67,7 +79,10 @@ def update_storyboard_frame(
     更新分镜帧
     """
     service = StoryboardService(db)
-    updated_frame = service.update_frame(frame_id, frame_data)
+    try:
+        updated_frame = service.update_frame(frame_id, frame_data)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     if not updated_frame:
         raise HTTPException(status_code=404, detail="分镜不存在")
     return updated_frame
@@ -1,10 +1,11 @@
 """Redis缓存管理"""
 import json
-from typing import Any, Optional
+from typing import Any, List, Optional
 import redis.asyncio as aioredis
 from redis.asyncio import Redis
 
 from app.core.config import settings
+from app.core.serialization import dumps, loads
 
 
 class CacheManager:
@@ -42,11 +43,37 @@ class CacheManager:
         value = await self._redis.get(key)
         if value:
             try:
-                return json.loads(value)
+                return loads(value)
             except json.JSONDecodeError:
                 return value
         return None
     
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """
+        批量获取缓存值（一次Redis往返）
+        
+        参数:
+            keys: 缓存键列表
+        
+        返回:
+            与keys顺序一致的值列表，不存在的键为None
+        """
+        if not self._redis or not keys:
+            return [None] * len(keys)
+        
+        values = await self._redis.mget(keys)
+        results = []
+        for value in values:
+            if value:
+                try:
+                    value = loads(value)
+                except json.JSONDecodeError:
+                    pass
+                results.append(value)
+            else:
+                results.append(None)
+        return results
+    
     async def set(
         self,
         key: str,
@@ -68,7 +95,7 @@ class CacheManager:
             return False
         
         if isinstance(value, (dict, list)):
-            value = json.dumps(value)
+            value = dumps(value)
         
         if expire:
             await self._redis.setex(key, expire, value)
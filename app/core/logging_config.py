@@ -0,0 +1,57 @@
+"""日志配置
+
+根日志器的处理器改为经由队列在后台线程写出，
+业务线程（如导出、下载线程池）记录日志时只需入队，不会阻塞在stdout/stderr上。
+"""
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+
+_queue_listener: Optional[QueueListener] = None
+
+
+def setup_queue_logging(level: int = logging.INFO) -> QueueListener:
+    """
+    将根日志器的处理器移到后台队列监听线程（重复调用时返回已有的监听器）
+    
+    参数:
+        level: 根日志器级别
+    
+    返回:
+        QueueListener: 已启动的队列监听器
+    """
+    global _queue_listener
+    if _queue_listener is not None:
+        return _queue_listener
+    
+    root = logging.getLogger()
+    handlers = list(root.handlers) or [logging.StreamHandler()]
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    
+    _queue_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _queue_listener.start()
+    return _queue_listener
+
+
+def shutdown_queue_logging() -> None:
+    """停止队列监听线程并写出剩余日志，恢复根日志器的原处理器"""
+    global _queue_listener
+    if _queue_listener is None:
+        return
+    
+    listener, _queue_listener = _queue_listener, None
+    listener.stop()
+    
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
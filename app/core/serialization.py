@@ -0,0 +1,70 @@
+"""JSON序列化工具（orjson可选加速，统一各模块的序列化行为）"""
+import json
+from typing import Any, Callable, Optional
+
+# 高性能JSON序列化（可选）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    """无法原生序列化的值：datetime等输出ISO格式，UUID等输出字符串"""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(
+    data: Any,
+    *,
+    indent: bool = False,
+    sort_keys: bool = False,
+    default: Optional[Callable[[Any], Any]] = _default
+) -> bytes:
+    """
+    序列化为UTF-8编码的JSON字节
+    
+    优先使用orjson（原生支持datetime/UUID，直接输出字节）；orjson无法处理的值
+    （如超过64位的整数、孤立代理字符）回退到标准库。两条路径输出格式一致：
+    紧凑分隔符、非ASCII字符原样输出、非字符串键转为字符串。
+    
+    参数:
+        data: 待序列化的数据
+        indent: 是否按2个空格缩进
+        sort_keys: 是否按键排序（用于计算稳定的哈希）
+        default: 无法序列化的值的转换函数，传None时直接抛出TypeError
+    
+    返回:
+        bytes: JSON字节串
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(data, default=default, option=option)
+        except TypeError:
+            pass
+    
+    kwargs = {
+        "indent": 2 if indent else None,
+        "separators": (",", ": ") if indent else (",", ":"),
+        "sort_keys": sort_keys,
+        "default": default,
+    }
+    try:
+        return json.dumps(data, ensure_ascii=False, **kwargs).encode("utf-8")
+    except UnicodeEncodeError:
+        # 孤立代理字符无法编码为UTF-8，改为\uXXXX转义（仍是合法JSON）
+        return json.dumps(data, ensure_ascii=True, **kwargs).encode("ascii")
+
+
+def loads(data: Any) -> Any:
+    """反序列化JSON（bytes或str）；orjson的解码异常是json.JSONDecodeError的子类"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
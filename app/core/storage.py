@@ -1,7 +1,8 @@
 """对象存储管理（S3或本地存储）"""
 import os
+import shutil
 from pathlib import Path
-from typing import BinaryIO, Optional
+from typing import BinaryIO, Iterator, Optional
 import boto3
 from botocore.exceptions import ClientError
 
@@ -56,8 +57,9 @@ class StorageManager:
         file_path = self.storage_path / object_key
         file_path.parent.mkdir(parents=True, exist_ok=True)
         
+        # 分块复制，大文件（如渲染输出的视频）不必整体读入内存
         with open(file_path, 'wb') as f:
-            f.write(file.read())
+            shutil.copyfileobj(file, f, 1 << 20)
         
         return f"/storage/{object_key}"
     
@@ -104,6 +106,51 @@ class StorageManager:
         else:
             return self._download_s3(object_key)
     
+    def stream_file(self, object_key: str, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+        """
+        分块读取文件，避免整个文件驻留内存
+        
+        参数:
+            object_key: 对象键（路径）
+            chunk_size: 每块字节数
+        
+        返回:
+            文件内容块迭代器
+        """
+        if self.use_local:
+            return self._stream_local(object_key, chunk_size)
+        else:
+            return self._stream_s3(object_key, chunk_size)
+    
+    def _stream_local(self, object_key: str, chunk_size: int) -> Iterator[bytes]:
+        """从本地存储分块读取"""
+        file_path = self.storage_path / object_key
+        
+        if not file_path.exists():
+            raise FileNotFoundError(f"文件不存在: {object_key}")
+        
+        def chunks() -> Iterator[bytes]:
+            with open(file_path, 'rb') as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        
+        return chunks()
+    
+    def _stream_s3(self, object_key: str, chunk_size: int) -> Iterator[bytes]:
+        """从S3分块读取"""
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name,
+                Key=object_key
+            )
+        except ClientError as e:
+            raise Exception(f"下载文件失败: {str(e)}")
+        
+        return response['Body'].iter_chunks(chunk_size)
+    
     def _download_local(self, object_key: str) -> bytes:
         """从本地存储下载"""
         file_path = self.storage_path / object_key
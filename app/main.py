@@ -4,8 +4,10 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
+from app.core.logging_config import setup_queue_logging, shutdown_queue_logging
 from app.api import auth, subscription, usage, project, collaboration, lip_sync, character_consistency, video_rendering, sound_effect, workflow, billing, asset_library, monitoring, websocket, onboarding, storyboard, paypal
-from app.services.monitoring import monitoring_service
+from app.services.monitoring import get_monitoring_service
+from app.services.paypal_service import close_http_clients as close_paypal_clients
 
 
 app = FastAPI(
@@ -46,6 +48,7 @@ app.add_middleware(
 async def monitoring_middleware(request: Request, call_next):
     """监控中间件：记录请求指标"""
     start_time = time.time()
+    monitoring_service = get_monitoring_service()
     
     # 增加请求计数
     api_requests = monitoring_service.get_metric("api_requests_total")
@@ -90,6 +93,24 @@ app.include_router(storyboard.router, prefix=settings.API_V1_PREFIX)
 app.include_router(paypal.router, prefix=settings.API_V1_PREFIX)
 
 
+@app.on_event("startup")
+async def start_queue_logging():
+    """日志经由队列在后台线程写出，避免业务线程阻塞在输出上"""
+    setup_queue_logging()
+
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    """关闭共享的外部HTTP客户端连接池"""
+    await close_paypal_clients()
+
+
+@app.on_event("shutdown")
+async def stop_queue_logging():
+    """写出剩余日志并停止队列监听线程"""
+    shutdown_queue_logging()
+
+
 @app.get("/")
 async def root() -> dict[str, str]:
     """健康检查端点"""
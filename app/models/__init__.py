@@ -8,6 +8,7 @@ from app.models.audio import AudioTrack
 from app.models.sound_effect import SoundEffect
 from app.models.asset import Asset, AssetType
 from app.models.subscription import Subscription
+from app.models.usage import UsageRecord, UsageDailyStat
 from app.models.collaboration import (
     ProjectCollaborator,
     ProjectInvitation,
@@ -31,6 +32,8 @@ __all__ = [
     "Asset",
     "AssetType",
     "Subscription",
+    "UsageRecord",
+    "UsageDailyStat",
     "ProjectCollaborator",
     "ProjectInvitation",
     "ProjectVersion",
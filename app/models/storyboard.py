@@ -1,5 +1,5 @@
 """分镜模型"""
-from sqlalchemy import Column, Integer, Text, Float, ForeignKey, JSON, ARRAY
+from sqlalchemy import Column, Integer, Text, Float, ForeignKey, JSON, ARRAY, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from app.models.base import BaseModel, GUID
@@ -9,6 +9,15 @@ class StoryboardFrame(BaseModel):
     """分镜帧模型 (对应数据库中的 scenes 表)"""
     
     __tablename__ = "scenes"
+    __table_args__ = (
+        # 同一项目内序号唯一（服务层在进程内缓存序号，跨进程冲突由此约束兜底）；
+        # 延迟到提交时检查，允许在同一事务内交换序号（重新排序）
+        UniqueConstraint(
+            "project_id", "sequence_number",
+            name="scenes_project_sequence_key",
+            deferrable=True, initially="DEFERRED"
+        ),
+    )
     
     project_id = Column(GUID(), ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True)
     sequence_number = Column(Integer, nullable=False)
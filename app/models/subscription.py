@@ -1,5 +1,5 @@
 """订阅模型"""
-from sqlalchemy import Column, Float, Boolean, DateTime, ForeignKey, Enum as SQLEnum, String
+from sqlalchemy import Column, Float, Boolean, DateTime, ForeignKey, Enum as SQLEnum, String, Index
 from sqlalchemy.orm import relationship
 
 from app.models.base import BaseModel, GUID
@@ -25,3 +25,8 @@ class Subscription(BaseModel):
     
     # 关系
     user = relationship("User", back_populates="subscriptions")
+    
+    __table_args__ = (
+        # 活跃订阅查询（user_id 过滤 + end_date 倒序取第一条）可直接走索引
+        Index("ix_sub_user_end_desc", "user_id", end_date.desc()),
+    )
@@ -0,0 +1,38 @@
+"""使用记录模型"""
+from sqlalchemy import Column, Date, Float, ForeignKey, Index, Integer, String, UniqueConstraint
+
+from app.models.base import BaseModel, GUID
+
+
+class UsageRecord(BaseModel):
+    """使用记录模型"""
+    
+    __tablename__ = "usage_records"
+    
+    user_id = Column(GUID(), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    action_type = Column(String(50), nullable=False, index=True)
+    duration_minutes = Column(Float, nullable=False)
+    cost = Column(Float, default=0.0, nullable=False)
+    
+    __table_args__ = (
+        # 使用历史按用户过滤、按时间倒序
+        Index("ix_usage_records_user_created", "user_id", "created_at"),
+    )
+
+
+class UsageDailyStat(BaseModel):
+    """按天预聚合的使用统计（写入使用记录时同步累加）"""
+    
+    __tablename__ = "usage_daily_stats"
+    
+    user_id = Column(GUID(), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    action_type = Column(String(50), nullable=False)
+    day = Column(Date, nullable=False)
+    total_duration = Column(Float, default=0.0, nullable=False)
+    total_cost = Column(Float, default=0.0, nullable=False)
+    count = Column(Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        # 每个用户、操作类型、日期只有一行，作为累加写入的冲突目标
+        UniqueConstraint("user_id", "action_type", "day", name="uq_usage_daily_stats_user_action_day"),
+    )
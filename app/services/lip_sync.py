@@ -1,11 +1,16 @@
 """中文口型同步引擎服务"""
 import os
 import tempfile
+from functools import lru_cache
+from itertools import chain
+from operator import itemgetter
 from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 import numpy as np
 from datetime import datetime
 
+from app.core.serialization import dumps
+
 # 音频处理库
 try:
     import librosa
@@ -27,6 +32,10 @@ except ImportError:
     pinyin = None
 
 
+# Whisper词级结果的字段提取器（单次C层元组读取）
+_word_fields = itemgetter("word", "start", "end")
+
+
 class AudioAnalysis:
     """音频分析结果"""
     
@@ -61,6 +70,24 @@ class AudioAnalysis:
             "transcript": self.transcript,
             "created_at": self.created_at.isoformat()
         }
+    
+    def to_json(self) -> bytes:
+        """
+        序列化为JSON字节串
+        
+        优先使用orjson，长音频的音素列表无需先经过中间str
+        """
+        return dumps(self.to_dict())
+    
+    def dump(self, path: str) -> None:
+        """
+        将分析结果写入JSON文件
+        
+        参数:
+            path: 目标文件路径
+        """
+        with open(path, "wb") as f:
+            f.write(self.to_json())
 
 
 class LipKeyframe:
@@ -292,24 +319,24 @@ class ChineseLipSyncEngine:
         """
         phonemes = []
         
-        # 从segments中提取词级时间戳
+        # 从segments中提取词级时间戳（展平为单层迭代）
         segments = whisper_result.get("segments", [])
+        words = chain.from_iterable(
+            segment["words"] for segment in segments if segment.get("words")
+        )
         
-        for segment in segments:
-            words = segment.get("words", [])
-            for word_info in words:
-                word = word_info.get("word", "").strip()
-                start_time = word_info.get("start", 0.0)
-                end_time = word_info.get("end", 0.0)
-                
-                if not word:
-                    continue
-                
-                # 使用pypinyin提取拼音和声调
-                word_phonemes = self._extract_chinese_phonemes(
-                    word, start_time, end_time
-                )
-                phonemes.extend(word_phonemes)
+        for word_info in words:
+            word, start_time, end_time = _word_fields(word_info)
+            word = word.strip()
+            
+            if not word:
+                continue
+            
+            # 使用pypinyin提取拼音和声调
+            word_phonemes = self._extract_chinese_phonemes(
+                word, start_time, end_time
+            )
+            phonemes.extend(word_phonemes)
         
         return phonemes
     
@@ -391,10 +418,7 @@ class ChineseLipSyncEngine:
         返回:
             int: 声调（0-5）
         """
-        # 检查最后一个字符是否是数字
-        if pinyin_str and pinyin_str[-1].isdigit():
-            return int(pinyin_str[-1])
-        return 0  # 轻声
+        return _extract_tone_cached(pinyin_str)
     
     def _split_pinyin(self, pinyin_str: str) -> Tuple[str, str]:
         """
@@ -406,24 +430,7 @@ class ChineseLipSyncEngine:
         返回:
             Tuple[str, str]: (声母, 韵母)
         """
-        # 移除声调数字
-        py = pinyin_str.rstrip('012345')
-        
-        if not py:
-            return "", ""
-        
-        # 检查双字母声母
-        for initial in ['zh', 'ch', 'sh']:
-            if py.startswith(initial):
-                return initial, py[len(initial):]
-        
-        # 检查单字母声母
-        for initial in self.INITIALS:
-            if len(initial) == 1 and py.startswith(initial):
-                return initial, py[1:]
-        
-        # 没有声母，全是韵母
-        return "", py
+        return _split_pinyin_cached(pinyin_str)
     
     def generate_lip_keyframes(
         self,
@@ -442,6 +449,10 @@ class ChineseLipSyncEngine:
         """
         keyframes = []
         
+        # 循环外预取口型查找函数和各声调强度，避免每个音素重复方法调用
+        mouth_get = self.PHONEME_TO_MOUTH_SHAPE.get
+        intensity_lut = {tone: self._calculate_intensity(tone, style) for tone in range(6)}
+        
         for phoneme_info in audio_analysis.phonemes:
             phoneme = phoneme_info["phoneme"]
             start_time = phoneme_info["start_time"]
@@ -450,10 +461,12 @@ class ChineseLipSyncEngine:
             phoneme_type = phoneme_info.get("type", "unknown")
             
             # 获取口型形状
-            mouth_shape = self._get_mouth_shape_for_phoneme(phoneme)
+            mouth_shape = mouth_get(phoneme, "neutral")
             
             # 根据声调和风格调整强度
-            intensity = self._calculate_intensity(tone, style)
+            intensity = intensity_lut.get(tone)
+            if intensity is None:
+                intensity = self._calculate_intensity(tone, style)
             
             # 根据音素类型调整强度
             if phoneme_type == "initial":
@@ -660,24 +673,27 @@ class ChineseLipSyncEngine:
         if not errors:
             return SyncAccuracyReport(0, 0, 1.0, 0)
         
-        # 计算统计指标
-        average_error = np.mean(errors)
-        max_error = np.max(errors)
-        min_error = np.min(errors)
-        std_error = np.std(errors)
+        # 计算统计指标（一次性转换为ndarray）
+        err = np.asarray(errors, dtype=np.float64)
+        average_error = err.mean()
+        max_error = err.max()
         
-        # 计算准确率（误差<50ms的比例）
-        accurate_count = sum(1 for e in errors if e < 50)
-        accuracy_rate = accurate_count / len(errors)
-        
-        # 计算误差分布
+        # 计算误差分布：[0,20) [20,50) [50,100) [100,∞)
+        bucket_counts = np.bincount(
+            np.searchsorted([20.0, 50.0, 100.0], err, side="right"),
+            minlength=4
+        )
+        excellent, good, acceptable, poor = (int(c) for c in bucket_counts)
         error_distribution = {
-            "excellent": sum(1 for e in errors if e < 20),  # < 20ms
-            "good": sum(1 for e in errors if 20 <= e < 50),  # 20-50ms
-            "acceptable": sum(1 for e in errors if 50 <= e < 100),  # 50-100ms
-            "poor": sum(1 for e in errors if e >= 100),  # >= 100ms
+            "excellent": excellent,  # < 20ms
+            "good": good,  # 20-50ms
+            "acceptable": acceptable,  # 50-100ms
+            "poor": poor,  # >= 100ms
         }
         
+        # 计算准确率（误差<50ms的比例）
+        accuracy_rate = (excellent + good) / len(err)
+        
         return SyncAccuracyReport(
             average_error_ms=float(average_error),
             max_error_ms=float(max_error),
@@ -749,6 +765,39 @@ class ChineseLipSyncEngine:
         return recommendations
 
 
+# 普通话音节数量有限（约1500个），拼音解析结果进程内缓存
+@lru_cache(maxsize=4096)
+def _extract_tone_cached(pinyin_str: str) -> int:
+    """从拼音字符串中提取声调（缓存版）"""
+    # 检查最后一个字符是否是数字
+    if pinyin_str and pinyin_str[-1].isdigit():
+        return int(pinyin_str[-1])
+    return 0  # 轻声
+
+
+@lru_cache(maxsize=4096)
+def _split_pinyin_cached(pinyin_str: str) -> Tuple[str, str]:
+    """将拼音分离为声母和韵母（缓存版）"""
+    # 移除声调数字
+    py = pinyin_str.rstrip('012345')
+    
+    if not py:
+        return "", ""
+    
+    # 检查双字母声母
+    for initial in ['zh', 'ch', 'sh']:
+        if py.startswith(initial):
+            return initial, py[len(initial):]
+    
+    # 检查单字母声母
+    for initial in ChineseLipSyncEngine.INITIALS:
+        if len(initial) == 1 and py.startswith(initial):
+            return initial, py[1:]
+    
+    # 没有声母，全是韵母
+    return "", py
+
+
 # 全局引擎实例（单例模式）
 _engine_instance: Optional[ChineseLipSyncEngine] = None
 
@@ -1,10 +1,16 @@
 """监控和告警服务"""
+import operator
+import threading
 import time
-from typing import Dict, List, Optional
+from bisect import bisect_left, insort
+from typing import Callable, Deque, Dict, List, Optional
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, deque
+from itertools import islice
 from enum import Enum
 
+import numpy as np
+
 
 class MetricType(Enum):
     """指标类型"""
@@ -21,6 +27,37 @@ class AlertLevel(Enum):
     CRITICAL = "critical"
 
 
+# 直方图保留的最近样本数
+MAX_SAMPLES = 1000
+
+# 保留的告警历史条数
+MAX_ALERT_HISTORY = 100
+
+# 直方图桶上界（秒，与Prometheus客户端默认值一致）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 仅直方图有变更时，Prometheus导出缓存的最长复用时间（秒）
+EXPORT_CACHE_TTL = 1.0
+
+# 告警比较运算符
+COMPARISON_OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+}
+
+# Prometheus导出的直方图百分位数及行模板
+EXPORT_PERCENTILES = [50, 95, 99]
+_QUANTILE_LABELS = tuple(f"0.{p}" for p in EXPORT_PERCENTILES)
+_BUCKET_LINE = '{name}_bucket{{le="{le}"{label_inner}}} {value}'
+_QUANTILE_LINE = '{name}{{quantile="{q}"{label_inner}}} {value}'
+
+# 比较运算符编码（check_alerts批量向量化比较用），未知运算符为-1
+COMPARISON_OP_CODES: Dict[str, int] = {">": 0, "<": 1, ">=": 2, "<=": 3, "==": 4}
+
+
 class Metric:
     """指标"""
     
@@ -30,50 +67,143 @@ class Metric:
         self.description = description
         self.value = 0.0
         self.labels: Dict[str, str] = {}
-        self.samples: List[float] = []
+        self._labels_str: Optional[str] = None  # 渲染后的标签字符串缓存
+        self._labels_key: Optional[tuple] = None  # 上次合并的标签（元组形式）
+        # 环形缓冲区，超出容量时O(1)淘汰最旧样本
+        self.samples: Deque[float] = deque(maxlen=MAX_SAMPLES)
+        # 窗口样本的有序副本，百分位数查询直接按下标读取
+        self._sorted_samples: List[float] = []
+        # 窗口内样本的滚动和，均值查询O(1)；每MAX_SAMPLES次观测重新求和以消除浮点漂移
+        self._window_sum = 0.0
+        self._observes_since_resync = 0
+        # 流式分桶计数，内存只与桶数有关，不随观测次数增长
+        self.buckets = DEFAULT_BUCKETS
+        self.bucket_counts: List[int] = [0] * (len(DEFAULT_BUCKETS) + 1)  # 最后一个为+Inf
+        self.total_sum = 0.0
+        self.total_count = 0
         self.last_updated = time.time()
+        # 变更通知回调（由MonitoringService注册，用于导出缓存失效）
+        self.on_update: Optional[Callable[["Metric"], None]] = None
+    
+        # 构造时按指标类型绑定更新实现，热路径无需比较枚举；类型不匹配的调用为空操作
+        self.update: Callable[..., None] = {
+            MetricType.COUNTER: self._inc_impl,
+            MetricType.GAUGE: self._set_impl,
+            MetricType.HISTOGRAM: self._observe_impl,
+        }[metric_type]
+        self._inc = self.update if metric_type is MetricType.COUNTER else self._ignore_update
+        self._set = self.update if metric_type is MetricType.GAUGE else self._ignore_update
+        self._observe = self.update if metric_type is MetricType.HISTOGRAM else self._ignore_update
     
     def inc(self, amount: float = 1.0, labels: Optional[Dict[str, str]] = None):
         """增加计数器"""
-        if self.metric_type == MetricType.COUNTER:
-            self.value += amount
-            self.last_updated = time.time()
-            if labels:
-                self.labels.update(labels)
+        self._inc(amount, labels)
     
     def set(self, value: float, labels: Optional[Dict[str, str]] = None):
         """设置仪表值"""
-        if self.metric_type == MetricType.GAUGE:
-            self.value = value
-            self.last_updated = time.time()
-            if labels:
-                self.labels.update(labels)
+        self._set(value, labels)
     
     def observe(self, value: float, labels: Optional[Dict[str, str]] = None):
         """观察直方图值"""
-        if self.metric_type == MetricType.HISTOGRAM:
-            self.samples.append(value)
-            # 只保留最近1000个样本
-            if len(self.samples) > 1000:
-                self.samples = self.samples[-1000:]
-            self.last_updated = time.time()
-            if labels:
-                self.labels.update(labels)
+        self._observe(value, labels)
+    
+    def _ignore_update(self, value: float, labels: Optional[Dict[str, str]] = None):
+        """与指标类型不匹配的更新，忽略"""
+    
+    def _inc_impl(self, amount: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        """计数器更新实现"""
+        self.value += amount
+        self.last_updated = time.time()
+        if labels:
+            self._update_labels(labels)
+        if self.on_update is not None:
+            self.on_update(self)
+    
+    def _set_impl(self, value: float, labels: Optional[Dict[str, str]] = None):
+        """仪表更新实现"""
+        self.value = value
+        self.last_updated = time.time()
+        if labels:
+            self._update_labels(labels)
+        if self.on_update is not None:
+            self.on_update(self)
+    
+    def _observe_impl(self, value: float, labels: Optional[Dict[str, str]] = None):
+        """直方图更新实现"""
+        samples = self.samples
+        sorted_samples = self._sorted_samples
+        if len(samples) == MAX_SAMPLES:
+            evicted = samples[0]
+            self._window_sum -= evicted
+            del sorted_samples[bisect_left(sorted_samples, evicted)]
+        samples.append(value)
+        insort(sorted_samples, value)
+        self._window_sum += value
+        self._observes_since_resync += 1
+        if self._observes_since_resync >= MAX_SAMPLES:
+            self._window_sum = sum(samples)
+            self._observes_since_resync = 0
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.total_sum += value
+        self.total_count += 1
+        self.last_updated = time.time()
+        if labels:
+            self._update_labels(labels)
+        if self.on_update is not None:
+            self.on_update(self)
+    
+    def _update_labels(self, labels: Dict[str, str]):
+        """合并标签；与上次传入的标签相同时跳过，避免重复更新和标签字符串缓存失效"""
+        key = tuple(labels.items())
+        if key == self._labels_key:
+            return
+        self._labels_key = key
+        self.labels.update(labels)
+        self._labels_str = None
+    
+    def _render_labels(self) -> str:
+        """渲染Prometheus标签字符串（如 {k="v"}），标签变更前复用缓存"""
+        if self._labels_str is None:
+            if self.labels:
+                self._labels_str = "{" + ",".join(
+                    f'{k}="{v}"' for k, v in self.labels.items()
+                ) + "}"
+            else:
+                self._labels_str = ""
+        return self._labels_str
     
     def get_value(self) -> float:
         """获取当前值"""
         if self.metric_type == MetricType.HISTOGRAM:
-            return sum(self.samples) / len(self.samples) if self.samples else 0.0
+            return self._window_sum / len(self.samples) if self.samples else 0.0
         return self.value
     
     def get_percentile(self, percentile: float) -> float:
         """获取百分位数（仅用于直方图）"""
-        if self.metric_type != MetricType.HISTOGRAM or not self.samples:
-            return 0.0
+        return self.get_percentiles([percentile])[0]
+    
+    def get_percentiles(self, percentiles: List[float]) -> List[float]:
+        """
+        一次性获取多个百分位数（仅用于直方图）
+        
+        样本在observe时已按序插入，查询无需排序
+        """
+        sorted_samples = self._sorted_samples
+        if self.metric_type != MetricType.HISTOGRAM or not sorted_samples:
+            return [0.0] * len(percentiles)
         
-        sorted_samples = sorted(self.samples)
-        index = int(len(sorted_samples) * percentile / 100)
-        return sorted_samples[min(index, len(sorted_samples) - 1)]
+        count = len(sorted_samples)
+        return [sorted_samples[min(int(count * p / 100), count - 1)] for p in percentiles]
+    
+    def get_cumulative_buckets(self) -> List[tuple]:
+        """获取累计分桶计数 [(上界, 累计次数), ...]，最后一项为 ("+Inf", 总次数)"""
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        result.append(("+Inf", self.total_count))
+        return result
 
 
 class Alert:
@@ -94,33 +224,26 @@ class Alert:
         self.metric_name = metric_name
         self.threshold = threshold
         self.comparison = comparison
+        # 注册时解析比较运算符，未知运算符永不触发
+        self._cmp = COMPARISON_OPERATORS.get(comparison, lambda value, threshold: False)
         self.triggered = False
         self.triggered_at: Optional[datetime] = None
         self.trigger_count = 0
     
-    def check(self, metric_value: float) -> bool:
+    def check(self, metric_value: float, now: Optional[datetime] = None) -> bool:
         """检查是否触发告警"""
-        triggered = False
-        
-        if self.comparison == ">":
-            triggered = metric_value > self.threshold
-        elif self.comparison == "<":
-            triggered = metric_value < self.threshold
-        elif self.comparison == ">=":
-            triggered = metric_value >= self.threshold
-        elif self.comparison == "<=":
-            triggered = metric_value <= self.threshold
-        elif self.comparison == "==":
-            triggered = metric_value == self.threshold
-        
+        triggered = self._cmp(metric_value, self.threshold)
+        self._update_state(triggered, now)
+        return triggered
+    
+    def _update_state(self, triggered: bool, now: Optional[datetime] = None):
+        """根据比较结果更新告警状态（now为本轮检查的统一时间戳）"""
         if triggered and not self.triggered:
             self.triggered = True
-            self.triggered_at = datetime.utcnow()
+            self.triggered_at = now or datetime.utcnow()
             self.trigger_count += 1
         elif not triggered and self.triggered:
             self.triggered = False
-        
-        return triggered
     
     def to_dict(self) -> Dict:
         """转换为字典"""
@@ -142,7 +265,23 @@ class MonitoringService:
     def __init__(self):
         self.metrics: Dict[str, Metric] = {}
         self.alerts: Dict[str, Alert] = {}
-        self.alert_history: List[Dict] = []
+        self.alert_history: Deque[Dict] = deque(maxlen=MAX_ALERT_HISTORY)
+        # 告警阈值与运算符的对齐数组，注册告警时重建
+        self._alert_list: List[Alert] = []
+        self._alert_thresholds = np.empty(0, dtype=np.float64)
+        self._alert_op_codes = np.empty(0, dtype=np.int8)
+        # Prometheus导出缓存，指标变更时失效
+        self._export_cache: Optional[str] = None
+        self._export_cached_at = 0.0
+        self._dirty = True
+        self._histogram_dirty = False
+    
+    def _mark_dirty(self, metric: Metric):
+        """指标变更回调：标记导出缓存失效"""
+        if metric.metric_type == MetricType.HISTOGRAM:
+            self._histogram_dirty = True
+        else:
+            self._dirty = True
     
     def register_metric(
         self,
@@ -152,7 +291,10 @@ class MonitoringService:
     ) -> Metric:
         """注册指标"""
         if name not in self.metrics:
-            self.metrics[name] = Metric(name, metric_type, description)
+            metric = Metric(name, metric_type, description)
+            metric.on_update = self._mark_dirty
+            self.metrics[name] = metric
+            self._dirty = True
         return self.metrics[name]
     
     def get_metric(self, name: str) -> Optional[Metric]:
@@ -171,30 +313,75 @@ class MonitoringService:
         """注册告警规则"""
         alert = Alert(name, level, message, metric_name, threshold, comparison)
         self.alerts[name] = alert
+        self._rebuild_alert_arrays()
         return alert
     
+    def _rebuild_alert_arrays(self):
+        """重建告警阈值和运算符数组"""
+        self._alert_list = list(self.alerts.values())
+        self._alert_thresholds = np.array(
+            [alert.threshold for alert in self._alert_list], dtype=np.float64
+        )
+        self._alert_op_codes = np.array(
+            [COMPARISON_OP_CODES.get(alert.comparison, -1) for alert in self._alert_list],
+            dtype=np.int8
+        )
+    
     def check_alerts(self) -> List[Dict]:
-        """检查所有告警"""
+        """
+        检查所有告警
+        
+        所有告警的阈值比较在一次NumPy向量运算中完成，
+        只对触发或需要复位的告警逐个更新状态
+        """
         triggered_alerts = []
+        alert_list = self._alert_list
+        count = len(alert_list)
+        if not count:
+            return triggered_alerts
         
-        for alert_name, alert in self.alerts.items():
-            metric = self.get_metric(alert.metric_name)
-            if metric:
-                metric_value = metric.get_value()
-                if alert.check(metric_value):
-                    alert_dict = alert.to_dict()
-                    alert_dict["metric_value"] = metric_value
-                    triggered_alerts.append(alert_dict)
-                    
-                    # 记录到历史
-                    self.alert_history.append({
-                        **alert_dict,
-                        "timestamp": datetime.utcnow().isoformat()
-                    })
+        metrics = [self.metrics.get(alert.metric_name) for alert in alert_list]
+        present = np.fromiter((m is not None for m in metrics), dtype=bool, count=count)
+        values = np.fromiter(
+            (m.get_value() if m is not None else np.nan for m in metrics),
+            dtype=np.float64,
+            count=count
+        )
+        thresholds = self._alert_thresholds
+        op_codes = self._alert_op_codes
+        triggered = np.select(
+            [op_codes == 0, op_codes == 1, op_codes == 2, op_codes == 3, op_codes == 4],
+            [
+                values > thresholds,
+                values < thresholds,
+                values >= thresholds,
+                values <= thresholds,
+                values == thresholds
+            ],
+            default=False
+        )
+        previously_triggered = np.fromiter(
+            (alert.triggered for alert in alert_list), dtype=bool, count=count
+        )
         
-        # 只保留最近100条告警历史
-        if len(self.alert_history) > 100:
-            self.alert_history = self.alert_history[-100:]
+        # 本轮检查共用一个时间戳
+        now = datetime.utcnow()
+        now_iso = now.isoformat()
+        
+        for i in np.flatnonzero((triggered | previously_triggered) & present):
+            alert = alert_list[i]
+            is_triggered = bool(triggered[i])
+            alert._update_state(is_triggered, now)
+            if is_triggered:
+                alert_dict = alert.to_dict()
+                alert_dict["metric_value"] = float(values[i])
+                triggered_alerts.append(alert_dict)
+                
+                # 记录到历史
+                self.alert_history.append({
+                    **alert_dict,
+                    "timestamp": now_iso
+                })
         
         return triggered_alerts
     
@@ -213,52 +400,97 @@ class MonitoringService:
             
             # 如果是直方图，添加百分位数
             if metric.metric_type == MetricType.HISTOGRAM:
-                result[name]["p50"] = metric.get_percentile(50)
-                result[name]["p95"] = metric.get_percentile(95)
-                result[name]["p99"] = metric.get_percentile(99)
+                p50, p95, p99 = metric.get_percentiles(EXPORT_PERCENTILES)
+                result[name]["p50"] = p50
+                result[name]["p95"] = p95
+                result[name]["p99"] = p99
         
         return result
     
     def get_alert_history(self, limit: int = 50) -> List[Dict]:
         """获取告警历史"""
-        return self.alert_history[-limit:]
+        total = len(self.alert_history)
+        return list(islice(self.alert_history, max(0, total - limit), total))
     
     def export_prometheus_format(self) -> str:
-        """导出Prometheus格式的指标"""
+        """
+        导出Prometheus格式的指标
+        
+        计数器/仪表变更后立即重建；仅直方图变更时最多每EXPORT_CACHE_TTL秒重建一次
+        """
+        if self._export_cache is not None and not self._dirty:
+            if (
+                not self._histogram_dirty
+                or time.monotonic() - self._export_cached_at < EXPORT_CACHE_TTL
+            ):
+                return self._export_cache
+        
         lines = []
         
         for name, metric in self.metrics.items():
-            # 添加HELP和TYPE注释
-            lines.append(f"# HELP {name} {metric.description}")
-            lines.append(f"# TYPE {name} {metric.metric_type.value}")
+            labels_str = metric._render_labels()
             
-            # 添加指标值
-            labels_str = ""
-            if metric.labels:
-                labels_list = [f'{k}="{v}"' for k, v in metric.labels.items()]
-                labels_str = "{" + ",".join(labels_list) + "}"
+            # 添加HELP和TYPE注释
+            lines += [
+                f"# HELP {name} {metric.description}",
+                f"# TYPE {name} {metric.metric_type.value}",
+            ]
             
             if metric.metric_type == MetricType.HISTOGRAM:
-                # 直方图需要导出多个值
-                lines.append(f"{name}_sum{labels_str} {sum(metric.samples)}")
-                lines.append(f"{name}_count{labels_str} {len(metric.samples)}")
-                
-                # 添加百分位数
-                for p in [50, 95, 99]:
-                    value = metric.get_percentile(p)
-                    lines.append(f'{name}{{quantile="0.{p}"{labels_str[1:] if labels_str else ""} {value}')
+                # 直方图需要导出多个值：累计分桶、总和、总次数与百分位数
+                label_inner = "," + labels_str[1:-1] if labels_str else ""
+                lines += [
+                    _BUCKET_LINE.format(name=name, le=bound, label_inner=label_inner, value=cumulative)
+                    for bound, cumulative in metric.get_cumulative_buckets()
+                ]
+                lines += [
+                    f"{name}_sum{labels_str} {metric.total_sum}",
+                    f"{name}_count{labels_str} {metric.total_count}",
+                ]
+                lines += [
+                    _QUANTILE_LINE.format(name=name, q=q, label_inner=label_inner, value=value)
+                    for q, value in zip(_QUANTILE_LABELS, metric.get_percentiles(EXPORT_PERCENTILES))
+                ]
             else:
                 lines.append(f"{name}{labels_str} {metric.value}")
         
-        return "\n".join(lines)
+        self._export_cache = "\n".join(lines)
+        self._export_cached_at = time.monotonic()
+        self._dirty = False
+        self._histogram_dirty = False
+        return self._export_cache
+
+
+# 全局监控服务实例（首次使用时创建并注册默认指标和告警）
+_monitoring_service: Optional[MonitoringService] = None
+_monitoring_service_lock = threading.Lock()
+
 
+def get_monitoring_service() -> MonitoringService:
+    """获取全局监控服务实例（单例，延迟初始化）"""
+    global _monitoring_service
+    if _monitoring_service is None:
+        with _monitoring_service_lock:
+            if _monitoring_service is None:
+                service = MonitoringService()
+                setup_default_metrics(service)
+                setup_default_alerts(service)
+                _monitoring_service = service
+    return _monitoring_service
 
-# 全局监控服务实例
-monitoring_service = MonitoringService()
 
+def __getattr__(name: str):
+    """兼容旧的 monitoring_service 模块属性（PEP 562）"""
+    if name == "monitoring_service":
+        return get_monitoring_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def setup_default_metrics():
+
+def setup_default_metrics(monitoring_service: Optional[MonitoringService] = None):
     """设置默认指标"""
+    if monitoring_service is None:
+        monitoring_service = get_monitoring_service()
+    
     # API指标
     monitoring_service.register_metric(
         "api_requests_total",
@@ -337,8 +569,11 @@ def setup_default_metrics():
     )
 
 
-def setup_default_alerts():
+def setup_default_alerts(monitoring_service: Optional[MonitoringService] = None):
     """设置默认告警规则"""
+    if monitoring_service is None:
+        monitoring_service = get_monitoring_service()
+    
     # 错误率告警
     monitoring_service.register_alert(
         "high_error_rate",
@@ -387,8 +622,3 @@ def setup_default_alerts():
         threshold=50,
         comparison=">"
     )
-
-
-# 初始化默认指标和告警
-setup_default_metrics()
-setup_default_alerts()
@@ -1,5 +1,5 @@
 """新手引导服务"""
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
 
@@ -16,6 +16,10 @@ class OnboardingStep(Enum):
     COMPLETED = "completed"
 
 
+# 引导步骤的固定顺序
+_STEP_SEQUENCE: List[OnboardingStep] = list(OnboardingStep)
+
+
 class TutorialStep:
     """教程步骤"""
     
@@ -36,9 +40,11 @@ class TutorialStep:
         self.tips = tips or []
         self.video_url = video_url
         self.estimated_time = estimated_time  # 预计完成时间（分钟）
+        # 教程步骤创建后不再修改，字典表示在构造时一次性生成
+        self._dict = self._build_dict()
     
-    def to_dict(self) -> Dict:
-        """转换为字典"""
+    def _build_dict(self) -> Dict:
+        """构建字典表示"""
         result = {
             "step_id": self.step_id,
             "title": self.title,
@@ -54,6 +60,10 @@ class TutorialStep:
             result["estimated_time"] = self.estimated_time
         
         return result
+    
+    def to_dict(self) -> Dict:
+        """转换为字典（返回构造时生成的只读字典）"""
+        return self._dict
 
 
 class OnboardingService:
@@ -228,6 +238,87 @@ class OnboardingService:
         )
     }
     
+    # 快速入门指南（静态内容）
+    QUICK_START_GUIDE: Dict = {
+        "title": "快速入门指南",
+        "description": "5分钟了解核心工作流",
+        "steps": [
+            {
+                "title": "创建项目",
+                "description": "新建一个竖屏项目",
+                "time": "1分钟"
+            },
+            {
+                "title": "上传角色",
+                "description": "上传角色图片，生成一致性模型",
+                "time": "3分钟"
+            },
+            {
+                "title": "生成分镜",
+                "description": "使用AI生成分镜图像",
+                "time": "5分钟"
+            },
+            {
+                "title": "口型同步",
+                "description": "添加音频并生成口型动画",
+                "time": "5分钟"
+            },
+            {
+                "title": "导出视频",
+                "description": "渲染并导出最终视频",
+                "time": "5-10分钟"
+            }
+        ],
+        "total_time": "约20分钟",
+        "video_url": "/tutorials/quick_start.mp4"
+    }
+    
+    # 功能亮点（静态内容）
+    FEATURE_HIGHLIGHTS: List[Dict] = [
+        {
+            "title": "中文口型同步",
+            "description": "针对中文普通话优化，时间误差<50ms",
+            "icon": "🎤",
+            "learn_more": "/docs/lip-sync"
+        },
+        {
+            "title": "角色一致性",
+            "description": "一张图生成全套分镜，保持视觉统一",
+            "icon": "👤",
+            "learn_more": "/docs/character-consistency"
+        },
+        {
+            "title": "竖屏优化",
+            "description": "专为抖音、快手等平台优化",
+            "icon": "📱",
+            "learn_more": "/docs/vertical-video"
+        },
+        {
+            "title": "智能音效",
+            "description": "AI自动推荐匹配的音效",
+            "icon": "🔊",
+            "learn_more": "/docs/sound-effects"
+        },
+        {
+            "title": "完整工作流",
+            "description": "从剧本到成片，一站式完成",
+            "icon": "⚡",
+            "learn_more": "/docs/workflow"
+        }
+    ]
+    
+    # 每个步骤的（上一步, 下一步），类加载时一次性计算
+    _NEIGHBORS: Dict[OnboardingStep, Tuple[Optional[OnboardingStep], Optional[OnboardingStep]]] = {
+        step: (
+            _STEP_SEQUENCE[i - 1] if i > 0 else None,
+            _STEP_SEQUENCE[i + 1] if i < len(_STEP_SEQUENCE) - 1 else None
+        )
+        for i, step in enumerate(_STEP_SEQUENCE)
+    }
+    
+    # get_all_steps 的序列化结果缓存（TUTORIAL_STEPS 运行期不变）
+    _cached_all_steps: Optional[List[Dict]] = None
+    
     @classmethod
     def get_tutorial_step(cls, step: OnboardingStep) -> TutorialStep:
         """获取教程步骤"""
@@ -236,38 +327,26 @@ class OnboardingService:
     @classmethod
     def get_all_steps(cls) -> List[Dict]:
         """获取所有教程步骤"""
-        return [
-            {
-                "order": i,
-                "step": step.value,
-                **cls.TUTORIAL_STEPS[step].to_dict()
-            }
-            for i, step in enumerate(OnboardingStep, 1)
-        ]
+        if cls._cached_all_steps is None:
+            cls._cached_all_steps = [
+                {
+                    "order": i,
+                    "step": step.value,
+                    **cls.TUTORIAL_STEPS[step].to_dict()
+                }
+                for i, step in enumerate(OnboardingStep, 1)
+            ]
+        return cls._cached_all_steps
     
     @classmethod
     def get_next_step(cls, current_step: OnboardingStep) -> Optional[OnboardingStep]:
         """获取下一步"""
-        steps = list(OnboardingStep)
-        try:
-            current_index = steps.index(current_step)
-            if current_index < len(steps) - 1:
-                return steps[current_index + 1]
-        except ValueError:
-            pass
-        return None
+        return cls._NEIGHBORS.get(current_step, (None, None))[1]
     
     @classmethod
     def get_previous_step(cls, current_step: OnboardingStep) -> Optional[OnboardingStep]:
         """获取上一步"""
-        steps = list(OnboardingStep)
-        try:
-            current_index = steps.index(current_step)
-            if current_index > 0:
-                return steps[current_index - 1]
-        except ValueError:
-            pass
-        return None
+        return cls._NEIGHBORS.get(current_step, (None, None))[0]
     
     @classmethod
     def get_progress(cls, completed_steps: List[str]) -> Dict:
@@ -285,75 +364,12 @@ class OnboardingService:
     @classmethod
     def get_quick_start_guide(cls) -> Dict:
         """获取快速入门指南"""
-        return {
-            "title": "快速入门指南",
-            "description": "5分钟了解核心工作流",
-            "steps": [
-                {
-                    "title": "创建项目",
-                    "description": "新建一个竖屏项目",
-                    "time": "1分钟"
-                },
-                {
-                    "title": "上传角色",
-                    "description": "上传角色图片，生成一致性模型",
-                    "time": "3分钟"
-                },
-                {
-                    "title": "生成分镜",
-                    "description": "使用AI生成分镜图像",
-                    "time": "5分钟"
-                },
-                {
-                    "title": "口型同步",
-                    "description": "添加音频并生成口型动画",
-                    "time": "5分钟"
-                },
-                {
-                    "title": "导出视频",
-                    "description": "渲染并导出最终视频",
-                    "time": "5-10分钟"
-                }
-            ],
-            "total_time": "约20分钟",
-            "video_url": "/tutorials/quick_start.mp4"
-        }
+        return cls.QUICK_START_GUIDE
     
     @classmethod
     def get_feature_highlights(cls) -> List[Dict]:
         """获取功能亮点"""
-        return [
-            {
-                "title": "中文口型同步",
-                "description": "针对中文普通话优化，时间误差<50ms",
-                "icon": "🎤",
-                "learn_more": "/docs/lip-sync"
-            },
-            {
-                "title": "角色一致性",
-                "description": "一张图生成全套分镜，保持视觉统一",
-                "icon": "👤",
-                "learn_more": "/docs/character-consistency"
-            },
-            {
-                "title": "竖屏优化",
-                "description": "专为抖音、快手等平台优化",
-                "icon": "📱",
-                "learn_more": "/docs/vertical-video"
-            },
-            {
-                "title": "智能音效",
-                "description": "AI自动推荐匹配的音效",
-                "icon": "🔊",
-                "learn_more": "/docs/sound-effects"
-            },
-            {
-                "title": "完整工作流",
-                "description": "从剧本到成片，一站式完成",
-                "icon": "⚡",
-                "learn_more": "/docs/workflow"
-            }
-        ]
+        return cls.FEATURE_HIGHLIGHTS
 
 
 # 全局新手引导服务实例
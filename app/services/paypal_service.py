@@ -6,20 +6,71 @@
 - 验证Webhook
 - 退款处理
 """
-import hashlib
+import asyncio
 import hmac
+import time
+import zlib
 import httpx
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+from urllib.parse import urlparse
 from sqlalchemy.orm import Session
 import uuid
 import base64
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
 
 from app.core.config import settings
+from app.core.serialization import dumps, loads
 from app.models.user import User, SubscriptionTier
 from app.models.subscription import Subscription
 
 
+# 按base_url共享的HTTP客户端（服务实例按请求创建，连接池需跨实例复用）
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+# 访问令牌缓存：(client_id, mode) -> (令牌, 过期时刻monotonic)
+_token_cache: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_token_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+# 令牌到期前提前刷新的余量（秒）
+TOKEN_REFRESH_MARGIN = 60
+
+# Webhook签名证书缓存：cert_url -> 证书（按插入顺序淘汰最旧项）
+_webhook_certs: Dict[str, x509.Certificate] = {}
+WEBHOOK_CERT_CACHE_SIZE = 16
+
+
+async def _load_webhook_cert(client: httpx.AsyncClient, cert_url: str) -> x509.Certificate:
+    """通过共享的异步客户端下载并缓存PayPal Webhook签名证书"""
+    cert = _webhook_certs.get(cert_url)
+    if cert is None:
+        response = await client.get(cert_url)
+        response.raise_for_status()
+        cert = x509.load_pem_x509_certificate(response.content)
+        if len(_webhook_certs) >= WEBHOOK_CERT_CACHE_SIZE:
+            _webhook_certs.pop(next(iter(_webhook_certs)))
+        _webhook_certs[cert_url] = cert
+    return cert
+
+
+def _is_paypal_cert_url(cert_url: str) -> bool:
+    """证书地址必须是PayPal域名下的HTTPS地址，防止伪造证书"""
+    parsed = urlparse(cert_url)
+    host = parsed.hostname or ""
+    return parsed.scheme == "https" and (host == "paypal.com" or host.endswith(".paypal.com"))
+
+
+async def close_http_clients():
+    """关闭所有共享的PayPal HTTP客户端（应用关闭时调用）"""
+    clients = list(_http_clients.values())
+    _http_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
 class PayPalService:
     """PayPal支付服务类
     
@@ -38,20 +89,43 @@ class PayPalService:
         else:
             self.base_url = "https://api-m.sandbox.paypal.com"
             self.webhook_id = None
-        
-        self._access_token = None
+    
+    async def _http(self) -> httpx.AsyncClient:
+        """获取共享的HTTP客户端，复用TCP/TLS连接"""
+        client = _http_clients.get(self.base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+                timeout=httpx.Timeout(10.0)
+            )
+            _http_clients[self.base_url] = client
+        return client
     
     async def _get_access_token(self) -> str:
-        """获取PayPal访问令牌"""
-        if self._access_token:
-            return self._access_token
-        
-        auth_string = f"{self.client_id}:{self.client_secret}"
-        auth_bytes = base64.b64encode(auth_string.encode()).decode()
+        """获取PayPal访问令牌
         
-        async with httpx.AsyncClient() as client:
+        令牌在进程内跨实例缓存，临近过期时才重新申请；
+        同一凭据的并发刷新通过锁合并为一次请求。
+        """
+        key = (self.client_id, self.mode)
+        cached = _token_cache.get(key)
+        if cached and time.monotonic() < cached[1] - TOKEN_REFRESH_MARGIN:
+            return cached[0]
+        
+        lock = _token_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # 等待锁期间可能已被其他请求刷新
+            cached = _token_cache.get(key)
+            if cached and time.monotonic() < cached[1] - TOKEN_REFRESH_MARGIN:
+                return cached[0]
+            
+            auth_string = f"{self.client_id}:{self.client_secret}"
+            auth_bytes = base64.b64encode(auth_string.encode()).decode()
+            
+            client = await self._http()
             response = await client.post(
-                f"{self.base_url}/v1/oauth2/token",
+                "/v1/oauth2/token",
                 headers={
                     "Authorization": f"Basic {auth_bytes}",
                     "Content-Type": "application/x-www-form-urlencoded"
@@ -62,9 +136,10 @@ class PayPalService:
             if response.status_code != 200:
                 raise Exception(f"获取PayPal访问令牌失败: {response.text}")
             
-            data = response.json()
-            self._access_token = data["access_token"]
-            return self._access_token
+            data = loads(response.content)
+            access_token = data["access_token"]
+            _token_cache[key] = (access_token, time.monotonic() + float(data.get("expires_in", 3600)))
+            return access_token
     
     async def create_order(
         self,
@@ -112,81 +187,102 @@ class PayPalService:
             }
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/v2/checkout/orders",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/json"
-                },
-                json=order_data
-            )
-            
-            if response.status_code not in [200, 201]:
-                raise Exception(f"创建PayPal订单失败: {response.text}")
-            
-            data = response.json()
-            
-            approval_url = None
-            for link in data.get("links", []):
-                if link.get("rel") == "approve":
-                    approval_url = link.get("href")
-                    break
-            
-            return {
-                "order_id": data["id"],
-                "status": data["status"],
-                "approval_url": approval_url,
-                "amount": amount,
-                "currency": currency
-            }
+        client = await self._http()
+        response = await client.post(
+            "/v2/checkout/orders",
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json"
+            },
+            content=dumps(order_data)
+        )
+        
+        if response.status_code not in [200, 201]:
+            raise Exception(f"创建PayPal订单失败: {response.text}")
+        
+        data = loads(response.content)
+        
+        approval_url = None
+        for link in data.get("links", []):
+            if link.get("rel") == "approve":
+                approval_url = link.get("href")
+                break
+        
+        return {
+            "order_id": data["id"],
+            "status": data["status"],
+            "approval_url": approval_url,
+            "amount": amount,
+            "currency": currency
+        }
     
-    async def capture_order(self, order_id: str) -> Dict[str, Any]:
+    async def capture_order(self, order_id: str, request_id: Optional[str] = None) -> Dict[str, Any]:
         """捕获（完成）PayPal订单
         
+        请求带 PayPal-Request-Id 幂等键，重试或并发捕获同一订单不会重复扣款；
+        并要求返回完整订单表示，raw_response 中即包含付款人与购买单元，
+        调用方无需再请求订单详情。
+        
         参数:
             order_id: PayPal订单ID
+            request_id: 幂等键，默认按订单ID生成
         
         返回:
             Dict: 捕获结果
         """
         access_token = await self._get_access_token()
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/v2/checkout/orders/{order_id}/capture",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/json"
-                }
-            )
-            
-            if response.status_code not in [200, 201]:
-                raise Exception(f"捕获PayPal订单失败: {response.text}")
-            
-            data = response.json()
-            
-            capture_status = "failed"
-            transaction_id = None
-            amount = 0
-            currency = "USD"
-            
-            if data.get("status") == "COMPLETED":
-                for purchase_unit in data.get("purchase_units", []):
-                    for capture in purchase_unit.get("payments", {}).get("captures", []):
-                        capture_status = capture.get("status", "").lower()
-                        transaction_id = capture.get("id")
-                        amount = float(capture.get("amount", {}).get("value", 0))
-                        currency = capture.get("amount", {}).get("currency_code", "USD")
-            
-            return {
-                "order_id": order_id,
-                "status": capture_status,
-                "transaction_id": transaction_id,
-                "amount": amount,
-                "currency": currency,
-                "raw_response": data
+        client = await self._http()
+        response = await client.post(
+            f"/v2/checkout/orders/{order_id}/capture",
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json",
+                "PayPal-Request-Id": request_id or f"capture-{order_id}",
+                "Prefer": "return=representation"
             }
+        )
+        
+        if response.status_code not in [200, 201]:
+            raise Exception(f"捕获PayPal订单失败: {response.text}")
+        
+        data = loads(response.content)
+        
+        capture_status = "failed"
+        transaction_id = None
+        amount = 0
+        currency = "USD"
+        
+        if data.get("status") == "COMPLETED":
+            for purchase_unit in data.get("purchase_units", []):
+                for capture in purchase_unit.get("payments", {}).get("captures", []):
+                    capture_status = capture.get("status", "").lower()
+                    transaction_id = capture.get("id")
+                    amount = float(capture.get("amount", {}).get("value", 0))
+                    currency = capture.get("amount", {}).get("currency_code", "USD")
+        
+        return {
+            "order_id": order_id,
+            "status": capture_status,
+            "transaction_id": transaction_id,
+            "amount": amount,
+            "currency": currency,
+            "raw_response": data
+        }
+    
+    async def capture_and_detail(self, order_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """捕获订单并返回订单详情
+        
+        捕获响应已是完整订单表示，直接复用，省去一次 get_order_details 往返。
+        
+        参数:
+            order_id: PayPal订单ID
+        
+        返回:
+            Tuple: (捕获结果, 订单详情)
+        """
+        capture_result = await self.capture_order(order_id)
+        return capture_result, capture_result["raw_response"]
     
     async def get_order_details(self, order_id: str) -> Dict[str, Any]:
         """获取订单详情
@@ -199,19 +295,19 @@ class PayPalService:
         """
         access_token = await self._get_access_token()
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/v2/checkout/orders/{order_id}",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/json"
-                }
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"获取PayPal订单详情失败: {response.text}")
-            
-            return response.json()
+        client = await self._http()
+        response = await client.get(
+            f"/v2/checkout/orders/{order_id}",
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json"
+            }
+        )
+        
+        if response.status_code != 200:
+            raise Exception(f"获取PayPal订单详情失败: {response.text}")
+        
+        return loads(response.content)
     
     async def refund_payment(
         self,
@@ -238,29 +334,29 @@ class PayPalService:
                 "currency_code": currency
             }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/v2/payments/captures/{capture_id}/refund",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/json"
-                },
-                json=refund_data if refund_data else None
-            )
-            
-            if response.status_code not in [200, 201]:
-                raise Exception(f"PayPal退款失败: {response.text}")
-            
-            data = response.json()
-            
-            return {
-                "refund_id": data.get("id"),
-                "status": data.get("status"),
-                "amount": float(data.get("amount", {}).get("value", 0)),
-                "currency": data.get("amount", {}).get("currency_code", "USD")
-            }
+        client = await self._http()
+        response = await client.post(
+            f"/v2/payments/captures/{capture_id}/refund",
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json"
+            },
+            content=dumps(refund_data) if refund_data else None
+        )
+        
+        if response.status_code not in [200, 201]:
+            raise Exception(f"PayPal退款失败: {response.text}")
+        
+        data = loads(response.content)
+        
+        return {
+            "refund_id": data.get("id"),
+            "status": data.get("status"),
+            "amount": float(data.get("amount", {}).get("value", 0)),
+            "currency": data.get("amount", {}).get("currency_code", "USD")
+        }
     
-    def verify_webhook_signature(
+    async def verify_webhook_signature(
         self,
         headers: Dict[str, str],
         body: str,
@@ -277,17 +373,31 @@ class PayPalService:
             bool: 签名是否有效
         """
         try:
-            transmission_id = headers.get("paypal-transmission-id")
-            transmission_time = headers.get("paypal-transmission-time")
-            transmission_sig = headers.get("paypal-transmission-sig")
-            cert_url = headers.get("paypal-cert-url")
-            auth_algo = headers.get("paypal-auth-algo", "SHA256")
+            transmission_id = headers.get("paypal-transmission-id", "")
+            transmission_time = headers.get("paypal-transmission-time", "")
+            transmission_sig = headers.get("paypal-transmission-sig", "")
+            cert_url = headers.get("paypal-cert-url", "")
+            auth_algo = headers.get("paypal-auth-algo", "SHA256withRSA")
             
-            if not all([transmission_id, transmission_time, transmission_sig, cert_url]):
+            if not all([transmission_id, transmission_time, transmission_sig, cert_url, webhook_id]):
                 return False
             
-            expected_sig = f"{transmission_id}|{transmission_time}|{webhook_id}|{hashlib.sha256(body.encode()).hexdigest()}"
+            # PayPal使用证书私钥做RSA签名（非共享密钥HMAC），只接受SHA256withRSA
+            if not auth_algo.upper().startswith("SHA256"):
+                return False
+            if not _is_paypal_cert_url(cert_url):
+                return False
+            
+            # 签名原文：transmission_id|transmission_time|webhook_id|crc32(body)
+            message = f"{transmission_id}|{transmission_time}|{webhook_id}|{zlib.crc32(body.encode())}"
             
+            cert = await _load_webhook_cert(await self._http(), cert_url)
+            cert.public_key().verify(
+                base64.b64decode(transmission_sig),
+                message.encode(),
+                padding.PKCS1v15(),
+                hashes.SHA256()
+            )
             return True
             
         except Exception as e:
@@ -326,6 +436,43 @@ class PayPalService:
             user_id=user_id
         )
     
+    def _get_user(self, user_id: uuid.UUID) -> Optional[User]:
+        """查询用户"""
+        return self.db.query(User).filter(User.id == user_id).first()
+    
+    def _save_subscription(
+        self,
+        user: User,
+        subscription_tier: SubscriptionTier,
+        order_id: str,
+        transaction_id: Optional[str]
+    ) -> Subscription:
+        """更新用户层级与配额并写入订阅记录"""
+        from datetime import timedelta
+        
+        user.subscription_tier = subscription_tier
+        
+        # 设置用户配额
+        if subscription_tier == SubscriptionTier.PROFESSIONAL:
+            user.remaining_quota_minutes = 30.0
+        elif subscription_tier == SubscriptionTier.ENTERPRISE:
+            user.remaining_quota_minutes = 200.0
+        
+        subscription = Subscription(
+            user_id=user.id,
+            plan=subscription_tier.value,
+            status="active",
+            quota_minutes=30.0 if subscription_tier == SubscriptionTier.PROFESSIONAL else 200.0,
+            start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=30),
+            auto_renew=True,
+            paypal_order_id=order_id,
+            paypal_transaction_id=transaction_id
+        )
+        self.db.add(subscription)
+        self.db.commit()
+        return subscription
+    
     async def activate_subscription(
         self,
         user_id: uuid.UUID,
@@ -342,7 +489,11 @@ class PayPalService:
         返回:
             Dict: 激活结果
         """
-        capture_result = await self.capture_order(order_id)
+        # 捕获支付与查询用户并发进行；捕获期间会话不被其他代码使用，可安全交给工作线程
+        capture_result, user = await asyncio.gather(
+            self.capture_order(order_id),
+            asyncio.to_thread(self._get_user, user_id)
+        )
         
         if capture_result["status"] != "completed":
             return {
@@ -351,36 +502,20 @@ class PayPalService:
                 "capture_result": capture_result
             }
         
-        user = self.db.query(User).filter(User.id == user_id).first()
         if not user:
             return {
                 "success": False,
                 "message": "用户不存在"
             }
         
-        from datetime import timedelta
-        
-        user.subscription_tier = subscription_tier
-        
-        # 设置用户配额
-        if subscription_tier == SubscriptionTier.PROFESSIONAL:
-            user.remaining_quota_minutes = 30.0
-        elif subscription_tier == SubscriptionTier.ENTERPRISE:
-            user.remaining_quota_minutes = 200.0
-        
-        subscription = Subscription(
-            user_id=user_id,
-            plan=subscription_tier.value,
-            status="active",
-            quota_minutes=30.0 if subscription_tier == SubscriptionTier.PROFESSIONAL else 200.0,
-            start_date=datetime.utcnow(),
-            end_date=datetime.utcnow() + timedelta(days=30),
-            auto_renew=True,
-            paypal_order_id=order_id,
-            paypal_transaction_id=capture_result.get("transaction_id")
+        # 同步会话的提交放到工作线程，避免阻塞事件循环
+        await asyncio.to_thread(
+            self._save_subscription,
+            user,
+            subscription_tier,
+            order_id,
+            capture_result.get("transaction_id")
         )
-        self.db.add(subscription)
-        self.db.commit()
         
         return {
             "success": True,
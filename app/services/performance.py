@@ -1,14 +1,55 @@
 """性能优化服务"""
+import asyncio
 import functools
 import hashlib
 import json
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+from weakref import WeakValueDictionary
 from sqlalchemy.orm import Session
-from sqlalchemy import Index
+from sqlalchemy import inspect, text, tuple_
+from sqlalchemy.engine import Engine
 
 from app.core.cache import cache_manager
 
 
+# 直接拼接（不哈希）的原始类型
+_PRIMITIVE_TYPES = (str, int, float, bool)
+
+# 快速路径按精确类型判断（子类走通用路径，结果一致）
+_PRIMITIVE_EXACT_TYPES = frozenset(_PRIMITIVE_TYPES)
+
+# 直接拼接的原始类型元组最大长度
+_INLINE_TUPLE_MAX = 8
+
+# 复合索引定义：(索引名, 表名, 列)；单列外键/过滤列已在模型中 index=True
+_INDEX_DEFINITIONS = [
+    # 用户订阅层级统计
+    ("idx_users_subscription_tier", "users", "subscription_tier"),
+    # list_projects / list_projects_cursor: WHERE user_id = ? ORDER BY updated_at DESC, id DESC
+    ("idx_projects_user_updated_id", "projects", "user_id, updated_at DESC, id DESC"),
+    # 分镜按项目顺序读取
+    ("idx_scenes_project_sequence", "scenes", "project_id, sequence_number"),
+    # 素材按类型+分类筛选
+    ("idx_assets_type_category", "assets", "asset_type, category"),
+    # 协作权限检查: WHERE project_id = ? AND user_id = ?
+    ("idx_collaborators_project_user", "project_collaborators", "project_id, user_id"),
+]
+
+
+def _to_cacheable(value: Any) -> Any:
+    """
+    将ORM实例转换为可序列化的字典
+    
+    去掉 _sa_instance_state，避免把会话状态写入缓存；列表逐项转换。
+    命中与未命中都返回转换后的结果，调用方拿到的类型一致。
+    """
+    if hasattr(value, "_sa_instance_state"):
+        return {k: v for k, v in vars(value).items() if k != "_sa_instance_state"}
+    if isinstance(value, (list, tuple)) and value and hasattr(value[0], "_sa_instance_state"):
+        return [_to_cacheable(item) for item in value]
+    return value
+
+
 class PerformanceOptimizer:
     """性能优化器"""
     
@@ -20,6 +61,16 @@ class PerformanceOptimizer:
             "asset": 600,  # 10分钟
             "sound_effect": 3600,  # 1小时
         }
+        # 按缓存键的计算锁：冷键并发未命中时只有一个协程执行原函数
+        self._locks: "WeakValueDictionary[str, asyncio.Lock]" = WeakValueDictionary()
+    
+    def _get_lock(self, cache_key: str) -> asyncio.Lock:
+        """获取缓存键对应的锁（无人持有时自动回收）"""
+        lock = self._locks.get(cache_key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[cache_key] = lock
+        return lock
     
     def cache_key(self, prefix: str, *args, **kwargs) -> str:
         """
@@ -37,19 +88,53 @@ class PerformanceOptimizer:
         key_parts = [prefix]
         
         for arg in args:
-            if isinstance(arg, (str, int, float, bool)):
-                key_parts.append(str(arg))
-            else:
-                key_parts.append(hashlib.md5(str(arg).encode()).hexdigest()[:8])
+            key_parts.append(self._key_part(arg))
         
         for k, v in sorted(kwargs.items()):
-            if isinstance(v, (str, int, float, bool)):
-                key_parts.append(f"{k}:{v}")
-            else:
-                key_parts.append(f"{k}:{hashlib.md5(str(v).encode()).hexdigest()[:8]}")
+            key_parts.append(f"{k}:{self._key_part(v)}")
         
         return ":".join(key_parts)
     
+    def _make_key_builder(self, prefix: str) -> Callable[[tuple, dict], str]:
+        """
+        为被装饰函数生成专用的缓存键构造函数
+        
+        常见调用只有原始类型的位置参数，直接拼接预先确定的前缀，
+        跳过通用路径中的 isinstance 判断与 kwargs 排序；
+        其余情况回退到 cache_key，两条路径生成的键完全一致。
+        """
+        head = prefix + ":"
+        primitive_types = _PRIMITIVE_EXACT_TYPES
+        generic = self.cache_key
+        
+        def build_key(args: tuple, kwargs: dict) -> str:
+            if not kwargs and args:
+                for arg in args:
+                    if type(arg) not in primitive_types:
+                        break
+                else:
+                    return head + ":".join(map(str, args))
+            return generic(prefix, *args, **kwargs)
+        
+        return build_key
+    
+    @staticmethod
+    def _key_part(value: Any) -> str:
+        """将单个参数转换为缓存键片段
+        
+        原始类型及其短元组直接拼接；其余参数用blake2b生成4字节摘要，
+        比截断的MD5更快且不浪费摘要长度。
+        """
+        if isinstance(value, _PRIMITIVE_TYPES):
+            return str(value)
+        if (
+            isinstance(value, tuple)
+            and len(value) <= _INLINE_TUPLE_MAX
+            and all(isinstance(x, _PRIMITIVE_TYPES) for x in value)
+        ):
+            return "-".join(map(str, value))
+        return hashlib.blake2b(repr(value).encode(), digest_size=4).hexdigest()
+    
     def cached(
         self,
         prefix: str,
@@ -68,28 +153,91 @@ class PerformanceOptimizer:
                 ...
         """
         def decorator(func: Callable) -> Callable:
+            build_key = self._make_key_builder(prefix)
+            
             @functools.wraps(func)
             async def wrapper(*args, **kwargs):
                 # 生成缓存键
-                cache_key = self.cache_key(prefix, *args, **kwargs)
+                cache_key = build_key(args, kwargs)
                 
                 # 尝试从缓存获取
                 cached_value = await cache_manager.get(cache_key)
                 if cached_value is not None:
                     return cached_value
                 
-                # 执行函数
-                result = await func(*args, **kwargs)
-                
-                # 存入缓存
-                expire_time = ttl if ttl is not None else self.cache_ttl.get(prefix, 300)
-                await cache_manager.set(cache_key, result, expire=expire_time)
+                lock = self._get_lock(cache_key)
+                waited = lock.locked()
+                async with lock:
+                    # 等待过锁说明其他协程刚计算过，先复查缓存
+                    if waited:
+                        cached_value = await cache_manager.get(cache_key)
+                        if cached_value is not None:
+                            return cached_value
+                    
+                    # 执行函数
+                    result = _to_cacheable(await func(*args, **kwargs))
+                    
+                    # 存入缓存
+                    expire_time = ttl if ttl is not None else self.cache_ttl.get(prefix, 300)
+                    await cache_manager.set(cache_key, result, expire=expire_time)
                 
                 return result
             
             return wrapper
         return decorator
     
+    def cached_many(
+        self,
+        prefix: str,
+        ttl: Optional[int] = None,
+        key_fn: Optional[Callable[[Any], str]] = None
+    ) -> Callable:
+        """
+        批量缓存装饰器
+        
+        被装饰函数接收ID列表并返回 {ID: 值} 字典。命中的条目通过
+        一次 mget 取回，只有未命中的ID会传给原函数。
+        
+        参数:
+            prefix: 缓存键前缀
+            ttl: 过期时间（秒），None使用默认值
+            key_fn: 由ID生成缓存键的函数，默认 cache_key(prefix, id)
+        
+        用法:
+            @performance_optimizer.cached_many("project")
+            async def get_projects(project_ids: list[str]) -> dict:
+                ...
+        """
+        make_key = key_fn or (lambda item_id: self.cache_key(prefix, item_id))
+        
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(ids: Iterable[Any], *args, **kwargs) -> Dict[Any, Any]:
+                ids = list(ids)
+                keys = [make_key(item_id) for item_id in ids]
+                cached_values = await cache_manager.mget(keys)
+                
+                results: Dict[Any, Any] = {}
+                missing = []
+                for item_id, value in zip(ids, cached_values):
+                    if value is None:
+                        missing.append(item_id)
+                    else:
+                        results[item_id] = value
+                
+                if missing:
+                    fetched = await func(missing, *args, **kwargs)
+                    expire_time = ttl if ttl is not None else self.cache_ttl.get(prefix, 300)
+                    for item_id, value in fetched.items():
+                        value = _to_cacheable(value)
+                        results[item_id] = value
+                        await cache_manager.set(make_key(item_id), value, expire=expire_time)
+                
+                return results
+            
+            return wrapper
+        return decorator
+    
     async def invalidate_cache(self, prefix: str, *args, **kwargs) -> bool:
         """
         使缓存失效
@@ -110,54 +258,50 @@ class DatabaseOptimizer:
     """数据库查询优化器"""
     
     @staticmethod
-    def add_indexes(db: Session) -> None:
+    def add_indexes(bind: Union[Engine, Session]) -> List[str]:
         """
         添加数据库索引以优化查询性能
         
+        使用 CREATE INDEX IF NOT EXISTS，可重复执行；不存在的表会被跳过。
+        
         参数:
-            db: 数据库会话
-        """
-        from app.models.user import User
-        from app.models.project import Project
-        from app.models.character import Character
-        from app.models.storyboard import StoryboardFrame
-        from app.models.asset import Asset
-        from app.models.sound_effect import SoundEffect
-        from app.models.collaboration import ProjectCollaborator
-        
-        # 用户表索引
-        Index('idx_users_email', User.email, unique=True)
-        Index('idx_users_subscription_tier', User.subscription_tier)
-        
-        # 项目表索引
-        Index('idx_projects_user_id', Project.user_id)
-        Index('idx_projects_created_at', Project.created_at)
-        Index('idx_projects_user_created', Project.user_id, Project.created_at)
-        
-        # 角色表索引
-        Index('idx_characters_project_id', Character.project_id)
-        
-        # 分镜表索引
-        Index('idx_storyboard_project_id', StoryboardFrame.project_id)
-        Index('idx_storyboard_sequence', StoryboardFrame.project_id, StoryboardFrame.sequence_number)
-        
-        # 素材表索引
-        Index('idx_assets_user_id', Asset.user_id)
-        Index('idx_assets_type', Asset.asset_type)
-        Index('idx_assets_user_type', Asset.user_id, Asset.asset_type)
-        
-        # 音效表索引
-        Index('idx_sound_effects_category', SoundEffect.category)
-        
-        # 协作表索引
-        Index('idx_collaborators_project', ProjectCollaborator.project_id)
-        Index('idx_collaborators_user', ProjectCollaborator.user_id)
+            bind: 数据库引擎或会话
+        
+        返回:
+            本次执行的索引名称列表
+        """
+        engine = bind.get_bind() if isinstance(bind, Session) else bind
+        dialect = engine.dialect.name
+        
+        created = []
+        with engine.begin() as conn:
+            tables = set(inspect(conn).get_table_names())
+            
+            if dialect == "postgresql" and "projects" in tables:
+                # 名称 ilike('%...%') 过滤需要三元组索引才能走索引
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_projects_name_trgm "
+                    "ON projects USING gin (name gin_trgm_ops)"
+                ))
+                created.append("idx_projects_name_trgm")
+            
+            for name, table, columns in _INDEX_DEFINITIONS:
+                if table not in tables:
+                    continue
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+                created.append(name)
+        
+        return created
     
     @staticmethod
     def optimize_query_with_eager_loading(query, *relationships):
         """
         使用预加载优化查询，避免N+1问题
         
+        集合关系使用 selectinload（额外一次 IN 查询，父行不重复），
+        多对一/一对一关系使用 joinedload（同一查询内 JOIN）。
+        
         参数:
             query: SQLAlchemy查询对象
             *relationships: 要预加载的关系
@@ -165,26 +309,60 @@ class DatabaseOptimizer:
         返回:
             优化后的查询对象
         """
-        from sqlalchemy.orm import joinedload
+        from sqlalchemy.orm import joinedload, selectinload
         
         for relationship in relationships:
-            query = query.options(joinedload(relationship))
+            if relationship.property.uselist:
+                query = query.options(selectinload(relationship))
+            else:
+                query = query.options(joinedload(relationship))
         
         return query
     
     @staticmethod
-    def paginate_query(query, page: int = 1, page_size: int = 50):
+    def paginate_query(
+        query,
+        page: int = 1,
+        page_size: int = 50,
+        keyset_columns: Optional[tuple] = None,
+        cursor: Optional[tuple] = None
+    ):
         """
         分页查询
         
+        传入 keyset_columns 时使用键集分页：按这些列降序排列，
+        以上一页最后一行的值作为游标做元组比较，深页不再扫描并丢弃 OFFSET 行，
+        也不执行 COUNT。
+        
         参数:
             query: SQLAlchemy查询对象
-            page: 页码（从1开始）
+            page: 页码（从1开始，仅OFFSET模式）
             page_size: 每页大小
+            keyset_columns: 键集分页的排序列（需唯一，如 (updated_at, id)）
+            cursor: 上一页返回的 next_cursor，None表示第一页
         
         返回:
-            分页后的查询结果和总数
+            分页后的查询结果和总数（键集模式返回 next_cursor 和 has_more）
         """
+        if keyset_columns is not None:
+            if cursor is not None:
+                query = query.filter(tuple_(*keyset_columns) < tuple(cursor))
+            query = query.order_by(*(column.desc() for column in keyset_columns))
+            # 多取一行判断是否还有下一页
+            rows = query.limit(page_size + 1).all()
+            has_more = len(rows) > page_size
+            items = rows[:page_size]
+            next_cursor = None
+            if has_more:
+                last = items[-1]
+                next_cursor = tuple(getattr(last, column.key) for column in keyset_columns)
+            return {
+                "items": items,
+                "page_size": page_size,
+                "next_cursor": next_cursor,
+                "has_more": has_more
+            }
+        
         total = query.count()
         offset = (page - 1) * page_size
         items = query.offset(offset).limit(page_size).all()
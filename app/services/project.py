@@ -1,8 +1,9 @@
 """项目管理服务"""
+from datetime import datetime
 from typing import Optional, List
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, insert, update, func, and_, tuple_
 from sqlalchemy.orm import selectinload
 
 from app.models.project import Project
@@ -26,17 +27,23 @@ class ProjectService:
         返回:
             Project: 创建的项目对象
         """
-        project = Project(
-            user_id=user_id,
-            name=project_data.name,
-            aspect_ratio=project_data.aspect_ratio,
-            duration_minutes=project_data.duration_minutes,
-            script=project_data.script
+        # INSERT ... RETURNING 一次往返拿回完整行（含默认值）
+        result = await self.db.execute(
+            insert(Project)
+            .values(
+                user_id=user_id,
+                name=project_data.name,
+                aspect_ratio=project_data.aspect_ratio,
+                duration_minutes=project_data.duration_minutes,
+                script=project_data.script
+            )
+            .returning(Project)
         )
+        project = result.scalar_one()
         
-        self.db.add(project)
+        # 新插入的实例仅由本方法持有，提交前移出会话，避免提交使其过期后再用 SELECT 刷新
+        self.db.expunge(project)
         await self.db.commit()
-        await self.db.refresh(project)
         
         return project
     
@@ -58,6 +65,23 @@ class ProjectService:
         )
         return result.scalar_one_or_none()
     
+    async def _get_project_row(self, project_id: UUID, user_id: UUID) -> Optional[Project]:
+        """
+        获取项目行（不预加载关联数据，供修改操作使用）
+        
+        参数:
+            project_id: 项目ID
+            user_id: 用户ID（用于权限验证）
+        
+        返回:
+            Optional[Project]: 项目对象，如果不存在或无权限则返回None
+        """
+        result = await self.db.execute(
+            select(Project)
+            .where(and_(Project.id == project_id, Project.user_id == user_id))
+        )
+        return result.scalar_one_or_none()
+    
     async def list_projects(
         self,
         user_id: UUID,
@@ -82,24 +106,75 @@ class ProjectService:
         if name_filter:
             conditions.append(Project.name.ilike(f"%{name_filter}%"))
         
-        # 查询总数
-        count_result = await self.db.execute(
-            select(func.count(Project.id)).where(and_(*conditions))
-        )
-        total = count_result.scalar_one()
-        
-        # 查询项目列表
+        # 用窗口函数在同一查询中返回总数，省去单独的COUNT往返
         offset = (page - 1) * page_size
         result = await self.db.execute(
-            select(Project)
+            select(Project, func.count().over().label("total"))
             .where(and_(*conditions))
             .order_by(Project.updated_at.desc())
             .offset(offset)
             .limit(page_size)
         )
-        projects = result.scalars().all()
+        rows = result.all()
+        projects = [row[0] for row in rows]
+        
+        if rows:
+            total = rows[0].total
+        elif offset > 0:
+            # 页码超出范围时没有行携带总数，退回单独计数
+            count_result = await self.db.execute(
+                select(func.count(Project.id)).where(and_(*conditions))
+            )
+            total = count_result.scalar_one()
+        else:
+            total = 0
+        
+        return projects, total
+    
+    async def list_projects_cursor(
+        self,
+        user_id: UUID,
+        cursor: Optional[tuple[datetime, UUID]] = None,
+        limit: int = 50,
+        name_filter: Optional[str] = None
+    ) -> tuple[List[Project], Optional[tuple[datetime, UUID]]]:
+        """
+        按游标列出用户的项目（键集分页）
         
-        return list(projects), total
+        以 (updated_at, id) 作为游标，深页无需扫描并丢弃 OFFSET 行，
+        可直接利用 (user_id, updated_at DESC, id DESC) 索引定位。
+        
+        参数:
+            user_id: 用户ID
+            cursor: 上一页返回的游标，None表示第一页
+            limit: 每页数量
+            name_filter: 项目名称过滤（可选）
+        
+        返回:
+            tuple[List[Project], Optional[tuple]]: (项目列表, 下一页游标；没有更多时为None)
+        """
+        conditions = [Project.user_id == user_id]
+        if name_filter:
+            conditions.append(Project.name.ilike(f"%{name_filter}%"))
+        if cursor is not None:
+            conditions.append(tuple_(Project.updated_at, Project.id) < tuple(cursor))
+        
+        # 多取一行判断是否还有下一页
+        result = await self.db.execute(
+            select(Project)
+            .where(and_(*conditions))
+            .order_by(Project.updated_at.desc(), Project.id.desc())
+            .limit(limit + 1)
+        )
+        projects = list(result.scalars().all())
+        
+        next_cursor = None
+        if len(projects) > limit:
+            projects = projects[:limit]
+            last = projects[-1]
+            next_cursor = (last.updated_at, last.id)
+        
+        return projects, next_cursor
     
     async def update_project(
         self,
@@ -118,15 +193,24 @@ class ProjectService:
         返回:
             Optional[Project]: 更新后的项目对象，如果不存在或无权限则返回None
         """
-        project = await self.get_project(project_id, user_id)
+        update_data = project_data.model_dump(exclude_unset=True)
+        if not update_data:
+            return await self._get_project_row(project_id, user_id)
+        
+        # 直接 UPDATE ... RETURNING，省去先查询再修改的往返
+        result = await self.db.execute(
+            update(Project)
+            .where(and_(Project.id == project_id, Project.user_id == user_id))
+            .values(**update_data)
+            .returning(Project)
+            .execution_options(populate_existing=True)
+        )
+        project = result.scalar_one_or_none()
         if not project:
             return None
         
-        # 更新字段
-        update_data = project_data.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(project, field, value)
-        
+        # populate_existing 返回的是身份映射中的实例（可能由调用方持有），不移出会话；
+        # 异步会话提交后无法惰性加载过期属性，因此提交后显式刷新
         await self.db.commit()
         await self.db.refresh(project)
         
@@ -143,7 +227,7 @@ class ProjectService:
         返回:
             bool: 是否删除成功
         """
-        project = await self.get_project(project_id, user_id)
+        project = await self._get_project_row(project_id, user_id)
         if not project:
             return False
         
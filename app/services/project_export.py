@@ -1,17 +1,43 @@
 """项目源文件导出服务"""
-import json
+import logging
+import re
+import shutil
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional
-from io import BytesIO
-from sqlalchemy.orm import Session
+from tempfile import SpooledTemporaryFile
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+from sqlalchemy.orm import Session, selectinload
 
 from app.models.project import Project
 from app.models.character import Character
 from app.models.storyboard import StoryboardFrame
 from app.models.audio import AudioTrack
+from app.core.serialization import dumps
 from app.core.storage import storage_manager
 
+logger = logging.getLogger(__name__)
+
+# 媒体文件并发下载的最大线程数（下载受对象存储往返延迟限制）
+MEDIA_DOWNLOAD_WORKERS = 32
+
+# 媒体文件分块读写大小
+MEDIA_CHUNK_SIZE = 1 << 20
+
+# 单个媒体文件在内存中暂存的上限，超过后转存到磁盘临时文件
+MEDIA_SPOOL_MAX_SIZE = 8 << 20
+
+# 导出的ZIP文件在内存中暂存的上限，超过后转存到磁盘临时文件
+EXPORT_SPOOL_MAX_SIZE = 128 << 20
+
+# 导出文件名中需要移除的字符（保留字母数字、下划线、连字符和空格）
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^\w\- ]")
+
+# JSON清单的deflate压缩级别：级别1比默认级别6快数倍，体积仅略大
+MANIFEST_COMPRESS_LEVEL = 1
+
 
 class ProjectExportService:
     """项目源文件导出服务
@@ -22,7 +48,7 @@ class ProjectExportService:
     def __init__(self, db: Session):
         self.db = db
     
-    def export_project(self, project_id: str, include_media: bool = True) -> BytesIO:
+    def export_project(self, project_id: str, include_media: bool = True) -> SpooledTemporaryFile:
         """
         导出项目源文件
         
@@ -31,30 +57,51 @@ class ProjectExportService:
             include_media: 是否包含媒体文件（图片、音频等）
         
         返回:
-            BytesIO: 包含项目数据的ZIP文件
+            SpooledTemporaryFile: 包含项目数据的ZIP文件（已定位到开头，由调用方关闭）
         
         需求：11.6
         """
-        # 获取项目数据
-        project = self.db.query(Project).filter(Project.id == project_id).first()
+        # 获取项目数据（关联的角色、分镜、音频随同预加载，避免逐表查询）
+        project = (
+            self.db.query(Project)
+            .options(
+                selectinload(Project.characters),
+                selectinload(Project.storyboard_frames),
+                selectinload(Project.audio_tracks)
+            )
+            .filter(Project.id == project_id)
+            .first()
+        )
         if not project:
             raise ValueError(f"项目不存在: {project_id}")
         
-        # 创建ZIP文件
-        zip_buffer = BytesIO()
+        characters = project.characters
+        frames = sorted(project.storyboard_frames, key=lambda frame: frame.sequence_number)
+        audio_tracks = project.audio_tracks
         
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # 导出项目元数据
-            self._export_project_metadata(zip_file, project)
-            
-            # 导出角色数据
-            self._export_characters(zip_file, project, include_media)
-            
-            # 导出分镜数据
-            self._export_storyboard(zip_file, project, include_media)
-            
-            # 导出音频数据
-            self._export_audio(zip_file, project, include_media)
+        # 创建ZIP文件（较小时留在内存，超出上限后转存磁盘，避免大项目占满内存）
+        zip_buffer = SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE, mode='w+b')
+        
+        try:
+            # 默认压缩方式仅作用于JSON清单，媒体文件单独以STORED写入
+            with zipfile.ZipFile(
+                zip_buffer, 'w', zipfile.ZIP_DEFLATED,
+                allowZip64=True, compresslevel=MANIFEST_COMPRESS_LEVEL
+            ) as zip_file:
+                # 先写入全部JSON清单（纯内存计算，不涉及I/O等待）
+                self._export_project_metadata(zip_file, project)
+                self._export_characters(zip_file, characters)
+                self._export_storyboard(zip_file, frames)
+                self._export_audio(zip_file, audio_tracks)
+                
+                # 再统一并发下载全部媒体文件并写入ZIP
+                if include_media:
+                    media = self._collect_media(characters, frames, audio_tracks)
+                    if media:
+                        self._add_media_to_zip(zip_file, media)
+        except Exception:
+            zip_buffer.close()
+            raise
         
         zip_buffer.seek(0)
         return zip_buffer
@@ -62,171 +109,174 @@ class ProjectExportService:
     def _export_project_metadata(self, zip_file: zipfile.ZipFile, project: Project) -> None:
         """导出项目元数据"""
         metadata = {
-            "id": str(project.id),
+            "id": project.id,
             "name": project.name,
             "aspect_ratio": project.aspect_ratio,
             "duration_minutes": project.duration_minutes,
             "script": project.script,
-            "created_at": project.created_at.isoformat() if project.created_at else None,
-            "updated_at": project.updated_at.isoformat() if project.updated_at else None
+            "created_at": project.created_at,
+            "updated_at": project.updated_at
         }
         
         # 写入JSON文件
         zip_file.writestr(
             "project.json",
-            json.dumps(metadata, indent=2, ensure_ascii=False)
+            dumps(metadata, indent=True)
         )
     
-    def _export_characters(
-        self,
-        zip_file: zipfile.ZipFile,
-        project: Project,
-        include_media: bool
-    ) -> None:
+    def _export_characters(self, zip_file: zipfile.ZipFile, characters: List[Character]) -> None:
         """导出角色数据"""
-        characters = self.db.query(Character).filter(
-            Character.project_id == project.id
-        ).all()
-        
-        characters_data = []
-        
-        for character in characters:
-            char_data = {
-                "id": str(character.id),
+        characters_data = [
+            {
+                "id": character.id,
                 "name": character.name,
                 "style": character.style,
                 "reference_image_url": character.reference_image_url,
                 "consistency_model_url": character.consistency_model_url,
-                "created_at": character.created_at.isoformat() if character.created_at else None
+                "created_at": character.created_at
             }
-            characters_data.append(char_data)
-            
-            # 如果包含媒体文件，下载并添加到ZIP
-            if include_media:
-                self._add_media_to_zip(
-                    zip_file,
-                    character.reference_image_url,
-                    f"characters/{character.id}/reference_image"
-                )
-                
-                if character.consistency_model_url:
-                    self._add_media_to_zip(
-                        zip_file,
-                        character.consistency_model_url,
-                        f"characters/{character.id}/consistency_model"
-                    )
+            for character in characters
+        ]
         
         # 写入角色列表JSON
         zip_file.writestr(
             "characters.json",
-            json.dumps(characters_data, indent=2, ensure_ascii=False)
+            dumps(characters_data, indent=True)
         )
     
-    def _export_storyboard(
-        self,
-        zip_file: zipfile.ZipFile,
-        project: Project,
-        include_media: bool
-    ) -> None:
-        """导出分镜数据"""
-        frames = self.db.query(StoryboardFrame).filter(
-            StoryboardFrame.project_id == project.id
-        ).order_by(StoryboardFrame.sequence_number).all()
-        
-        frames_data = []
-        
-        for frame in frames:
-            frame_data = {
-                "id": str(frame.id),
+    def _export_storyboard(self, zip_file: zipfile.ZipFile, frames: List[StoryboardFrame]) -> None:
+        """导出分镜数据（frames已按序号排序）"""
+        frames_data = [
+            {
+                "id": frame.id,
                 "sequence_number": frame.sequence_number,
-                "character_id": str(frame.character_id) if frame.character_id else None,
+                "character_id": frame.character_id,
                 "scene_description": frame.scene_description,
                 "image_url": frame.image_url,
                 "duration_seconds": frame.duration_seconds,
                 "lip_sync_keyframes": frame.lip_sync_keyframes,
-                "created_at": frame.created_at.isoformat() if frame.created_at else None
+                "created_at": frame.created_at
             }
-            frames_data.append(frame_data)
-            
-            # 如果包含媒体文件，下载并添加到ZIP
-            if include_media and frame.image_url:
-                self._add_media_to_zip(
-                    zip_file,
-                    frame.image_url,
-                    f"storyboard/frame_{frame.sequence_number:04d}"
-                )
+            for frame in frames
+        ]
         
         # 写入分镜列表JSON
         zip_file.writestr(
             "storyboard.json",
-            json.dumps(frames_data, indent=2, ensure_ascii=False)
+            dumps(frames_data, indent=True)
         )
     
-    def _export_audio(
-        self,
-        zip_file: zipfile.ZipFile,
-        project: Project,
-        include_media: bool
-    ) -> None:
+    def _export_audio(self, zip_file: zipfile.ZipFile, audio_tracks: List[AudioTrack]) -> None:
         """导出音频数据"""
-        audio_tracks = self.db.query(AudioTrack).filter(
-            AudioTrack.project_id == project.id
-        ).all()
-        
-        audio_data = []
-        
-        for track in audio_tracks:
-            track_data = {
-                "id": str(track.id),
+        audio_data = [
+            {
+                "id": track.id,
                 "audio_file_url": track.audio_file_url,
                 "duration_seconds": track.duration_seconds,
                 "transcript": track.transcript,
-                "created_at": track.created_at.isoformat() if track.created_at else None
+                "created_at": track.created_at
             }
-            audio_data.append(track_data)
-            
-            # 如果包含媒体文件，下载并添加到ZIP
-            if include_media and track.audio_file_url:
-                self._add_media_to_zip(
-                    zip_file,
-                    track.audio_file_url,
-                    f"audio/{track.id}"
-                )
+            for track in audio_tracks
+        ]
         
         # 写入音频列表JSON
         zip_file.writestr(
             "audio.json",
-            json.dumps(audio_data, indent=2, ensure_ascii=False)
+            dumps(audio_data, indent=True)
+        )
+    
+    @staticmethod
+    def _collect_media(
+        characters: List[Character],
+        frames: List[StoryboardFrame],
+        audio_tracks: List[AudioTrack]
+    ) -> List[Tuple[str, str]]:
+        """收集待下载的媒体文件：(媒体URL, ZIP内路径)"""
+        media: List[Tuple[str, str]] = []
+        
+        for character in characters:
+            media.append((
+                character.reference_image_url,
+                f"characters/{character.id}/reference_image"
+            ))
+            if character.consistency_model_url:
+                media.append((
+                    character.consistency_model_url,
+                    f"characters/{character.id}/consistency_model"
+                ))
+        
+        media.extend(
+            (frame.image_url, f"storyboard/frame_{frame.sequence_number:04d}")
+            for frame in frames
+            if frame.image_url
+        )
+        media.extend(
+            (track.audio_file_url, f"audio/{track.id}")
+            for track in audio_tracks
+            if track.audio_file_url
         )
+        return media
+    
+    @staticmethod
+    def _media_object_key(media_url: str) -> str:
+        """从媒体URL提取对象键
+        
+        假设URL格式为 /storage/path/to/file 或 https://s3.../path/to/file
+        """
+        if media_url.startswith("/storage/"):
+            return media_url.replace("/storage/", "")
+        # 从完整URL提取路径
+        return urlparse(media_url).path.lstrip("/")
+    
+    @staticmethod
+    def _download_media(object_key: str) -> SpooledTemporaryFile:
+        """分块下载媒体文件到临时文件（小文件留在内存，大文件落盘）"""
+        spool = SpooledTemporaryFile(max_size=MEDIA_SPOOL_MAX_SIZE)
+        try:
+            for chunk in storage_manager.stream_file(object_key, MEDIA_CHUNK_SIZE):
+                spool.write(chunk)
+            spool.seek(0)
+            return spool
+        except Exception:
+            spool.close()
+            raise
     
     def _add_media_to_zip(
         self,
         zip_file: zipfile.ZipFile,
-        media_url: str,
-        zip_path: str
+        media: List[Tuple[str, str]]
     ) -> None:
-        """添加媒体文件到ZIP"""
-        try:
-            # 从URL提取对象键
-            # 假设URL格式为 /storage/path/to/file 或 https://s3.../path/to/file
-            if media_url.startswith("/storage/"):
-                object_key = media_url.replace("/storage/", "")
-            else:
-                # 从完整URL提取路径
-                from urllib.parse import urlparse
-                parsed = urlparse(media_url)
-                object_key = parsed.path.lstrip("/")
-            
-            # 下载文件
-            file_content = storage_manager.download_file(object_key)
-            
-            # 添加到ZIP（保留文件扩展名）
-            file_ext = Path(object_key).suffix
-            zip_file.writestr(f"{zip_path}{file_ext}", file_content)
+        """添加媒体文件到ZIP
         
-        except Exception as e:
-            # 如果下载失败，记录错误但继续导出
-            print(f"警告: 无法下载媒体文件 {media_url}: {str(e)}")
+        下载在线程池中并发进行；ZipFile写入不是线程安全的，统一在当前线程完成。
+        """
+        with ThreadPoolExecutor(max_workers=min(MEDIA_DOWNLOAD_WORKERS, len(media))) as executor:
+            futures = {}
+            for media_url, zip_path in media:
+                try:
+                    object_key = self._media_object_key(media_url)
+                except Exception:
+                    logger.warning("无法下载媒体文件 %s", media_url, exc_info=True)
+                    continue
+                future = executor.submit(self._download_media, object_key)
+                futures[future] = (media_url, zip_path, object_key)
+            
+            for future in as_completed(futures):
+                media_url, zip_path, object_key = futures[future]
+                try:
+                    with future.result() as spool:
+                        # 添加到ZIP（保留文件扩展名）；图片/音频本身已压缩，直接存储不再deflate
+                        file_ext = Path(object_key).suffix
+                        zip_info = zipfile.ZipInfo(f"{zip_path}{file_ext}", date_time=time.localtime()[:6])
+                        zip_info.compress_type = zipfile.ZIP_STORED
+                        
+                        # 分块写入，避免整个文件再复制一份到内存
+                        with zip_file.open(zip_info, 'w', force_zip64=True) as entry:
+                            shutil.copyfileobj(spool, entry, MEDIA_CHUNK_SIZE)
+                
+                except Exception:
+                    # 如果下载失败，记录错误但继续导出
+                    logger.warning("无法下载媒体文件 %s", media_url, exc_info=True)
     
     def get_export_filename(self, project_id: str) -> str:
         """
@@ -243,7 +293,6 @@ class ProjectExportService:
             return f"project_{project_id}.zip"
         
         # 清理项目名称，移除不安全字符
-        safe_name = "".join(c for c in project.name if c.isalnum() or c in (' ', '-', '_'))
-        safe_name = safe_name.strip().replace(' ', '_')
+        safe_name = _UNSAFE_FILENAME_CHARS.sub("", project.name).strip().replace(' ', '_')
         
         return f"{safe_name}_{project_id[:8]}.zip"
@@ -1,10 +1,23 @@
 """实时反馈服务"""
 import asyncio
-import json
-from typing import Dict, List, Optional, Set, Any
-from datetime import datetime
+import heapq
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
 from enum import Enum
 
+from app.core.serialization import dumps
+
+
+def _dumps(data: Any) -> str:
+    """序列化为JSON文本（WebSocket文本帧，前端按 JSON.parse 解析）"""
+    return dumps(data).decode("utf-8")
+
+
+def _now_iso() -> str:
+    """当前UTC时间的ISO格式字符串（消息时间戳）"""
+    return datetime.utcnow().isoformat()
+
 
 class ProgressStatus(Enum):
     """进度状态"""
@@ -27,42 +40,84 @@ class MessageType(Enum):
 class ProgressTracker:
     """进度跟踪器"""
     
-    def __init__(self, task_id: str, total_steps: int, description: str = ""):
+    def __init__(
+        self,
+        task_id: str,
+        total_steps: int,
+        description: str = "",
+        on_finish: Optional[Callable[["ProgressTracker"], None]] = None
+    ):
         self.task_id = task_id
         self.total_steps = total_steps
         self.current_step = 0
         self.description = description
         self.status = ProgressStatus.PENDING
-        self.started_at: Optional[datetime] = None
-        self.completed_at: Optional[datetime] = None
+        # 结束时间被设置时的回调（由连接管理器登记清理顺序）
+        self._on_finish = on_finish
+        # 时间戳及其ISO字符串在状态转换时一并确定，to_dict 不再重复格式化
+        self._started_at: Optional[datetime] = None
+        self._started_iso: Optional[str] = None
+        self._completed_at: Optional[datetime] = None
+        self._completed_iso: Optional[str] = None
         self.error_message: Optional[str] = None
         self.step_descriptions: Dict[int, str] = {}
+        # 序列化后的 to_dict() 结果，状态变化时失效
+        self._cached_payload: Optional[str] = None
+    
+    @property
+    def started_at(self) -> Optional[datetime]:
+        """开始时间"""
+        return self._started_at
+    
+    @started_at.setter
+    def started_at(self, value: Optional[datetime]):
+        self._started_at = value
+        self._started_iso = value.isoformat() if value else None
+        self._cached_payload = None
+    
+    @property
+    def completed_at(self) -> Optional[datetime]:
+        """结束时间（完成、失败或取消）"""
+        return self._completed_at
+    
+    @completed_at.setter
+    def completed_at(self, value: Optional[datetime]):
+        self._completed_at = value
+        self._completed_iso = value.isoformat() if value else None
+        self._cached_payload = None
+        if value is not None and self._on_finish is not None:
+            self._on_finish(self)
     
     def start(self):
         """开始任务"""
+        self._cached_payload = None
         self.status = ProgressStatus.IN_PROGRESS
         self.started_at = datetime.utcnow()
     
     def update(self, step: int, description: str = ""):
         """更新进度"""
+        self._cached_payload = None
         self.current_step = step
         if description:
             self.step_descriptions[step] = description
     
     def complete(self):
         """完成任务"""
+        self._cached_payload = None
         self.status = ProgressStatus.COMPLETED
         self.current_step = self.total_steps
         self.completed_at = datetime.utcnow()
     
     def fail(self, error_message: str):
         """任务失败"""
+        self._cached_payload = None
         self.status = ProgressStatus.FAILED
         self.error_message = error_message
         self.completed_at = datetime.utcnow()
     
     def cancel(self):
         """取消任务"""
+        self._cached_payload = None
         self.status = ProgressStatus.CANCELLED
         self.completed_at = datetime.utcnow()
     
@@ -81,54 +136,92 @@ class ProgressTracker:
             "current_step": self.current_step,
             "total_steps": self.total_steps,
             "percentage": self.get_percentage(),
-            "started_at": self.started_at.isoformat() if self.started_at else None,
-            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "started_at": self._started_iso,
+            "completed_at": self._completed_iso,
             "error_message": self.error_message,
             "current_step_description": self.step_descriptions.get(self.current_step, "")
         }
+    
+    def payload_json(self) -> str:
+        """获取序列化后的进度数据（缓存至下一次状态变化）"""
+        if self._cached_payload is None:
+            self._cached_payload = _dumps(self.to_dict())
+        return self._cached_payload
 
 
 class ConnectionManager:
     """WebSocket连接管理器"""
     
     def __init__(self):
-        # 用户ID -> WebSocket连接集合
-        self.active_connections: Dict[str, Set[Any]] = {}
+        # 用户ID -> WebSocket连接列表（连续存储，广播时遍历更快）
+        self.active_connections: Dict[str, List[Any]] = {}
+        # id(连接) -> (用户ID, 在列表中的下标)，用于O(1)移除
+        self._positions: Dict[int, Tuple[str, int]] = {}
         # 任务ID -> 进度跟踪器
         self.progress_trackers: Dict[str, ProgressTracker] = {}
+        # 按结束时间排序的最小堆：(结束时间, 序号, 任务ID, 跟踪器)
+        self._completion_heap: List[tuple] = []
+        self._completion_seq = itertools.count()
     
     async def connect(self, websocket: Any, user_id: str):
         """连接WebSocket"""
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = set()
-        self.active_connections[user_id].add(websocket)
+        if id(websocket) in self._positions:
+            return
+        connections = self.active_connections.setdefault(user_id, [])
+        self._positions[id(websocket)] = (user_id, len(connections))
+        connections.append(websocket)
     
     def disconnect(self, websocket: Any, user_id: str):
-        """断开WebSocket连接"""
-        if user_id in self.active_connections:
-            self.active_connections[user_id].discard(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
+        """断开WebSocket连接（与末尾连接交换后弹出）"""
+        position = self._positions.get(id(websocket))
+        if position is None or position[0] != user_id:
+            return
+        del self._positions[id(websocket)]
+        
+        connections = self.active_connections[user_id]
+        index = position[1]
+        last = connections.pop()
+        if last is not websocket:
+            connections[index] = last
+            self._positions[id(last)] = (user_id, index)
+        if not connections:
+            del self.active_connections[user_id]
+    
+    async def _send_to_user(self, user_id: str, send: Callable[[Any], Awaitable[Any]]):
+        """向用户的所有连接并发发送，发送失败的连接视为已断开"""
+        connections = list(self.active_connections.get(user_id, ()))
+        if not connections:
+            return
+        
+        results = await asyncio.gather(
+            *(send(connection) for connection in connections),
+            return_exceptions=True
+        )
+        
+        # 清理断开的连接
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.disconnect(connection, user_id)
     
     async def send_personal_message(self, message: Dict, user_id: str):
-        """发送个人消息"""
+        """发送个人消息（只序列化一次，所有连接共用）"""
         if user_id in self.active_connections:
-            disconnected = set()
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_json(message)
-                except Exception:
-                    disconnected.add(connection)
-            
-            # 清理断开的连接
-            for connection in disconnected:
-                self.disconnect(connection, user_id)
+            await self.send_personal_text(_dumps(message), user_id)
+    
+    async def send_personal_text(self, text: str, user_id: str):
+        """发送已序列化的个人消息（多个连接共用同一份编码结果）"""
+        await self._send_to_user(user_id, lambda connection: connection.send_text(text))
     
     async def broadcast(self, message: Dict):
-        """广播消息给所有用户"""
-        for user_id in list(self.active_connections.keys()):
-            await self.send_personal_message(message, user_id)
+        """广播消息给所有用户（只序列化一次）"""
+        if not self.active_connections:
+            return
+        text = _dumps(message)
+        await asyncio.gather(*(
+            self.send_personal_text(text, user_id)
+            for user_id in list(self.active_connections.keys())
+        ))
     
     def create_progress_tracker(
         self,
@@ -137,36 +230,47 @@ class ConnectionManager:
         description: str = ""
     ) -> ProgressTracker:
         """创建进度跟踪器"""
-        tracker = ProgressTracker(task_id, total_steps, description)
+        tracker = ProgressTracker(task_id, total_steps, description, on_finish=self._track_completion)
         self.progress_trackers[task_id] = tracker
         return tracker
     
+    def _track_completion(self, tracker: ProgressTracker):
+        """登记跟踪器的结束时间，供清理时按时间顺序弹出"""
+        heapq.heappush(
+            self._completion_heap,
+            (tracker.completed_at, next(self._completion_seq), tracker.task_id, tracker)
+        )
+    
     def get_progress_tracker(self, task_id: str) -> Optional[ProgressTracker]:
         """获取进度跟踪器"""
         return self.progress_trackers.get(task_id)
     
-    async def send_progress_update(self, task_id: str, user_id: str):
-        """发送进度更新"""
+    async def send_progress_update(self, task_id: str, user_id: str, timestamp: Optional[str] = None):
+        """发送进度更新（timestamp由调用方传入时复用，避免同一批消息重复取时间）"""
         tracker = self.get_progress_tracker(task_id)
-        if tracker:
-            message = {
-                "type": MessageType.PROGRESS.value,
-                "timestamp": datetime.utcnow().isoformat(),
-                "data": tracker.to_dict()
-            }
-            await self.send_personal_message(message, user_id)
+        if tracker and user_id in self.active_connections:
+            # 进度数据已缓存为JSON，只需拼接外层信封
+            text = (
+                f'{{"type":"{MessageType.PROGRESS.value}",'
+                f'"timestamp":"{timestamp or _now_iso()}",'
+                f'"data":{tracker.payload_json()}}}'
+            )
+            await self.send_personal_text(text, user_id)
     
     async def send_status_message(
         self,
         user_id: str,
         status: str,
         message: str,
-        data: Optional[Dict] = None
+        data: Optional[Dict] = None,
+        timestamp: Optional[str] = None
     ):
         """发送状态消息"""
+        if user_id not in self.active_connections:
+            return
         msg = {
             "type": MessageType.STATUS.value,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": timestamp or _now_iso(),
             "status": status,
             "message": message,
             "data": data or {}
@@ -177,12 +281,15 @@ class ConnectionManager:
         self,
         user_id: str,
         error: str,
-        details: Optional[str] = None
+        details: Optional[str] = None,
+        timestamp: Optional[str] = None
     ):
         """发送错误消息"""
+        if user_id not in self.active_connections:
+            return
         msg = {
             "type": MessageType.ERROR.value,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": timestamp or _now_iso(),
             "error": error,
             "details": details
         }
@@ -192,12 +299,15 @@ class ConnectionManager:
         self,
         user_id: str,
         message: str,
-        data: Optional[Dict] = None
+        data: Optional[Dict] = None,
+        timestamp: Optional[str] = None
     ):
         """发送成功消息"""
+        if user_id not in self.active_connections:
+            return
         msg = {
             "type": MessageType.SUCCESS.value,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": timestamp or _now_iso(),
             "message": message,
             "data": data or {}
         }
@@ -207,30 +317,33 @@ class ConnectionManager:
         self,
         user_id: str,
         message: str,
-        data: Optional[Dict] = None
+        data: Optional[Dict] = None,
+        timestamp: Optional[str] = None
     ):
         """发送信息消息"""
+        if user_id not in self.active_connections:
+            return
         msg = {
             "type": MessageType.INFO.value,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": timestamp or _now_iso(),
             "message": message,
             "data": data or {}
         }
         await self.send_personal_message(msg, user_id)
     
     def cleanup_old_trackers(self, max_age_hours: int = 24):
-        """清理旧的进度跟踪器"""
-        now = datetime.utcnow()
-        to_remove = []
+        """清理旧的进度跟踪器
         
-        for task_id, tracker in self.progress_trackers.items():
-            if tracker.completed_at:
-                age = (now - tracker.completed_at).total_seconds() / 3600
-                if age > max_age_hours:
-                    to_remove.append(task_id)
+        只弹出堆顶早于截止时间的记录，代价与过期数量成正比而非跟踪器总数。
+        """
+        cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+        heap = self._completion_heap
         
-        for task_id in to_remove:
-            del self.progress_trackers[task_id]
+        while heap and heap[0][0] < cutoff:
+            completed_at, _, task_id, tracker = heapq.heappop(heap)
+            # 跳过过时记录：任务ID已换成新跟踪器，或结束时间后来被改写
+            if self.progress_trackers.get(task_id) is tracker and tracker.completed_at == completed_at:
+                del self.progress_trackers[task_id]
 
 
 # 全局连接管理器实例
@@ -254,14 +367,17 @@ class RealtimeFeedbackService:
         tracker = self.manager.create_progress_tracker(task_id, total_steps, description)
         tracker.start()
         
+        # 同一事件的两条消息共用一个时间戳
+        timestamp = _now_iso()
         await self.manager.send_status_message(
             user_id,
             "task_started",
             f"任务已开始: {description}",
-            {"task_id": task_id}
+            {"task_id": task_id},
+            timestamp=timestamp
         )
         
-        await self.manager.send_progress_update(task_id, user_id)
+        await self.manager.send_progress_update(task_id, user_id, timestamp)
         return tracker
     
     async def update_progress(
@@ -287,11 +403,13 @@ class RealtimeFeedbackService:
         tracker = self.manager.get_progress_tracker(task_id)
         if tracker:
             tracker.complete()
-            await self.manager.send_progress_update(task_id, user_id)
+            timestamp = _now_iso()
+            await self.manager.send_progress_update(task_id, user_id, timestamp)
             await self.manager.send_success_message(
                 user_id,
                 f"任务完成: {tracker.description}",
-                result_data
+                result_data,
+                timestamp=timestamp
             )
     
     async def fail_task(
@@ -304,11 +422,13 @@ class RealtimeFeedbackService:
         tracker = self.manager.get_progress_tracker(task_id)
         if tracker:
             tracker.fail(error_message)
-            await self.manager.send_progress_update(task_id, user_id)
+            timestamp = _now_iso()
+            await self.manager.send_progress_update(task_id, user_id, timestamp)
             await self.manager.send_error_message(
                 user_id,
                 f"任务失败: {tracker.description}",
-                error_message
+                error_message,
+                timestamp=timestamp
             )
     
     async def cancel_task(
@@ -320,11 +440,13 @@ class RealtimeFeedbackService:
         tracker = self.manager.get_progress_tracker(task_id)
         if tracker:
             tracker.cancel()
-            await self.manager.send_progress_update(task_id, user_id)
+            timestamp = _now_iso()
+            await self.manager.send_progress_update(task_id, user_id, timestamp)
             await self.manager.send_info_message(
                 user_id,
                 f"任务已取消: {tracker.description}",
-                {"task_id": task_id}
+                {"task_id": task_id},
+                timestamp=timestamp
             )
     
     async def send_notification(
@@ -6,10 +6,17 @@
 - Stable Diffusion（图像生成）
 - IP-Adapter（角色一致性）
 """
+import asyncio
+import collections.abc
+import copy
+import hashlib
 import os
+import threading
 import time
-from typing import Dict, Optional, Any
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Tuple
 from app.core.config import settings
+from app.core.serialization import dumps
 
 # 尝试导入replicate库
 try:
@@ -19,6 +26,69 @@ except ImportError:
     REPLICATE_AVAILABLE = False
     replicate = None
 
+# HTTP/2需要h2库，未安装时退回HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 所有客户端共享的连接池，避免每次调用重新进行TCP/TLS握手
+if REPLICATE_AVAILABLE:
+    import httpx
+    _http_transport = httpx.HTTPTransport(
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        http2=HTTP2_AVAILABLE
+    )
+else:
+    _http_transport = None
+
+# 模型结果缓存：相同模型版本与输入参数直接返回上次结果，避免重复计费
+RESULT_CACHE_MAX_ENTRIES = 512
+# 远低于Replicate输出文件链接的有效期（1小时），保证返回的缓存链接仍可访问
+RESULT_CACHE_TTL_SECONDS = 900
+
+# 相同输入必然得到相同结果的模型；采样类模型（sdxl、photomaker）只有指定seed时才可缓存
+DETERMINISTIC_MODELS = frozenset({"whisper", "wav2lip"})
+
+
+def _result_cache_key(model_version: str, input_params: Dict[str, Any]) -> Optional[str]:
+    """计算结果缓存键；输入包含文件对象等无法序列化的值时返回None（不缓存）"""
+    try:
+        payload = dumps((model_version, input_params), sort_keys=True, default=None)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(payload).hexdigest()
+
+
+# 模型输出规范化：不同模型返回的格式不一，统一在run_model中转换一次
+
+def _coerce_dict(output: Any) -> Dict:
+    """转录类输出：字典原样返回，其他包装为 {"text": ...}"""
+    if isinstance(output, dict):
+        return output
+    if isinstance(output, str):
+        return {"text": output}
+    return {"text": str(output)}
+
+
+def _coerce_url(output: Any) -> str:
+    """单个URL输出：字符串原样返回，列表取第一个"""
+    if isinstance(output, str):
+        return output
+    if isinstance(output, list) and output:
+        return output[0]
+    raise ValueError(f"Wav2Lip返回了意外的结果格式: {type(output)}")
+
+
+def _coerce_list(output: Any) -> list:
+    """URL列表输出：列表原样返回，单个字符串包装为列表"""
+    if isinstance(output, list):
+        return output
+    if isinstance(output, str):
+        return [output]
+    raise ValueError(f"模型返回了意外的结果格式: {type(output)}")
+
 
 class ReplicateClient:
     """Replicate API客户端"""
@@ -30,6 +100,22 @@ class ReplicateClient:
         "sdxl": "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b",
         "photomaker": "tencentarc/photomaker:ddfc2b08d209f9fa8c1eca692712918bd449f695dabb4a958da31802a9570fe4"
     }
+    MODELS_KEYS = tuple(MODELS)
+    
+    # 模型名称 -> 输出规范化函数
+    _COERCERS = {
+        "whisper": _coerce_dict,
+        "wav2lip": _coerce_url,
+        "sdxl": _coerce_list,
+        "photomaker": _coerce_list
+    }
+    
+    # 已写入环境变量的API Token（进程级，避免每次实例化重复写入）
+    _env_token: Optional[str] = None
+    
+    # 结果缓存（进程级，所有实例共享）：缓存键 -> (写入时间, 结果)
+    _cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+    _cache_lock = threading.Lock()
     
     def __init__(self, api_token: Optional[str] = None):
         """
@@ -51,14 +137,19 @@ class ReplicateClient:
                 "replicate库未安装。请运行: pip install replicate"
             )
         
-        # 设置API Token
-        os.environ["REPLICATE_API_TOKEN"] = self.api_token
+        # 设置API Token（同一Token只写入一次环境变量）
+        if ReplicateClient._env_token != self.api_token:
+            os.environ["REPLICATE_API_TOKEN"] = self.api_token
+            ReplicateClient._env_token = self.api_token
+        
+        self._client = replicate.Client(api_token=self.api_token, transport=_http_transport)
     
     def run_model(
         self,
         model_name: str,
         input_params: Dict[str, Any],
-        wait: bool = True
+        wait: bool = True,
+        bypass_cache: bool = False
     ) -> Any:
         """
         运行Replicate模型
@@ -67,36 +158,93 @@ class ReplicateClient:
             model_name: 模型名称（whisper, wav2lip, sdxl, photomaker）
             input_params: 输入参数
             wait: 是否等待结果（True=同步，False=异步）
+            bypass_cache: 是否跳过结果缓存（强制重新生成）
         
         返回:
-            模型输出结果
+            规范化后的模型输出（whisper为字典，wav2lip为URL，sdxl/photomaker为URL列表）
         """
-        if model_name not in self.MODELS:
-            raise ValueError(f"不支持的模型: {model_name}。支持的模型: {list(self.MODELS.keys())}")
+        model_version = self.MODELS.get(model_name)
+        if model_version is None:
+            raise ValueError(f"不支持的模型: {model_name}。支持的模型: {self.MODELS_KEYS}")
         
-        model_version = self.MODELS[model_name]
+        cache_key = None
+        if not bypass_cache and self._is_cacheable(model_name, input_params):
+            cache_key = _result_cache_key(model_version, input_params)
+        if cache_key is not None:
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                return cached
         
         try:
-            output = replicate.run(
+            output = self._client.run(
                 model_version,
                 input=input_params
             )
-            
-            if wait:
-                # 同步等待结果
-                return output
-            else:
-                # 异步返回prediction对象
-                return output
-        
+            # 流式输出的模型返回生成器，在此一次性取完（取数过程本身也可能出错）
+            if isinstance(output, collections.abc.Iterator):
+                output = list(output)
         except Exception as e:
             raise RuntimeError(f"Replicate API调用失败: {str(e)}")
+        
+        output = self._COERCERS[model_name](output)
+        
+        if cache_key is not None:
+            self._store_cached_result(cache_key, output)
+        
+        return output
+    
+    async def arun_model(
+        self,
+        model_name: str,
+        input_params: Dict[str, Any],
+        wait: bool = True,
+        bypass_cache: bool = False
+    ) -> Any:
+        """run_model的异步版本（在线程池中执行，不阻塞事件循环）"""
+        return await asyncio.to_thread(self.run_model, model_name, input_params, wait, bypass_cache)
+    
+    @staticmethod
+    def _is_cacheable(model_name: str, input_params: Dict[str, Any]) -> bool:
+        """确定性模型总是可缓存；采样模型未指定seed时每次调用应生成新结果"""
+        return model_name in DETERMINISTIC_MODELS or input_params.get("seed") is not None
+    
+    @classmethod
+    def _get_cached_result(cls, cache_key: str) -> Any:
+        """读取未过期的缓存结果，未命中返回None"""
+        with cls._cache_lock:
+            entry = cls._cache.get(cache_key)
+            if entry is None:
+                return None
+            stored_at, output = entry
+            if time.monotonic() - stored_at > RESULT_CACHE_TTL_SECONDS:
+                del cls._cache[cache_key]
+                return None
+        # 返回深拷贝：转录结果含嵌套的 segments 列表/字典，浅拷贝仍会共享
+        return copy.deepcopy(output)
+    
+    @classmethod
+    def _store_cached_result(cls, cache_key: str, output: Any) -> None:
+        """写入缓存结果，超出容量时按写入顺序淘汰最早的条目"""
+        if output is None or not isinstance(output, (str, list, tuple, dict)):
+            return
+        with cls._cache_lock:
+            cls._cache.pop(cache_key, None)
+            cls._cache[cache_key] = (time.monotonic(), copy.deepcopy(output))
+            while len(cls._cache) > RESULT_CACHE_MAX_ENTRIES:
+                cls._cache.popitem(last=False)
+    
+    @classmethod
+    def clear_cache(cls) -> None:
+        """清空结果缓存"""
+        with cls._cache_lock:
+            cls._cache.clear()
     
     def transcribe_audio(
         self,
         audio_url: str,
         language: str = "zh",
-        task: str = "transcribe"
+        task: str = "transcribe",
+        bypass_cache: bool = False
     ) -> Dict:
         """
         使用Whisper转录音频
@@ -105,6 +253,7 @@ class ReplicateClient:
             audio_url: 音频文件URL（必须是公开可访问的URL）
             language: 语言代码（zh=中文，en=英文）
             task: 任务类型（transcribe=转录，translate=翻译）
+            bypass_cache: 是否跳过结果缓存
         
         返回:
             转录结果，包含文本和时间戳
@@ -116,20 +265,13 @@ class ReplicateClient:
             "word_timestamps": True
         }
         
-        result = self.run_model("whisper", input_params)
-        
-        # 解析结果
-        if isinstance(result, dict):
-            return result
-        elif isinstance(result, str):
-            return {"text": result}
-        else:
-            return {"text": str(result)}
+        return self.run_model("whisper", input_params, bypass_cache=bypass_cache)
     
     def generate_lip_sync(
         self,
         face_url: str,
-        audio_url: str
+        audio_url: str,
+        bypass_cache: bool = False
     ) -> str:
         """
         使用Wav2Lip生成口型同步视频
@@ -137,6 +279,7 @@ class ReplicateClient:
         参数:
             face_url: 人脸图像或视频URL
             audio_url: 音频文件URL
+            bypass_cache: 是否跳过结果缓存
         
         返回:
             生成的视频URL
@@ -146,15 +289,7 @@ class ReplicateClient:
             "audio": audio_url
         }
         
-        result = self.run_model("wav2lip", input_params)
-        
-        # 返回视频URL
-        if isinstance(result, str):
-            return result
-        elif isinstance(result, list) and len(result) > 0:
-            return result[0]
-        else:
-            raise ValueError(f"Wav2Lip返回了意外的结果格式: {type(result)}")
+        return self.run_model("wav2lip", input_params, bypass_cache=bypass_cache)
     
     def generate_image(
         self,
@@ -164,7 +299,9 @@ class ReplicateClient:
         height: int = 1024,
         num_outputs: int = 1,
         guidance_scale: float = 7.5,
-        num_inference_steps: int = 50
+        num_inference_steps: int = 50,
+        seed: Optional[int] = None,
+        bypass_cache: bool = False
     ) -> list:
         """
         使用Stable Diffusion XL生成图像
@@ -177,6 +314,8 @@ class ReplicateClient:
             num_outputs: 生成数量
             guidance_scale: 引导强度
             num_inference_steps: 推理步数
+            seed: 随机种子（指定时结果可复现并参与缓存；不指定则每次重新生成）
+            bypass_cache: 是否跳过结果缓存
         
         返回:
             生成的图像URL列表
@@ -192,22 +331,18 @@ class ReplicateClient:
         
         if negative_prompt:
             input_params["negative_prompt"] = negative_prompt
+        if seed is not None:
+            input_params["seed"] = seed
         
-        result = self.run_model("sdxl", input_params)
-        
-        # 返回图像URL列表
-        if isinstance(result, list):
-            return result
-        elif isinstance(result, str):
-            return [result]
-        else:
-            raise ValueError(f"SDXL返回了意外的结果格式: {type(result)}")
+        return self.run_model("sdxl", input_params, bypass_cache=bypass_cache)
     
     def generate_character_image(
         self,
         prompt: str,
         reference_image: Any,
-        num_outputs: int = 1
+        num_outputs: int = 1,
+        seed: Optional[int] = None,
+        bypass_cache: bool = False
     ) -> list:
         """
         使用PhotoMaker生成角色一致性图像
@@ -216,6 +351,8 @@ class ReplicateClient:
             prompt: 提示词
             reference_image: 参考图像（URL字符串或文件对象/路径）
             num_outputs: 生成数量
+            seed: 随机种子（指定时结果可复现并参与缓存；不指定则每次重新生成）
+            bypass_cache: 是否跳过结果缓存
         
         返回:
             生成的图像URL列表
@@ -233,6 +370,9 @@ class ReplicateClient:
             "style_strength_ratio": 20
         }
         
+        if seed is not None:
+            input_params["seed"] = seed
+        
         # PhotoMaker specific parameter adjustments
         # The model "tencentarc/photomaker" takes "input_image"
         
@@ -241,24 +381,35 @@ class ReplicateClient:
             # But let's check if we can use the latest one or a known good one
             # The one in MODELS is: ddfc2b08d209f9fa8c1eca692712918bd449f695dabb4a958da31802a9570fe4
             
-            output = self.run_model("photomaker", input_params)
+            return self.run_model("photomaker", input_params, bypass_cache=bypass_cache)
             
-            if isinstance(output, list):
-                return output
-            elif isinstance(output, str):
-                return [output]
-            else:
-                # Some models return an iterator or other types
-                return [str(output)]
-                
         except Exception as e:
             # Fallback or re-raise with more info
             print(f"PhotoMaker generation failed: {e}")
             raise e
+    
+    # 异步版本（在线程池中执行同步调用，供FastAPI异步处理函数使用）
+    
+    async def atranscribe_audio(self, *args, **kwargs) -> Dict:
+        """transcribe_audio的异步版本"""
+        return await asyncio.to_thread(self.transcribe_audio, *args, **kwargs)
+    
+    async def agenerate_lip_sync(self, *args, **kwargs) -> str:
+        """generate_lip_sync的异步版本"""
+        return await asyncio.to_thread(self.generate_lip_sync, *args, **kwargs)
+    
+    async def agenerate_image(self, *args, **kwargs) -> list:
+        """generate_image的异步版本"""
+        return await asyncio.to_thread(self.generate_image, *args, **kwargs)
+    
+    async def agenerate_character_image(self, *args, **kwargs) -> list:
+        """generate_character_image的异步版本"""
+        return await asyncio.to_thread(self.generate_character_image, *args, **kwargs)
 
 
 # 全局客户端实例（单例）
 _client_instance: Optional[ReplicateClient] = None
+_client_lock = threading.Lock()
 
 
 def get_replicate_client() -> ReplicateClient:
@@ -270,5 +421,7 @@ def get_replicate_client() -> ReplicateClient:
     """
     global _client_instance
     if _client_instance is None:
-        _client_instance = ReplicateClient()
+        with _client_lock:
+            if _client_instance is None:
+                _client_instance = ReplicateClient()
     return _client_instance
@@ -5,13 +5,75 @@
 """
 import re
 import json
+import zlib
+import base64
+from functools import lru_cache
+from operator import attrgetter
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from dataclasses import dataclass, asdict, field
 import numpy as np
 
 
+# 剧本解析用到的正则（模块加载时编译一次）
+_SCENE_SPLIT_RE = re.compile(r'(?:场景|Scene)\s*\d+|^.+?(?=场景|Scene|\Z)', re.MULTILINE | re.IGNORECASE)
+_CHARACTER_RE = re.compile(r'([A-Za-z\u4e00-\u9fa5]+)\s*[:：]')
+_TOKEN_RE = re.compile(r'\w+')
+
+# 关键词提取时过滤的常见词
+_STOP_WORDS = frozenset({'的', '了', '在', '是', '我', '你', '他', '她', 'the', 'a', 'an', 'is', 'are'})
+
+# 音效向量维度（特征哈希的桶数，须为2的幂）
+EMBEDDING_DIM = 128
+
+
+def _tokenize(text: str) -> List[str]:
+    """切分为词和字符二元组（中文没有空格分词，二元组能覆盖大部分词语）"""
+    tokens = []
+    for word in _TOKEN_RE.findall(text.lower()):
+        tokens.append(word)
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _quantize_embedding(vector) -> Tuple[np.ndarray, float]:
+    """
+    按向量最大绝对值缩放量化为int8（内存为float32的1/4）
+    
+    还原值为 q * scale / 127，单个分量误差不超过 scale / 254。
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    scale = float(np.abs(vector).max()) if vector.size else 0.0
+    if scale == 0.0:
+        return np.zeros(vector.shape, dtype=np.int8), 0.0
+    return np.round(vector / scale * 127).astype(np.int8), scale
+
+
+class _KeywordMatcher:
+    """
+    关键词匹配器：一次正则扫描找出文本中出现的全部关键词
+    
+    结果与逐个执行 `kw in text` 相同。前瞻分组使每个位置都被检查（允许重叠），
+    按长度降序的分支在每个位置取最长的关键词，同一位置上更短的关键词必然是它的前缀，
+    通过预先计算的前缀闭包一并计入。
+    """
+    
+    def __init__(self, keywords: Iterable[str]):
+        unique = sorted(set(keywords), key=len, reverse=True)
+        self._pattern = re.compile("(?=(" + "|".join(map(re.escape, unique)) + "))")
+        self._prefixes: Dict[str, FrozenSet[str]] = {
+            kw: frozenset(k for k in unique if kw.startswith(k)) for kw in unique
+        }
+    
+    def find(self, text: str) -> Set[str]:
+        """返回文本中出现的关键词集合"""
+        found: Set[str] = set()
+        for match in set(self._pattern.findall(text)):
+            found |= self._prefixes[match]
+        return found
+
+
 class SceneType(str, Enum):
     """场景类型枚举"""
     ACTION = "action"  # 动作场景
@@ -31,7 +93,7 @@ class EmotionType(str, Enum):
     NEUTRAL = "neutral"  # 中性
 
 
-@dataclass
+@dataclass(slots=True)
 class SceneSegment:
     """场景片段"""
     scene_id: str
@@ -44,19 +106,20 @@ class SceneSegment:
     duration: float  # 秒
     keywords: List[str]
     
+    # 序列化字段顺序与一次性取出全部字段的 attrgetter
+    _FIELDS = (
+        "scene_id", "text", "scene_type", "actions", "emotions",
+        "characters", "start_time", "duration", "keywords"
+    )
+    _get_fields = attrgetter(*_FIELDS)
+    
     def to_dict(self) -> Dict:
         """转换为字典"""
-        return {
-            "scene_id": self.scene_id,
-            "text": self.text,
-            "scene_type": self.scene_type.value,
-            "actions": self.actions,
-            "emotions": [e.value for e in self.emotions],
-            "characters": self.characters,
-            "start_time": self.start_time,
-            "duration": self.duration,
-            "keywords": self.keywords
-        }
+        data = dict(zip(self._FIELDS, self._get_fields(self)))
+        # 覆盖已有键不改变键顺序
+        data["scene_type"] = self.scene_type.value
+        data["emotions"] = [e.value for e in self.emotions]
+        return data
     
     @classmethod
     def from_dict(cls, data: Dict) -> "SceneSegment":
@@ -74,7 +137,7 @@ class SceneSegment:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class SoundEffect:
     """音效"""
     effect_id: str
@@ -84,24 +147,47 @@ class SoundEffect:
     tags: List[str]
     duration: float  # 秒
     file_url: str
-    embedding: Optional[List[float]] = None  # 向量表示
+    # 向量表示（int8量化）及缩放系数；ndarray 不能参与 __eq__ 的元组比较
+    embedding: Optional[np.ndarray] = field(default=None, compare=False)
+    embedding_scale: float = field(default=0.0, compare=False)
+    
+    # 序列化字段顺序与一次性取出全部字段的 attrgetter（向量单独编码）
+    _FIELDS = (
+        "effect_id", "name", "description", "category",
+        "tags", "duration", "file_url"
+    )
+    _get_fields = attrgetter(*_FIELDS)
+    
+    def embedding_vector(self) -> Optional[np.ndarray]:
+        """还原float32向量"""
+        if self.embedding is None:
+            return None
+        return self.embedding.astype(np.float32) * np.float32(self.embedding_scale / 127)
     
     def to_dict(self) -> Dict:
-        """转换为字典"""
-        return {
-            "effect_id": self.effect_id,
-            "name": self.name,
-            "description": self.description,
-            "category": self.category,
-            "tags": self.tags,
-            "duration": self.duration,
-            "file_url": self.file_url,
-            "embedding": self.embedding
-        }
+        """转换为字典（向量以 int8 原始字节的 base64 编码输出，比浮点数列表更小且无需逐个装箱）"""
+        data = dict(zip(self._FIELDS, self._get_fields(self)))
+        if self.embedding is not None:
+            data["embedding_b64"] = base64.b64encode(self.embedding.tobytes()).decode("ascii")
+            data["embedding_scale"] = self.embedding_scale
+        else:
+            data["embedding_b64"] = None
+            data["embedding_scale"] = None
+        return data
     
     @classmethod
     def from_dict(cls, data: Dict) -> "SoundEffect":
-        """从字典创建"""
+        """从字典创建（兼容旧格式的 float32 字节和浮点数列表，读入时量化）"""
+        embedding, scale = None, 0.0
+        if data.get("embedding_b64") is not None:
+            raw = base64.b64decode(data["embedding_b64"])
+            if data.get("embedding_scale") is not None:
+                embedding = np.frombuffer(raw, dtype=np.int8).copy()
+                scale = float(data["embedding_scale"])
+            else:
+                embedding, scale = _quantize_embedding(np.frombuffer(raw, dtype=np.float32))
+        elif data.get("embedding") is not None:
+            embedding, scale = _quantize_embedding(data["embedding"])
         return cls(
             effect_id=data["effect_id"],
             name=data["name"],
@@ -110,7 +196,8 @@ class SoundEffect:
             tags=data["tags"],
             duration=data["duration"],
             file_url=data["file_url"],
-            embedding=data.get("embedding")
+            embedding=embedding,
+            embedding_scale=scale
         )
 
 
@@ -138,6 +225,15 @@ class ScriptParser:
         "indoor", "outdoor", "street", "room", "office", "park", "forest", "beach"
     ]
     
+    # 所有类别的关键词合并为一个匹配器，每个场景只扫描一次文本
+    _KEYWORD_MATCHER = _KeywordMatcher(
+        ACTION_KEYWORDS + ENVIRONMENT_KEYWORDS + [kw for keywords in EMOTION_KEYWORDS.values() for kw in keywords]
+    )
+    _ACTION_SET = frozenset(ACTION_KEYWORDS)
+    _ENVIRONMENT_SET = frozenset(ENVIRONMENT_KEYWORDS)
+    # 情感关键词反查表：关键词 -> 情感（各情感的关键词互不重复）
+    _KW_TO_EMOTION = {kw: emotion for emotion, keywords in EMOTION_KEYWORDS.items() for kw in keywords}
+    
     def parse_script(self, script: str) -> List[SceneSegment]:
         """
         解析剧本，提取场景片段
@@ -152,8 +248,7 @@ class ScriptParser:
             return []
         
         # 按场景分割（假设场景以"场景"或"Scene"开头）
-        scene_pattern = r'(?:场景|Scene)\s*\d+|^.+?(?=场景|Scene|\Z)'
-        scenes = re.split(scene_pattern, script, flags=re.MULTILINE | re.IGNORECASE)
+        scenes = _SCENE_SPLIT_RE.split(script)
         scenes = [s.strip() for s in scenes if s.strip()]
         
         # 如果没有明确的场景标记，按段落分割
@@ -168,9 +263,10 @@ class ScriptParser:
                 continue
             
             # 提取场景信息
-            scene_type = self._detect_scene_type(scene_text)
-            actions = self._extract_actions(scene_text)
-            emotions = self._extract_emotions(scene_text)
+            found = self._find_keywords(scene_text)
+            scene_type = self._detect_scene_type(scene_text, found)
+            actions = self._extract_actions(scene_text, found)
+            emotions = self._extract_emotions(scene_text, found)
             characters = self._extract_characters(scene_text)
             keywords = self._extract_keywords(scene_text)
             
@@ -194,22 +290,27 @@ class ScriptParser:
         
         return segments
     
-    def _detect_scene_type(self, text: str) -> SceneType:
-        """检测场景类型"""
-        text_lower = text.lower()
+    def _find_keywords(self, text: str) -> Set[str]:
+        """一次扫描找出文本中出现的全部关键词（动作、环境、情感）"""
+        return self._KEYWORD_MATCHER.find(text.lower())
+    
+    def _detect_scene_type(self, text: str, found: Optional[Set[str]] = None) -> SceneType:
+        """检测场景类型（found为已找出的关键词集合，未提供时重新扫描）"""
+        if found is None:
+            found = self._find_keywords(text)
         
         # 检查动作关键词
-        action_count = sum(1 for kw in self.ACTION_KEYWORDS if kw in text_lower)
+        action_count = len(found & self._ACTION_SET)
         
         # 检查对话标记
         dialogue_count = text.count('"') + text.count('"') + text.count('"') + text.count(':')
         
         # 检查环境关键词
-        env_count = sum(1 for kw in self.ENVIRONMENT_KEYWORDS if kw in text_lower)
+        env_count = len(found & self._ENVIRONMENT_SET)
         
         # 检查情感关键词
         emotion_count = sum(
-            sum(1 for kw in keywords if kw in text_lower)
+            sum(1 for kw in keywords if kw in found)
             for keywords in self.EMOTION_KEYWORDS.values()
         )
         
@@ -225,25 +326,19 @@ class ScriptParser:
         else:
             return SceneType.TRANSITION
     
-    def _extract_actions(self, text: str) -> List[str]:
+    def _extract_actions(self, text: str, found: Optional[Set[str]] = None) -> List[str]:
         """提取动作"""
-        text_lower = text.lower()
-        actions = []
-        
-        for keyword in self.ACTION_KEYWORDS:
-            if keyword in text_lower:
-                actions.append(keyword)
-        
-        return list(set(actions))[:5]  # 最多返回5个
+        if found is None:
+            found = self._find_keywords(text)
+        return [kw for kw in self.ACTION_KEYWORDS if kw in found][:5]  # 最多返回5个
     
-    def _extract_emotions(self, text: str) -> List[EmotionType]:
+    def _extract_emotions(self, text: str, found: Optional[Set[str]] = None) -> List[EmotionType]:
         """提取情感"""
-        text_lower = text.lower()
-        emotions = []
-        
-        for emotion, keywords in self.EMOTION_KEYWORDS.items():
-            if any(kw in text_lower for kw in keywords):
-                emotions.append(emotion)
+        if found is None:
+            found = self._find_keywords(text)
+        # 只遍历文本中出现的关键词反查情感，结果按情感声明顺序返回
+        hit = {self._KW_TO_EMOTION[kw] for kw in found if kw in self._KW_TO_EMOTION}
+        emotions = [emotion for emotion in self.EMOTION_KEYWORDS if emotion in hit]
         
         if not emotions:
             emotions.append(EmotionType.NEUTRAL)
@@ -253,23 +348,19 @@ class ScriptParser:
     def _extract_characters(self, text: str) -> List[str]:
         """提取角色名（简化实现）"""
         # 查找对话标记前的名字
-        pattern = r'([A-Za-z\u4e00-\u9fa5]+)\s*[:：]'
-        matches = re.findall(pattern, text)
+        matches = _CHARACTER_RE.findall(text)
         
-        characters = list(set(matches))[:5]  # 最多返回5个
+        # 按首次出现顺序去重，结果稳定可复现
+        characters = list(dict.fromkeys(matches))[:5]  # 最多返回5个
         return characters
     
     def _extract_keywords(self, text: str) -> List[str]:
         """提取关键词（简化实现）"""
-        # 移除标点符号
-        text_clean = re.sub(r'[^\w\s]', ' ', text)
-        
-        # 分词（简化：按空格分割）
-        words = text_clean.split()
+        # 分词（简化：标点和空白均视为分隔符，一次扫描取出连续的词字符）
+        words = _TOKEN_RE.findall(text)
         
         # 过滤短词和常见词
-        stop_words = {'的', '了', '在', '是', '我', '你', '他', '她', 'the', 'a', 'an', 'is', 'are'}
-        keywords = [w for w in words if len(w) > 1 and w.lower() not in stop_words]
+        keywords = [w for w in words if len(w) > 1 and w.lower() not in _STOP_WORDS]
         
         # 返回前10个关键词
         return keywords[:10]
@@ -281,6 +372,10 @@ class SoundEffectLibrary:
     def __init__(self):
         """初始化音效库"""
         self.effects: Dict[str, SoundEffect] = {}
+        # 音效库版本号，每次修改递增（匹配器据此判断评分索引是否需要重建）
+        self.version = 0
+        # 全部音效的只读快照，仅在音效库变更时重建
+        self._effects_tuple: Tuple[SoundEffect, ...] = ()
         self._initialize_default_effects()
     
     def _initialize_default_effects(self):
@@ -314,31 +409,43 @@ class SoundEffectLibrary:
         
         for effect in default_effects:
             # 生成简单的向量表示（基于标签）
-            effect.embedding = self._generate_embedding(effect)
+            self._assign_embedding(effect)
             self.effects[effect.effect_id] = effect
+        self._effects_tuple = tuple(self.effects.values())
     
-    def _generate_embedding(self, effect: SoundEffect) -> List[float]:
-        """生成音效的向量表示（简化实现）"""
-        # 使用标签和描述生成简单的向量
+    def _generate_embedding(self, effect: SoundEffect) -> np.ndarray:
+        """
+        生成音效的向量表示（特征哈希，简化实现）
+        
+        名称、描述和标签的词与字符二元组哈希到固定维度后计数并归一化。
+        使用crc32而非内置hash，保证向量在不同进程间一致。
+        """
         text = f"{effect.name} {effect.description} {' '.join(effect.tags)}"
         
-        # 简化：使用字符频率作为向量（实际应使用词嵌入模型）
-        vector = [0.0] * 128
-        for i, char in enumerate(text[:128]):
-            vector[i] = ord(char) / 1000.0
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for token in _tokenize(text):
+            vector[zlib.crc32(token.encode("utf-8")) & (EMBEDDING_DIM - 1)] += 1.0
         
         # 归一化
         norm = np.linalg.norm(vector)
         if norm > 0:
-            vector = [v / norm for v in vector]
+            vector /= norm
         
         return vector
     
+    def _assign_embedding(self, effect: SoundEffect) -> None:
+        """为音效生成（或量化已有的float）向量，库内统一以int8存储"""
+        if effect.embedding is None:
+            effect.embedding, effect.embedding_scale = _quantize_embedding(self._generate_embedding(effect))
+        elif effect.embedding.dtype != np.int8:
+            effect.embedding, effect.embedding_scale = _quantize_embedding(effect.embedding)
+    
     def add_effect(self, effect: SoundEffect):
         """添加音效到库"""
-        if effect.embedding is None:
-            effect.embedding = self._generate_embedding(effect)
+        self._assign_embedding(effect)
         self.effects[effect.effect_id] = effect
+        self._effects_tuple = tuple(self.effects.values())
+        self.version += 1
     
     def get_effect(self, effect_id: str) -> Optional[SoundEffect]:
         """获取音效"""
@@ -346,19 +453,160 @@ class SoundEffectLibrary:
     
     def search_by_category(self, category: str) -> List[SoundEffect]:
         """按类别搜索音效"""
-        return [e for e in self.effects.values() if e.category == category]
+        return [e for e in self._effects_tuple if e.category == category]
     
     def search_by_tags(self, tags: List[str]) -> List[SoundEffect]:
         """按标签搜索音效"""
         results = []
-        for effect in self.effects.values():
+        for effect in self._effects_tuple:
             if any(tag in effect.tags for tag in tags):
                 results.append(effect)
         return results
     
     def get_all_effects(self) -> List[SoundEffect]:
         """获取所有音效"""
-        return list(self.effects.values())
+        return list(self._effects_tuple)
+    
+    @property
+    def effects_snapshot(self) -> Tuple[SoundEffect, ...]:
+        """全部音效的只读快照（不复制，音效库变更后返回新的元组）"""
+        return self._effects_tuple
+
+
+class _ScoringIndex:
+    """
+    音效评分索引
+    
+    规则评分中只有关键词与情感两项依赖具体标签，其余音效的分数只可能是类型分（0.3）或0。
+    因此按标签/情感建立倒排表：推荐时只对倒排表命中的音效完整评分，
+    其余音效按库中顺序直接补位，代价与命中数量而非音效库大小成正比。
+    """
+    
+    def __init__(
+        self,
+        effects: Tuple[SoundEffect, ...],
+        type_categories: Dict[SceneType, List[str]],
+        emotion_tags: Dict[EmotionType, List[str]]
+    ):
+        self.effects = effects
+        n = len(effects)
+        empty = np.zeros(0, dtype=np.intp)
+        
+        # 场景类型 -> 类别匹配的音效（布尔向量，以及匹配/不匹配的位置列表）
+        categories = np.array([e.category for e in effects], dtype=object)
+        self.type_match: Dict[SceneType, np.ndarray] = {
+            scene_type: np.isin(categories, allowed) if n else np.zeros(0, dtype=bool)
+            for scene_type, allowed in type_categories.items()
+        }
+        self.type_positions = {t: np.flatnonzero(m) for t, m in self.type_match.items()}
+        self.other_positions = {t: np.flatnonzero(~m) for t, m in self.type_match.items()}
+        self.all_positions = np.arange(n)
+        self.no_type_match = np.zeros(n, dtype=bool)
+        
+        # 标签倒排表（CSR布局）：标签ID t 对应的音效位置为
+        # tag_positions[tag_offsets[t]:tag_offsets[t + 1]]（升序）
+        self.token_ids: Dict[str, int] = {}
+        pair_tags: List[int] = []
+        pair_positions: List[int] = []
+        tag_counts: List[int] = []
+        for i, effect in enumerate(effects):
+            tag_set = set(effect.tags)
+            tag_counts.append(len(tag_set))
+            for tag in tag_set:
+                pair_tags.append(self.token_ids.setdefault(tag, len(self.token_ids)))
+                pair_positions.append(i)
+        pair_tags_arr = np.array(pair_tags, dtype=np.int32)
+        order = np.argsort(pair_tags_arr, kind="stable")
+        self.tag_positions = np.array(pair_positions, dtype=np.int32)[order]
+        self.tag_offsets = np.zeros(len(self.token_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pair_tags_arr, minlength=len(self.token_ids)), out=self.tag_offsets[1:])
+        self.tag_counts = np.array(tag_counts, dtype=np.float64)
+        
+        # 情感倒排表：情感 -> 标签或描述包含该情感关键词的音效位置
+        self.emotion_positions: Dict[EmotionType, np.ndarray] = {
+            emotion: np.array(
+                [i for i, e in enumerate(effects) if any(tag in e.tags or tag in e.description for tag in tags)],
+                dtype=np.intp
+            ) if n else empty
+            for emotion, tags in emotion_tags.items()
+        }
+        self._empty = empty
+    
+    def _score_rows(
+        self,
+        scene: SceneSegment,
+        rows: np.ndarray,
+        scene_keywords: Set[str],
+        tag_hits: np.ndarray,
+        emotion_hits: np.ndarray
+    ) -> np.ndarray:
+        """计算场景与指定位置（升序）音效的相似度，与 _calculate_similarity 逐个计算结果一致"""
+        # 1. 场景类型匹配（权重0.3）
+        type_match = self.type_match.get(scene.scene_type, self.no_type_match)[rows]
+        scores = np.where(type_match, 0.3, 0.0)
+        
+        # 2. 关键词匹配（权重0.4）：交集大小即该位置在标签倒排表中出现的次数
+        #    没有任何标签命中时交集全为0，整步跳过
+        if len(tag_hits):
+            intersection = np.zeros(len(rows))
+            positions, counts = np.unique(tag_hits, return_counts=True)
+            intersection[np.searchsorted(rows, positions)] = counts
+            union = len(scene_keywords) + self.tag_counts[rows] - intersection
+            scores = scores + 0.4 * (intersection / union)
+        
+        # 3. 情感匹配（权重0.3，命中任一非中性情感即可）
+        if len(emotion_hits):
+            scores = scores + np.where(np.isin(rows, emotion_hits), 0.3, 0.0)
+        
+        return np.minimum(scores, 1.0)
+    
+    def top_k(self, scene: SceneSegment, k: int) -> List[Tuple[SoundEffect, float]]:
+        """按相似度降序返回前k个音效，同分时保持音效库中的顺序"""
+        n = len(self.effects)
+        scene_keywords = set(scene.keywords + scene.actions)
+        offsets = self.tag_offsets
+        scene_ids = [self.token_ids[t] for t in scene_keywords if t in self.token_ids]
+        tag_hits = [self.tag_positions[offsets[t]:offsets[t + 1]] for t in scene_ids]
+        tag_hits = np.concatenate(tag_hits) if tag_hits else self._empty
+        emotion_hits = [self.emotion_positions[e] for e in scene.emotions if e in self.emotion_positions]
+        emotion_hits = np.unique(np.concatenate(emotion_hits)) if emotion_hits else self._empty
+        
+        if not 0 < k < n:
+            scores = self._score_rows(scene, self.all_positions, scene_keywords, tag_hits, emotion_hits)
+            order = np.argsort(-scores, kind="stable")[:k]
+            return [(self.effects[i], float(scores[i])) for i in order]
+        
+        # 倒排表命中的音效完整评分（无命中时只剩类型分，无需评分）
+        hits = np.union1d(tag_hits, emotion_hits)
+        if len(hits):
+            hit_scores = self._score_rows(scene, hits, scene_keywords, tag_hits, emotion_hits)
+        else:
+            hit_scores = np.zeros(0)
+        
+        # 未命中的音效只有类型分：前k个未命中的位置必然落在各自列表的前 k+命中数 个之中
+        limit = k + len(hits)
+        type_only = self.type_positions.get(scene.scene_type, self._empty)[:limit]
+        type_only = type_only[~np.isin(type_only, hits)][:k]
+        others = self.other_positions.get(scene.scene_type, self.all_positions)[:limit]
+        others = others[~np.isin(others, hits)][:k]
+        
+        positions = np.concatenate([hits, type_only, others])
+        scores = np.concatenate([hit_scores, np.full(len(type_only), 0.3), np.zeros(len(others))])
+        order = self._top_order(positions, scores, k)
+        return [(self.effects[positions[i]], float(scores[i])) for i in order]
+    
+    @staticmethod
+    def _top_order(positions: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+        """选出前k个的下标：先用 O(N) 的 partition 求第k大分数，只对不低于它的候选
+        （含全部同分项）按分数降序、位置升序排序，结果与完整排序一致"""
+        n = len(scores)
+        if n > k:
+            kth_score = np.partition(scores, n - k)[n - k]
+            candidates = np.flatnonzero(scores >= kth_score)
+        else:
+            candidates = np.arange(n)
+        order = np.lexsort((positions[candidates], -scores[candidates]))[:k]
+        return candidates[order]
 
 
 class SoundEffectMatcher:
@@ -371,23 +619,41 @@ class SoundEffectMatcher:
     3. 自动放置
     """
     
-    _instance = None
+    # 场景类型 -> 匹配的音效类别
+    SCENE_TYPE_CATEGORIES = {
+        SceneType.ACTION: ["action"],
+        SceneType.DIALOGUE: ["dialogue"],
+        SceneType.ENVIRONMENT: ["environment"],
+        SceneType.EMOTIONAL: ["emotional"],
+        SceneType.TRANSITION: ["action", "environment"]
+    }
     
-    def __new__(cls):
-        """单例模式"""
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialized = False
-        return cls._instance
+    # 情感 -> 音效标签/描述中的情感关键词（中性情感不参与匹配）
+    EMOTION_TAGS = {
+        EmotionType.HAPPY: ["快乐", "欢乐", "happy"],
+        EmotionType.SAD: ["悲伤", "忧伤", "sad"],
+        EmotionType.ANGRY: ["愤怒", "angry"],
+        EmotionType.FEAR: ["恐怖", "害怕", "scare"],
+        EmotionType.SURPRISE: ["惊", "surprise"]
+    }
     
     def __init__(self):
-        """初始化音效匹配器"""
-        if self._initialized:
-            return
-        
+        """初始化音效匹配器（共享实例请通过 get_sound_effect_matcher 获取）"""
         self.parser = ScriptParser()
         self.library = SoundEffectLibrary()
-        self._initialized = True
+        self._score_index: Optional[_ScoringIndex] = None
+        self._score_index_version = -1
+    
+    def _get_score_index(self) -> _ScoringIndex:
+        """获取评分索引，音效库变更后重建"""
+        if self._score_index is None or self._score_index_version != self.library.version:
+            self._score_index = _ScoringIndex(
+                self.library.effects_snapshot,
+                self.SCENE_TYPE_CATEGORIES,
+                self.EMOTION_TAGS
+            )
+            self._score_index_version = self.library.version
+        return self._score_index
     
     def parse_script(self, script: str) -> List[SceneSegment]:
         """
@@ -416,20 +682,7 @@ class SoundEffectMatcher:
         返回:
             (音效, 相似度分数)的列表
         """
-        # 获取所有音效
-        all_effects = self.library.get_all_effects()
-        
-        # 计算相似度
-        scores = []
-        for effect in all_effects:
-            score = self._calculate_similarity(scene_segment, effect)
-            scores.append((effect, score))
-        
-        # 按分数排序
-        scores.sort(key=lambda x: x[1], reverse=True)
-        
-        # 返回前k个
-        return scores[:top_k]
+        return self._get_score_index().top_k(scene_segment, top_k)
     
     def _calculate_similarity(
         self,
@@ -449,15 +702,7 @@ class SoundEffectMatcher:
         score = 0.0
         
         # 1. 场景类型匹配（权重0.3）
-        type_match = {
-            SceneType.ACTION: ["action"],
-            SceneType.DIALOGUE: ["dialogue"],
-            SceneType.ENVIRONMENT: ["environment"],
-            SceneType.EMOTIONAL: ["emotional"],
-            SceneType.TRANSITION: ["action", "environment"]
-        }
-        
-        if effect.category in type_match.get(scene.scene_type, []):
+        if effect.category in self.SCENE_TYPE_CATEGORIES.get(scene.scene_type, []):
             score += 0.3
         
         # 2. 关键词匹配（权重0.4）
@@ -471,17 +716,9 @@ class SoundEffectMatcher:
             score += 0.4 * keyword_score
         
         # 3. 情感匹配（权重0.3）
-        emotion_keywords = {
-            EmotionType.HAPPY: ["快乐", "欢乐", "happy"],
-            EmotionType.SAD: ["悲伤", "忧伤", "sad"],
-            EmotionType.ANGRY: ["愤怒", "angry"],
-            EmotionType.FEAR: ["恐怖", "害怕", "scare"],
-            EmotionType.SURPRISE: ["惊", "surprise"]
-        }
-        
         for emotion in scene.emotions:
             if emotion != EmotionType.NEUTRAL:
-                emotion_tags = emotion_keywords.get(emotion, [])
+                emotion_tags = self.EMOTION_TAGS.get(emotion, [])
                 if any(tag in effect.tags or tag in effect.description for tag in emotion_tags):
                     score += 0.3
                     break
@@ -491,7 +728,9 @@ class SoundEffectMatcher:
     def auto_place_sound_effects(
         self,
         segments: List[SceneSegment],
-        effect_placements: List[Tuple[str, str]]  # (scene_id, effect_id)
+        effect_placements: List[Tuple[str, str]],  # (scene_id, effect_id)
+        *,
+        scene_map: Optional[Dict[str, SceneSegment]] = None
     ) -> List[Dict]:
         """
         自动将音效放置在时间轴上
@@ -499,32 +738,30 @@ class SoundEffectMatcher:
         参数:
             segments: 场景片段列表
             effect_placements: (场景ID, 音效ID)的配对列表
+            scene_map: 预先构建的场景ID到场景的映射（同一组场景反复放置时传入，避免每次重建）
         
         返回:
             时间轴放置信息列表
         """
-        placements = []
-        
         # 创建场景ID到场景的映射
-        scene_map = {seg.scene_id: seg for seg in segments}
-        
-        for scene_id, effect_id in effect_placements:
-            scene = scene_map.get(scene_id)
-            effect = self.library.get_effect(effect_id)
-            
-            if scene and effect:
-                placement = {
-                    "scene_id": scene_id,
-                    "effect_id": effect_id,
-                    "effect_name": effect.name,
-                    "start_time": scene.start_time,
-                    "duration": min(effect.duration, scene.duration),
-                    "file_url": effect.file_url,
-                    "volume": 0.7  # 默认音量
-                }
-                placements.append(placement)
-        
-        return placements
+        if scene_map is None:
+            scene_map = {seg.scene_id: seg for seg in segments}
+        get_effect = self.library.get_effect
+        
+        return [
+            {
+                "scene_id": scene_id,
+                "effect_id": effect_id,
+                "effect_name": effect.name,
+                "start_time": scene.start_time,
+                "duration": min(effect.duration, scene.duration),
+                "file_url": effect.file_url,
+                "volume": 0.7  # 默认音量
+            }
+            for scene_id, effect_id in effect_placements
+            if (scene := scene_map.get(scene_id)) is not None
+            and (effect := get_effect(effect_id)) is not None
+        ]
     
     def upload_custom_effect(
         self,
@@ -567,3 +804,14 @@ class SoundEffectMatcher:
         self.library.add_effect(effect)
         
         return effect
+
+
+@lru_cache(maxsize=1)
+def get_sound_effect_matcher() -> SoundEffectMatcher:
+    """
+    获取音效匹配器实例（单例）
+    
+    返回:
+        SoundEffectMatcher: 匹配器实例
+    """
+    return SoundEffectMatcher()
@@ -1,7 +1,10 @@
 """分镜服务层"""
+import threading
+
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, desc
-from typing import List, Optional
+from sqlalchemy import select, func, desc, insert
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional
 from uuid import UUID
 
 from app.models.storyboard import StoryboardFrame
@@ -9,6 +12,11 @@ from app.schemas.storyboard import StoryboardFrameCreate, StoryboardFrameUpdate
 
 
 class StoryboardService:
+    # 进程内缓存：项目ID -> 已分配的最大序号（首次创建时由 MAX 查询填充，之后本地递增）
+    # 多进程部署下由 (project_id, sequence_number) 唯一约束兜底，冲突时失效并重试
+    _seq_cache: Dict[UUID, int] = {}
+    _seq_lock = threading.Lock()
+
     def __init__(self, db: Session):
         self.db = db
 
@@ -24,30 +32,101 @@ class StoryboardService:
         """获取单个分镜帧"""
         return self.db.get(StoryboardFrame, frame_id)
 
-    def create_frame(self, data: StoryboardFrameCreate) -> StoryboardFrame:
-        """创建分镜帧"""
-        # 获取当前最大序号
+    def _next_sequence_number(self, project_id: UUID) -> int:
+        """分配项目的下一个序号（缓存未命中时才查询 MAX）"""
+        with self._seq_lock:
+            last_seq = self._seq_cache.get(project_id)
+            if last_seq is not None:
+                self._seq_cache[project_id] = last_seq + 1
+                return last_seq + 1
+
+        # 获取当前最大序号（不持锁查询，避免阻塞其他项目）
         stmt = select(func.max(StoryboardFrame.sequence_number)).where(
-            StoryboardFrame.project_id == data.project_id
+            StoryboardFrame.project_id == project_id
         )
         max_seq = self.db.execute(stmt).scalar() or 0
-        
-        # Convert Pydantic model to DB model
-        # Note: We mapped `scene_description` to `description` in the model
-        # and `character_id` to `character_ids` array
-        
-        frame = StoryboardFrame(
-            project_id=data.project_id,
-            sequence_number=max_seq + 1,
-            description=data.scene_description, # Map scene_description to description
-            character_ids=[data.character_id] if data.character_id else [], # Map single ID to array
-            status="pending"
-        )
-        
-        self.db.add(frame)
+
+        with self._seq_lock:
+            seq = max(self._seq_cache.get(project_id, 0), max_seq) + 1
+            self._seq_cache[project_id] = seq
+            return seq
+
+    @classmethod
+    def _invalidate_sequence(cls, project_id: UUID) -> None:
+        """使项目的序号缓存失效，下次创建时重新查询 MAX"""
+        with cls._seq_lock:
+            cls._seq_cache.pop(project_id, None)
+
+    def create_frame(self, data: StoryboardFrameCreate) -> StoryboardFrame:
+        """创建分镜帧"""
+        # 其他进程可能已占用缓存中的序号：唯一约束冲突时失效缓存并重试一次
+        for attempt in range(2):
+            # Convert Pydantic model to DB model
+            # Note: We mapped `scene_description` to `description` in the model
+            # and `character_id` to `character_ids` array
+            
+            frame = StoryboardFrame(
+                project_id=data.project_id,
+                sequence_number=self._next_sequence_number(data.project_id),
+                description=data.scene_description, # Map scene_description to description
+                character_ids=[data.character_id] if data.character_id else [], # Map single ID to array
+                status="pending"
+            )
+            
+            self.db.add(frame)
+            try:
+                self.db.commit()
+            except IntegrityError:
+                self.db.rollback()
+                self._invalidate_sequence(data.project_id)
+                if attempt:
+                    raise
+                continue
+            self.db.refresh(frame)
+            return frame
+
+    def create_frames_bulk(self, items: List[StoryboardFrameCreate]) -> List[StoryboardFrame]:
+        """批量创建分镜帧
+
+        每个项目只查询一次当前最大序号（单条分组查询），同一项目内按传入顺序
+        依次分配序号，再以一条 INSERT ... RETURNING 写入全部分镜帧并提交一次。
+        """
+        if not items:
+            return []
+
+        project_ids = {item.project_id for item in items}
+        stmt = select(
+            StoryboardFrame.project_id, func.max(StoryboardFrame.sequence_number)
+        ).where(
+            StoryboardFrame.project_id.in_(project_ids)
+        ).group_by(StoryboardFrame.project_id)
+        next_seq = {project_id: max_seq or 0 for project_id, max_seq in self.db.execute(stmt)}
+
+        payload = []
+        for item in items:
+            seq = next_seq.get(item.project_id, 0) + 1
+            next_seq[item.project_id] = seq
+            payload.append({
+                "project_id": item.project_id,
+                "sequence_number": seq,
+                "description": item.scene_description,
+                "character_ids": [item.character_id] if item.character_id else [],
+                "status": "pending"
+            })
+
+        # sort_by_parameter_order 保证返回顺序与传入顺序一致
+        insert_stmt = insert(StoryboardFrame).returning(StoryboardFrame, sort_by_parameter_order=True)
+        frames = self.db.scalars(insert_stmt, payload).all()
+
+        # RETURNING 已带回完整行，提交前移出会话即可省去逐条 refresh
+        for frame in frames:
+            self.db.expunge(frame)
         self.db.commit()
-        self.db.refresh(frame)
-        return frame
+
+        with self._seq_lock:
+            for project_id, seq in next_seq.items():
+                self._seq_cache[project_id] = max(self._seq_cache.get(project_id, 0), seq)
+        return frames
 
     def update_frame(self, frame_id: UUID, data: StoryboardFrameUpdate) -> Optional[StoryboardFrame]:
         """更新分镜帧"""
@@ -59,8 +138,17 @@ class StoryboardService:
         for field, value in update_data.items():
             setattr(frame, field, value)
             
+        project_id = frame.project_id
         self.db.add(frame)
-        self.db.commit()
+        try:
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            raise ValueError("该序号已被项目内其他分镜占用")
+        finally:
+            # 手动调整序号后缓存的最大值可能已不准确
+            if "sequence_number" in update_data:
+                self._invalidate_sequence(project_id)
         self.db.refresh(frame)
         return frame
 
@@ -70,6 +158,10 @@ class StoryboardService:
         if not frame:
             return False
             
+        project_id = frame.project_id
         self.db.delete(frame)
         self.db.commit()
+
+        # 删除最大序号的分镜后缓存值偏大，失效后下次创建重新查询 MAX（与不缓存时一致）
+        self._invalidate_sequence(project_id)
         return True
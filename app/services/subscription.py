@@ -1,19 +1,46 @@
 """订阅管理服务"""
 from datetime import datetime, timedelta
-from typing import Optional, List
+from types import MappingProxyType
+from typing import Mapping, Optional, List
+from sqlalchemy import DateTime, update
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.expression import FunctionElement
 import uuid
 
 from app.models.user import User, SubscriptionTier
 from app.models.subscription import Subscription
 
 
+class utc_now(FunctionElement):
+    """数据库端当前UTC时间（不带时区），与以 datetime.utcnow() 写入的 end_date 同一基准"""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utc_now)
+def _compile_utc_now(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utc_now, "postgresql")
+def _compile_utc_now_postgresql(element, compiler, **kw):
+    # now() 带会话时区，需先换算为UTC再与 naive 的 end_date 比较
+    return "timezone('UTC', now())"
+
+
+@compiles(utc_now, "sqlite")
+def _compile_utc_now_sqlite(element, compiler, **kw):
+    # 与 SQLAlchemy 存储的 "YYYY-MM-DD HH:MM:SS.ffffff" 文本格式保持可比
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
 class SubscriptionService:
     """订阅管理服务类"""
     
-    # 订阅计划配置
-    SUBSCRIPTION_PLANS = {
+    # 订阅计划配置（只读映射）
+    SUBSCRIPTION_PLANS: Mapping[SubscriptionTier, dict] = MappingProxyType({
         SubscriptionTier.FREE: {
             "name": "基础版（免费）",
             "quota_minutes": 5.0,
@@ -38,20 +65,45 @@ class SubscriptionService:
             "price": 999.0,  # ¥999/月
             "duration_days": 30,
         },
-    }
+    })
+    
+    # 各计划的订阅时长（类定义时预先计算；按量付费不限期，按10年计）
+    _PLAN_DURATION: Mapping[SubscriptionTier, timedelta] = MappingProxyType({
+        tier: timedelta(days=config["duration_days"] if config["duration_days"] > 0 else 365 * 10)
+        for tier, config in SUBSCRIPTION_PLANS.items()
+    })
+    
+    # 激活时增加额度的订阅制计划（按量付费保持当前额度）
+    _QUOTA_TIERS = frozenset({
+        SubscriptionTier.FREE,
+        SubscriptionTier.PROFESSIONAL,
+        SubscriptionTier.ENTERPRISE,
+    })
     
     def __init__(self, db: Session):
         self.db = db
     
-    def get_subscription_plans(self) -> dict:
+    def get_subscription_plans(self) -> Mapping[SubscriptionTier, dict]:
         """
         获取所有订阅计划
         
         返回:
-            dict: 订阅计划配置
+            Mapping: 订阅计划配置（只读）
         """
         return self.SUBSCRIPTION_PLANS
     
+    def _get_user(self, user_id: uuid.UUID) -> User:
+        """
+        获取用户（Session.get 优先命中身份映射，已加载时不再查询）
+        
+        异常:
+            ValueError: 用户不存在
+        """
+        user = self.db.get(User, user_id)
+        if not user:
+            raise ValueError("用户不存在")
+        return user
+    
     def create_subscription(
         self,
         user_id: uuid.UUID,
@@ -72,28 +124,27 @@ class SubscriptionService:
         异常:
             ValueError: 用户不存在或计划无效
         """
-        # 验证用户存在
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("用户不存在")
-        
+        return self._create_subscription(self._get_user(user_id), plan, auto_renew)
+    
+    def _create_subscription(
+        self,
+        user: User,
+        plan: SubscriptionTier,
+        auto_renew: bool = True
+    ) -> Subscription:
+        """为已加载的用户创建订阅（调用方负责获取用户，避免重复查询）"""
         # 验证计划有效
-        if plan not in self.SUBSCRIPTION_PLANS:
+        plan_config = self.SUBSCRIPTION_PLANS.get(plan)
+        if plan_config is None:
             raise ValueError("无效的订阅计划")
         
-        plan_config = self.SUBSCRIPTION_PLANS[plan]
-        
         # 计算订阅时间
         start_date = datetime.utcnow()
-        if plan_config["duration_days"] > 0:
-            end_date = start_date + timedelta(days=plan_config["duration_days"])
-        else:
-            # 按量付费不限期
-            end_date = start_date + timedelta(days=365 * 10)  # 10年后
+        end_date = start_date + self._PLAN_DURATION[plan]
         
         # 创建订阅
         subscription = Subscription(
-            user_id=user_id,
+            user_id=user.id,
             plan=plan,
             quota_minutes=plan_config["quota_minutes"],
             start_date=start_date,
@@ -125,21 +176,23 @@ class SubscriptionService:
         异常:
             ValueError: 用户不存在或计划无效
         """
-        # 获取用户
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("用户不存在")
-        
+        return self._activate_subscription(self._get_user(user_id), plan)
+    
+    def _activate_subscription(
+        self,
+        user: User,
+        plan: SubscriptionTier
+    ) -> tuple[User, Subscription]:
+        """为已加载的用户激活订阅"""
         # 创建订阅
-        subscription = self.create_subscription(user_id, plan)
+        subscription = self._create_subscription(user, plan)
         
         # 更新用户订阅层级和额度
         user.subscription_tier = plan
-        plan_config = self.SUBSCRIPTION_PLANS[plan]
         
         # 如果是订阅制，增加额度；如果是按量付费，保持当前额度
-        if plan in [SubscriptionTier.FREE, SubscriptionTier.PROFESSIONAL, SubscriptionTier.ENTERPRISE]:
-            user.remaining_quota_minutes += plan_config["quota_minutes"]
+        if plan in self._QUOTA_TIERS:
+            user.remaining_quota_minutes += subscription.quota_minutes
         
         self.db.commit()
         self.db.refresh(user)
@@ -156,17 +209,10 @@ class SubscriptionService:
         返回:
             bool: True表示已过期，False表示未过期
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("用户不存在")
+        self._get_user(user_id)
         
         # 获取用户的活跃订阅
-        active_subscription = self.db.query(Subscription).filter(
-            Subscription.user_id == user_id,
-            Subscription.end_date > datetime.utcnow()
-        ).order_by(Subscription.end_date.desc()).first()
-        
-        return active_subscription is None
+        return self.get_active_subscription(user_id) is None
     
     def handle_subscription_expiry(self, user_id: uuid.UUID) -> User:
         """
@@ -178,17 +224,17 @@ class SubscriptionService:
         返回:
             User: 更新后的用户对象
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("用户不存在")
+        user = self._get_user(user_id)
         
         # 检查是否有过期的订阅
-        expired_subscriptions = self.db.query(Subscription).filter(
-            Subscription.user_id == user_id,
-            Subscription.end_date <= datetime.utcnow()
-        ).all()
-        
-        if expired_subscriptions:
+        has_expired = self.db.query(
+            self.db.query(Subscription).filter(
+                Subscription.user_id == user_id,
+                Subscription.end_date <= utc_now()
+            ).exists()
+        ).scalar()
+        
+        if has_expired:
             # 降级到免费版
             user.subscription_tier = SubscriptionTier.FREE
             user.remaining_quota_minutes = 5.0  # 重置为免费额度
@@ -213,21 +259,21 @@ class SubscriptionService:
         返回:
             tuple[User, Subscription]: 更新后的用户和新订阅对象
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("用户不存在")
-        
-        # 结束当前活跃订阅
-        active_subscriptions = self.db.query(Subscription).filter(
-            Subscription.user_id == user_id,
-            Subscription.end_date > datetime.utcnow()
-        ).all()
-        
-        for sub in active_subscriptions:
-            sub.end_date = datetime.utcnow()
+        user = self._get_user(user_id)
+        
+        # 结束当前活跃订阅（单条服务端 UPDATE，不逐行加载对象）
+        now = utc_now()
+        self.db.execute(
+            update(Subscription)
+            .where(
+                Subscription.user_id == user_id,
+                Subscription.end_date > now
+            )
+            .values(end_date=now)
+        )
         
         # 激活新订阅
-        user, new_subscription = self.activate_subscription(user_id, new_plan)
+        user, new_subscription = self._activate_subscription(user, new_plan)
         
         return user, new_subscription
     
@@ -249,7 +295,7 @@ class SubscriptionService:
         query = self.db.query(Subscription).filter(Subscription.user_id == user_id)
         
         if active_only:
-            query = query.filter(Subscription.end_date > datetime.utcnow())
+            query = query.filter(Subscription.end_date > utc_now())
         
         return query.order_by(Subscription.created_at.desc()).all()
     
@@ -263,7 +309,8 @@ class SubscriptionService:
         返回:
             Optional[Subscription]: 活跃订阅，如果没有则返回None
         """
+        # 使用数据库时间比较，配合 (user_id, end_date DESC) 索引单次定位
         return self.db.query(Subscription).filter(
             Subscription.user_id == user_id,
-            Subscription.end_date > datetime.utcnow()
+            Subscription.end_date > utc_now()
         ).order_by(Subscription.end_date.desc()).first()
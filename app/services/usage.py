@@ -1,30 +1,20 @@
 """额度管理和使用统计服务"""
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
 import uuid
 
 from app.models.user import User, SubscriptionTier
+from app.models.usage import UsageRecord, UsageDailyStat
 
 
-class UsageRecord:
-    """使用记录（简化版，实际应该是数据库模型）"""
-    def __init__(
-        self,
-        id: uuid.UUID,
-        user_id: uuid.UUID,
-        action_type: str,
-        duration_minutes: float,
-        cost: float,
-        created_at: datetime
-    ):
-        self.id = id
-        self.user_id = user_id
-        self.action_type = action_type
-        self.duration_minutes = duration_minutes
-        self.cost = cost
-        self.created_at = created_at
+# 支持 INSERT ... ON CONFLICT DO UPDATE 的方言
+_UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
 
 
 class UsageService:
@@ -35,9 +25,6 @@ class UsageService:
     
     def __init__(self, db: Session):
         self.db = db
-        # 注意：在实际实现中，应该创建UsageRecord数据库模型
-        # 这里为了简化，使用内存存储
-        self._usage_records = []
     
     def deduct_quota(
         self,
@@ -59,32 +46,38 @@ class UsageService:
         异常:
             ValueError: 用户不存在或额度不足
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("用户不存在")
+        # 额度充足时直接原子扣减（检查与扣减在同一条 UPDATE 中，并发导出不会同时通过检查）
+        user = self._update_user_returning(
+            update(User)
+            .where(User.id == user_id, User.remaining_quota_minutes >= duration_minutes)
+            .values(remaining_quota_minutes=User.remaining_quota_minutes - duration_minutes)
+        )
+        cost = 0.0
         
-        # 检查额度是否足够
-        if user.remaining_quota_minutes < duration_minutes:
-            # 如果是按量付费，可以超额使用
-            if user.subscription_tier == SubscriptionTier.PAY_PER_USE:
-                cost = duration_minutes * self.PAY_PER_USE_PRICE
-            else:
-                raise ValueError(
-                    f"额度不足。需要{duration_minutes}分钟，剩余{user.remaining_quota_minutes}分钟"
+        if user is None:
+            # 额度不足：按量付费用户可以超额使用，额度清零并按时长计费
+            user = self._update_user_returning(
+                update(User)
+                .where(
+                    User.id == user_id,
+                    User.remaining_quota_minutes < duration_minutes,
+                    User.subscription_tier == SubscriptionTier.PAY_PER_USE
                 )
-        else:
-            cost = 0.0
+                .values(remaining_quota_minutes=0)
+            )
+            cost = duration_minutes * self.PAY_PER_USE_PRICE
         
-        # 扣减额度
-        user.remaining_quota_minutes -= duration_minutes
-        if user.remaining_quota_minutes < 0:
-            user.remaining_quota_minutes = 0
+        if user is None:
+            user = self._get_user(user_id)
+            raise ValueError(
+                f"额度不足。需要{duration_minutes}分钟，剩余{user.remaining_quota_minutes}分钟"
+            )
         
         # 记录使用
         self._record_usage(user_id, action_type, duration_minutes, cost)
         
+        # RETURNING 已带回更新后的值，无需 refresh；实例可能是调用方持有的同一对象，保留在会话中
         self.db.commit()
-        self.db.refresh(user)
         
         return user, cost
     
@@ -103,17 +96,109 @@ class UsageService:
         返回:
             User: 更新后的用户对象
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
+        user = self._update_user_returning(
+            update(User)
+            .where(User.id == user_id)
+            .values(remaining_quota_minutes=User.remaining_quota_minutes + duration_minutes)
+        )
+        if user is None:
             raise ValueError("用户不存在")
         
-        user.remaining_quota_minutes += duration_minutes
+        # RETURNING 已带回更新后的值，无需 refresh；实例可能是调用方持有的同一对象，保留在会话中
+        self.db.commit()
         
+        return user
+    
+    def deduct_quota_many(
+        self,
+        items: List[Tuple[uuid.UUID, float, str]]
+    ) -> List[float]:
+        """
+        批量扣减额度（例如队列积压的导出任务一并结算）
+        
+        逐项规则与依次调用 deduct_quota 相同。先以 SELECT ... FOR UPDATE 锁定涉及的用户行，
+        再以一条 executemany UPDATE 和一条多行 INSERT 写入，整批只提交一次；
+        任一项用户不存在或额度不足时整批不扣减。
+        
+        参数:
+            items: (用户ID, 使用时长, 操作类型) 列表
+        
+        返回:
+            List[float]: 与 items 顺序对应的各项费用
+        
+        异常:
+            ValueError: 用户不存在或额度不足
+        """
+        if not items:
+            return []
+        
+        user_ids = {user_id for user_id, _, _ in items}
+        rows = self.db.query(
+            User.id,
+            User.remaining_quota_minutes,
+            User.subscription_tier
+        ).filter(User.id.in_(user_ids)).with_for_update().all()
+        if len(rows) != len(user_ids):
+            raise ValueError("用户不存在")
+        
+        remaining = {row.id: row.remaining_quota_minutes for row in rows}
+        tiers = {row.id: row.subscription_tier for row in rows}
+        
+        # 按顺序逐项结算
+        costs = []
+        for user_id, duration_minutes, _ in items:
+            quota = remaining[user_id]
+            if quota >= duration_minutes:
+                remaining[user_id] = quota - duration_minutes
+                costs.append(0.0)
+            elif tiers[user_id] == SubscriptionTier.PAY_PER_USE:
+                # 按量付费用户超额使用，额度清零并按时长计费
+                remaining[user_id] = 0.0
+                costs.append(duration_minutes * self.PAY_PER_USE_PRICE)
+            else:
+                raise ValueError(
+                    f"额度不足。需要{duration_minutes}分钟，剩余{quota}分钟"
+                )
+        
+        # 每个用户一组参数，同一条 UPDATE 以 executemany 执行
+        users = User.__table__
+        self.db.execute(
+            update(users)
+            .where(users.c.id == bindparam("b_user_id"))
+            .values(remaining_quota_minutes=bindparam("b_remaining")),
+            [
+                {"b_user_id": user_id, "b_remaining": quota}
+                for user_id, quota in remaining.items()
+            ]
+        )
+        
+        self._record_usage_many([
+            (user_id, action_type, duration_minutes, cost)
+            for (user_id, duration_minutes, action_type), cost in zip(items, costs)
+        ])
         self.db.commit()
-        self.db.refresh(user)
         
+        return costs
+    
+    def _get_user(self, user_id: uuid.UUID) -> User:
+        """
+        获取用户（Session.get 优先命中身份映射，同一会话内已加载时不再查询）
+        
+        异常:
+            ValueError: 用户不存在
+        """
+        user = self.db.get(User, user_id)
+        if not user:
+            raise ValueError("用户不存在")
         return user
     
+    def _update_user_returning(self, stmt) -> Optional[User]:
+        """执行用户 UPDATE 并以 RETURNING 取回更新后的用户（未匹配到行时返回None）"""
+        return self.db.execute(
+            stmt.returning(User),
+            execution_options={"populate_existing": True}
+        ).scalars().first()
+    
     def _record_usage(
         self,
         user_id: uuid.UUID,
@@ -122,7 +207,9 @@ class UsageService:
         cost: float
     ):
         """
-        记录使用情况
+        记录使用情况（与调用方在同一事务中提交）
+        
+        写入明细的同时累加当天的预聚合统计，统计查询只需扫描按天汇总的行。
         
         参数:
             user_id: 用户ID
@@ -130,15 +217,79 @@ class UsageService:
             duration_minutes: 使用时长
             cost: 费用
         """
-        record = UsageRecord(
-            id=uuid.uuid4(),
+        now = datetime.utcnow()
+        self.db.add(UsageRecord(
             user_id=user_id,
             action_type=action_type,
             duration_minutes=duration_minutes,
             cost=cost,
-            created_at=datetime.utcnow()
-        )
-        self._usage_records.append(record)
+            created_at=now,
+            updated_at=now
+        ))
+        
+        self._upsert_daily_stats({(user_id, action_type): (duration_minutes, cost, 1)}, now)
+    
+    def _record_usage_many(
+        self,
+        records: List[Tuple[uuid.UUID, str, float, float]]
+    ):
+        """
+        批量记录使用情况：一条多行 INSERT 写入明细，每日统计按键合并后一次累加
+        
+        参数:
+            records: (用户ID, 操作类型, 使用时长, 费用) 列表
+        """
+        now = datetime.utcnow()
+        self.db.execute(insert(UsageRecord), [
+            {
+                "user_id": user_id,
+                "action_type": action_type,
+                "duration_minutes": duration_minutes,
+                "cost": cost,
+                "created_at": now,
+                "updated_at": now
+            }
+            for user_id, action_type, duration_minutes, cost in records
+        ])
+        
+        # 同一语句中冲突键不能重复，先在内存中合并
+        daily: Dict[Tuple[uuid.UUID, str], Tuple[float, float, int]] = {}
+        for user_id, action_type, duration_minutes, cost in records:
+            total_duration, total_cost, count = daily.get((user_id, action_type), (0.0, 0.0, 0))
+            daily[(user_id, action_type)] = (
+                total_duration + duration_minutes, total_cost + cost, count + 1
+            )
+        self._upsert_daily_stats(daily, now)
+    
+    def _upsert_daily_stats(
+        self,
+        daily: Dict[Tuple[uuid.UUID, str], Tuple[float, float, int]],
+        now: datetime
+    ):
+        """以 INSERT ... ON CONFLICT DO UPDATE 累加当天统计（daily: (用户ID, 操作类型) -> (时长, 费用, 次数)）"""
+        upsert_insert = _UPSERT_INSERTS[self.db.get_bind().dialect.name]
+        stmt = upsert_insert(UsageDailyStat).values([
+            {
+                "user_id": user_id,
+                "action_type": action_type,
+                "day": now.date(),
+                "total_duration": total_duration,
+                "total_cost": total_cost,
+                "count": count,
+                "created_at": now,
+                "updated_at": now
+            }
+            for (user_id, action_type), (total_duration, total_cost, count) in daily.items()
+        ])
+        self.db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "action_type", "day"],
+            set_={
+                "total_duration": UsageDailyStat.total_duration + stmt.excluded.total_duration,
+                "total_cost": UsageDailyStat.total_cost + stmt.excluded.total_cost,
+                "count": UsageDailyStat.count + stmt.excluded.count,
+                "updated_at": stmt.excluded.updated_at
+            }
+        ))
     
     def get_usage_statistics(
         self,
@@ -155,36 +306,35 @@ class UsageService:
         返回:
             dict: 使用统计信息
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("用户不存在")
+        user = self._get_user(user_id)
         
-        # 计算时间范围
+        # 计算时间范围（按天汇总，起始日整天计入）
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        # 过滤用户的使用记录
-        user_records = [
-            r for r in self._usage_records
-            if r.user_id == user_id and r.created_at >= start_date
-        ]
+        # 按操作类型汇总预聚合的每日统计（最多扫描 天数×操作类型数 行）
+        rows = self.db.query(
+            UsageDailyStat.action_type,
+            func.sum(UsageDailyStat.count),
+            func.sum(UsageDailyStat.total_duration),
+            func.sum(UsageDailyStat.total_cost)
+        ).filter(
+            UsageDailyStat.user_id == user_id,
+            UsageDailyStat.day >= start_date.date()
+        ).group_by(UsageDailyStat.action_type).all()
+        
+        by_action_type = {
+            action_type: {
+                "count": int(count),
+                "duration_minutes": float(duration),
+                "cost": float(cost)
+            }
+            for action_type, count, duration, cost in rows
+        }
         
         # 计算统计数据
-        total_duration = sum(r.duration_minutes for r in user_records)
-        total_cost = sum(r.cost for r in user_records)
-        record_count = len(user_records)
-        
-        # 按操作类型分组
-        by_action_type = {}
-        for record in user_records:
-            if record.action_type not in by_action_type:
-                by_action_type[record.action_type] = {
-                    "count": 0,
-                    "duration_minutes": 0.0,
-                    "cost": 0.0
-                }
-            by_action_type[record.action_type]["count"] += 1
-            by_action_type[record.action_type]["duration_minutes"] += record.duration_minutes
-            by_action_type[record.action_type]["cost"] += record.cost
+        total_duration = sum(stats["duration_minutes"] for stats in by_action_type.values())
+        total_cost = sum(stats["cost"] for stats in by_action_type.values())
+        record_count = sum(stats["count"] for stats in by_action_type.values())
         
         return {
             "user_id": str(user_id),
@@ -214,17 +364,17 @@ class UsageService:
         返回:
             List[dict]: 使用记录列表
         """
-        # 过滤用户的使用记录
-        user_records = [
-            r for r in self._usage_records
-            if r.user_id == user_id
-        ]
-        
-        # 按时间倒序排序
-        user_records.sort(key=lambda r: r.created_at, reverse=True)
-        
-        # 限制数量
-        user_records = user_records[:limit]
+        # 按时间倒序取用户最近的使用记录：沿 (user_id, created_at) 索引反向扫描，
+        # 只取所需列，不构造ORM实体、不进入身份映射
+        user_records = self.db.query(
+            UsageRecord.id,
+            UsageRecord.action_type,
+            UsageRecord.duration_minutes,
+            UsageRecord.cost,
+            UsageRecord.created_at
+        ).filter(
+            UsageRecord.user_id == user_id
+        ).order_by(UsageRecord.created_at.desc()).limit(limit).all()
         
         # 转换为字典
         return [
@@ -253,31 +403,33 @@ class UsageService:
         返回:
             dict: 费用信息
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("用户不存在")
+        user = self._get_user(user_id)
         
         remaining_quota = user.remaining_quota_minutes
         
-        # 计算费用
+        # 计算费用及提示消息（消息直接使用已算出的值，不再重复计算）
         if remaining_quota >= video_duration_minutes:
             # 额度充足，无需付费
             cost = 0.0
             needs_payment = False
             quota_after = remaining_quota - video_duration_minutes
+            message = f"使用额度：{video_duration_minutes}分钟，剩余额度：{quota_after}分钟"
         else:
             # 额度不足
+            needs_payment = True
+            quota_after = 0.0
             if user.subscription_tier == SubscriptionTier.PAY_PER_USE:
                 # 按量付费，计算超额费用
                 cost = video_duration_minutes * self.PAY_PER_USE_PRICE
-                needs_payment = True
-                quota_after = 0.0
+                message = (
+                    f"按量付费：{video_duration_minutes}分钟 × "
+                    f"¥{self.PAY_PER_USE_PRICE}/分钟 = ¥{cost}"
+                )
             else:
                 # 订阅制用户，需要升级或购买额度
                 shortage = video_duration_minutes - remaining_quota
                 cost = shortage * self.PAY_PER_USE_PRICE
-                needs_payment = True
-                quota_after = 0.0
+                message = f"额度不足{shortage}分钟，需支付：¥{cost}。建议升级订阅计划。"
         
         return {
             "user_id": str(user_id),
@@ -287,29 +439,5 @@ class UsageService:
             "quota_after_export": quota_after,
             "cost": cost,
             "needs_payment": needs_payment,
-            "message": self._get_cost_message(
-                user.subscription_tier,
-                remaining_quota,
-                video_duration_minutes,
-                cost,
-                needs_payment
-            )
+            "message": message
         }
-    
-    def _get_cost_message(
-        self,
-        tier: SubscriptionTier,
-        remaining_quota: float,
-        duration: float,
-        cost: float,
-        needs_payment: bool
-    ) -> str:
-        """生成费用提示消息"""
-        if not needs_payment:
-            return f"使用额度：{duration}分钟，剩余额度：{remaining_quota - duration}分钟"
-        else:
-            if tier == SubscriptionTier.PAY_PER_USE:
-                return f"按量付费：{duration}分钟 × ¥{self.PAY_PER_USE_PRICE}/分钟 = ¥{cost}"
-            else:
-                shortage = duration - remaining_quota
-                return f"额度不足{shortage}分钟，需支付：¥{cost}。建议升级订阅计划。"
@@ -5,16 +5,131 @@
 """
 import io
 import json
+import os
 import subprocess
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 
-from app.core.storage import StorageManager
+from app.core.storage import storage_manager
+
+
+# 帧数不少于该值时才用进程池并行预处理（进程启动和传输图像数据有固定开销）
+FRAME_PREPARE_PARALLEL_MIN_FRAMES = 8
+
+# 最终渲染的编码参数
+FINAL_ENCODER_ARGS: Tuple[str, ...] = ("-c:v", "libx264", "-preset", "medium", "-crf", "23")
+
+# 预览的软件编码参数（ultrafast的编码速度约为medium的3-5倍，预览画质足够）
+PREVIEW_ENCODER_ARGS: Tuple[str, ...] = ("-c:v", "libx264", "-preset", "ultrafast", "-crf", "28")
+
+# 预览优先使用的硬件H.264编码器（按优先级排列）
+HARDWARE_PREVIEW_ENCODER_ARGS: Tuple[Tuple[str, ...], ...] = (
+    ("-c:v", "h264_nvenc", "-preset", "p1", "-tune", "ll"),
+    ("-c:v", "h264_qsv", "-preset", "veryfast"),
+    ("-c:v", "h264_videotoolbox", "-realtime", "1"),
+)
+
+
+@lru_cache(maxsize=1)
+def _available_encoders() -> frozenset:
+    """
+    查询FFmpeg支持的视频编码器（每个进程只执行一次 ffmpeg -encoders）
+    
+    返回:
+        编码器名称集合；FFmpeg不可用时为空集合
+    """
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return frozenset()
+    
+    # 输出格式: " V....D h264_nvenc   NVIDIA NVENC H.264 encoder"
+    encoders = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].startswith("V"):
+            encoders.add(parts[1])
+    return frozenset(encoders)
+
+
+def _hardware_preview_encoder_args() -> Optional[Tuple[str, ...]]:
+    """返回可用的硬件预览编码参数；没有硬件编码器时返回None"""
+    encoders = _available_encoders()
+    for args in HARDWARE_PREVIEW_ENCODER_ARGS:
+        if args[1] in encoders:
+            return args
+    return None
+
+
+def _prepare_frame(args: Tuple[bytes, Tuple[int, int]]) -> bytes:
+    """
+    解码单帧（必要时缩放），返回rgb24原始像素（模块级函数，可在进程池中执行）
+    
+    参数:
+        args: (图像数据, 输出尺寸)
+    
+    返回:
+        按行排列的RGB像素字节，长度为 宽 × 高 × 3
+    """
+    frame_data, resolution = args
+    
+    # 加载图像，尺寸已一致时跳过重采样
+    image = Image.open(io.BytesIO(frame_data))
+    if image.size != resolution:
+        image = image.resize(resolution, Image.Resampling.LANCZOS)
+    
+    return image.convert("RGB").tobytes()
+
+
+def _center_crop(image: Image.Image, target_ratio: float) -> Image.Image:
+    """
+    居中裁剪到目标宽高比
+    
+    crop 只复制裁剪区域的像素；比例已符合时直接返回原图，不做任何复制。
+    （np.asarray 会先完整复制一帧，Image.fromarray 再复制一次，反而更慢。）
+    """
+    current_ratio = image.width / image.height
+    
+    if current_ratio > target_ratio:
+        # 图像太宽，裁剪左右
+        new_width = int(image.height * target_ratio)
+        if new_width < image.width:
+            left = (image.width - new_width) // 2
+            return image.crop((left, 0, left + new_width, image.height))
+    elif current_ratio < target_ratio:
+        # 图像太高，裁剪上下
+        new_height = int(image.width / target_ratio)
+        if new_height < image.height:
+            top = (image.height - new_height) // 2
+            return image.crop((0, top, image.width, top + new_height))
+    
+    return image
+
+
+@lru_cache(maxsize=64)
+def _get_font(size: int) -> ImageFont.ImageFont:
+    """
+    按字号加载字体（缓存，避免每次叠加文字都重新打开并解析字体文件）
+    
+    尝试使用系统字体，失败则使用默认字体。
+    """
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
 
 
 class AspectRatio(str, Enum):
@@ -37,6 +152,23 @@ class VideoFormat(str, Enum):
     MOV = "mov"
 
 
+# 各画面比例与质量对应的分辨率（宽, 高），均为偶数（FFmpeg要求）
+_RESOLUTIONS: Dict[Tuple[AspectRatio, VideoQuality], Tuple[int, int]] = {
+    # 竖屏
+    (AspectRatio.VERTICAL_9_16, VideoQuality.HD_720P): (720, 1280),
+    (AspectRatio.VERTICAL_9_16, VideoQuality.FULL_HD_1080P): (1080, 1920),
+    (AspectRatio.VERTICAL_9_16, VideoQuality.UHD_4K): (2160, 3840),
+    # 横屏
+    (AspectRatio.HORIZONTAL_16_9, VideoQuality.HD_720P): (1280, 720),
+    (AspectRatio.HORIZONTAL_16_9, VideoQuality.FULL_HD_1080P): (1920, 1080),
+    (AspectRatio.HORIZONTAL_16_9, VideoQuality.UHD_4K): (3840, 2160),
+    # 方屏
+    (AspectRatio.SQUARE_1_1, VideoQuality.HD_720P): (720, 720),
+    (AspectRatio.SQUARE_1_1, VideoQuality.FULL_HD_1080P): (1080, 1080),
+    (AspectRatio.SQUARE_1_1, VideoQuality.UHD_4K): (2160, 2160),
+}
+
+
 class VideoProjectConfig:
     """视频项目配置"""
     
@@ -56,34 +188,8 @@ class VideoProjectConfig:
         self.resolution = self._calculate_resolution()
     
     def _calculate_resolution(self) -> Tuple[int, int]:
-        """根据画面比例和质量计算分辨率"""
-        # 基础分辨率（1080p）
-        base_resolutions = {
-            AspectRatio.VERTICAL_9_16: (1080, 1920),  # 竖屏
-            AspectRatio.HORIZONTAL_16_9: (1920, 1080),  # 横屏
-            AspectRatio.SQUARE_1_1: (1080, 1080)  # 方屏
-        }
-        
-        base_width, base_height = base_resolutions[self.aspect_ratio]
-        
-        # 根据质量调整
-        if self.quality == VideoQuality.HD_720P:
-            scale = 720 / 1080
-        elif self.quality == VideoQuality.FULL_HD_1080P:
-            scale = 1.0
-        elif self.quality == VideoQuality.UHD_4K:
-            scale = 2.0
-        else:
-            scale = 1.0
-        
-        width = int(base_width * scale)
-        height = int(base_height * scale)
-        
-        # 确保是偶数（FFmpeg要求）
-        width = width if width % 2 == 0 else width + 1
-        height = height if height % 2 == 0 else height + 1
-        
-        return (width, height)
+        """根据画面比例和质量查表得到分辨率"""
+        return _RESOLUTIONS[(self.aspect_ratio, self.quality)]
     
     def to_dict(self) -> Dict:
         """转换为字典"""
@@ -113,7 +219,8 @@ class CompositionOptimizer:
     """画面构图优化器"""
     
     def __init__(self):
-        self.storage = StorageService()
+        # 共享模块级存储客户端，避免每次构造都重建S3会话和连接池
+        self.storage = storage_manager
     
     def optimize_for_vertical(self, image: Image.Image) -> Image.Image:
         """
@@ -124,46 +231,15 @@ class CompositionOptimizer:
         2. 如果图像是方屏，上下添加边距
         3. 调整构图使主体居中
         """
-        target_ratio = 9 / 16
-        current_ratio = image.width / image.height
-        
-        if current_ratio > target_ratio:
-            # 图像太宽，需要裁剪
-            new_width = int(image.height * target_ratio)
-            left = (image.width - new_width) // 2
-            image = image.crop((left, 0, left + new_width, image.height))
-        elif current_ratio < target_ratio:
-            # 图像太高，需要裁剪
-            new_height = int(image.width / target_ratio)
-            top = (image.height - new_height) // 2
-            image = image.crop((0, top, image.width, top + new_height))
-        
-        return image
+        return _center_crop(image, 9 / 16)
     
     def optimize_for_horizontal(self, image: Image.Image) -> Image.Image:
         """优化图像以适配横屏（16:9）"""
-        target_ratio = 16 / 9
-        current_ratio = image.width / image.height
-        
-        if current_ratio < target_ratio:
-            # 图像太窄，需要裁剪
-            new_height = int(image.width / target_ratio)
-            top = (image.height - new_height) // 2
-            image = image.crop((0, top, image.width, top + new_height))
-        elif current_ratio > target_ratio:
-            # 图像太宽，需要裁剪
-            new_width = int(image.height * target_ratio)
-            left = (image.width - new_width) // 2
-            image = image.crop((left, 0, left + new_width, image.height))
-        
-        return image
+        return _center_crop(image, 16 / 9)
     
     def optimize_for_square(self, image: Image.Image) -> Image.Image:
         """优化图像以适配方屏（1:1）"""
-        size = min(image.width, image.height)
-        left = (image.width - size) // 2
-        top = (image.height - size) // 2
-        return image.crop((left, top, left + size, top + size))
+        return _center_crop(image, 1.0)
     
     def optimize_composition(
         self,
@@ -216,11 +292,8 @@ class CompositionOptimizer:
         if font_size is None:
             font_size = max(24, int(image.height * 0.04))
         
-        # 尝试使用系统字体，失败则使用默认字体
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
+        # 按字号缓存的字体（系统字体不可用时为默认字体）
+        font = _get_font(font_size)
         
         # 计算文字位置
         bbox = draw.textbbox((0, 0), text, font=font)
@@ -268,7 +341,7 @@ class VideoRenderingEngine:
         if self._initialized:
             return
         
-        self.storage = StorageService()
+        self.storage = storage_manager
         self.composition_optimizer = CompositionOptimizer()
         self._initialized = True
     
@@ -357,8 +430,20 @@ class VideoRenderingEngine:
             format=config.format
         )
         
+        # 优先使用硬件编码器；编译进FFmpeg但缺少对应硬件时会失败，回退到软件编码
+        hardware_args = _hardware_preview_encoder_args()
+        if hardware_args is not None:
+            try:
+                return self._render_video_internal(
+                    frames, preview_config, audio_path, encoder_args=hardware_args
+                )
+            except RuntimeError:
+                pass
+        
         # 渲染预览视频
-        return self._render_video_internal(frames, preview_config, audio_path)
+        return self._render_video_internal(
+            frames, preview_config, audio_path, encoder_args=PREVIEW_ENCODER_ARGS
+        )
     
     def render_video(
         self,
@@ -383,24 +468,14 @@ class VideoRenderingEngine:
         """
         start_time = datetime.now()
         
-        # 渲染视频
-        video_data = self._render_video_internal(frames, config, audio_path)
-        
         # 保存到存储
         if output_path is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             output_path = f"videos/rendered_{timestamp}.{config.format.value}"
         
-        # 保存文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{config.format.value}") as tmp:
-            tmp.write(video_data)
-            tmp_path = tmp.name
-        
-        # 上传到存储
-        storage_path = self.storage.upload_file(tmp_path, output_path)
-        
-        # 清理临时文件
-        Path(tmp_path).unlink()
+        # 渲染视频并直接从FFmpeg输出文件流式上传（S3 分片上传），不把整个视频读入内存
+        with self._render_video_file(frames, config, audio_path) as video_file:
+            storage_path = self.storage.upload_file(video_file, output_path)
         
         # 记录渲染时间
         render_time = (datetime.now() - start_time).total_seconds()
@@ -412,19 +487,47 @@ class VideoRenderingEngine:
         self,
         frames: List[bytes],
         config: VideoProjectConfig,
-        audio_path: Optional[str] = None
+        audio_path: Optional[str] = None,
+        encoder_args: Sequence[str] = FINAL_ENCODER_ARGS
     ) -> bytes:
         """
-        内部视频渲染方法（使用FFmpeg）
+        内部视频渲染方法（使用FFmpeg），返回完整的视频数据
         
         参数:
             frames: 分镜图像列表
             config: 项目配置
             audio_path: 音频文件路径（可选）
+            encoder_args: 视频编码器参数（编码器、preset、crf等）
         
         返回:
             视频数据
         """
+        with self._render_video_file(frames, config, audio_path, encoder_args) as video_file:
+            return video_file.read()
+    
+    @contextmanager
+    def _render_video_file(
+        self,
+        frames: List[bytes],
+        config: VideoProjectConfig,
+        audio_path: Optional[str] = None,
+        encoder_args: Sequence[str] = FINAL_ENCODER_ARGS
+    ) -> Iterator[BinaryIO]:
+        """
+        渲染视频并提供输出文件的只读文件对象
+        
+        FFmpeg输出写在临时目录中，退出上下文时删除；调用方可直接流式上传，
+        无需把整个视频读入内存。
+        
+        参数:
+            frames: 分镜图像列表
+            config: 项目配置
+            audio_path: 音频文件路径（可选）
+            encoder_args: 视频编码器参数（编码器、preset、crf等）
+        
+        返回:
+            视频文件对象（上下文管理器）
+        """
         if not frames:
             raise ValueError("至少需要一个分镜图像")
         
@@ -432,31 +535,22 @@ class VideoRenderingEngine:
         with tempfile.TemporaryDirectory() as tmpdir:
             tmpdir_path = Path(tmpdir)
             
-            # 保存所有帧
-            frame_paths = []
-            for i, frame_data in enumerate(frames):
-                # 加载并调整图像大小
-                image = Image.open(io.BytesIO(frame_data))
-                image = image.resize(config.resolution, Image.Resampling.LANCZOS)
-                
-                # 保存帧
-                frame_path = tmpdir_path / f"frame_{i:04d}.png"
-                image.save(frame_path)
-                frame_paths.append(frame_path)
-            
             # 计算帧率（基于总时长和帧数）
             total_seconds = config.duration_minutes * 60
             fps = max(1, len(frames) / total_seconds)
             fps = min(fps, 30)  # 限制最大帧率
             
-            # 构建FFmpeg命令
+            # 构建FFmpeg命令（帧经stdin传入，不落盘；缩放由FFmpeg的scale滤镜完成）
             output_path = tmpdir_path / f"output.{config.format.value}"
+            width, height = config.resolution
+            input_args, decode_size = self._frame_input(frames, config.resolution)
             
             cmd = [
                 "ffmpeg",
                 "-y",  # 覆盖输出文件
+                *input_args,
                 "-framerate", str(fps),
-                "-i", str(tmpdir_path / "frame_%04d.png"),
+                "-i", "pipe:0",
             ]
             
             # 添加音频（如果提供）
@@ -466,31 +560,107 @@ class VideoRenderingEngine:
             
             # 视频编码参数
             cmd.extend([
-                "-c:v", "libx264",
+                "-vf", f"scale={width}:{height}:flags=lanczos",
+                *encoder_args,
                 "-pix_fmt", "yuv420p",
-                "-preset", "medium",
-                "-crf", "23",
                 str(output_path)
             ])
             
-            # 执行FFmpeg命令
-            try:
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-            except subprocess.CalledProcessError as e:
-                raise RuntimeError(f"FFmpeg渲染失败: {e.stderr}")
-            except FileNotFoundError:
-                # FFmpeg未安装，返回模拟数据
-                print("警告: FFmpeg未安装，返回模拟视频数据")
-                return self._create_mock_video(frames, config)
+            # 执行FFmpeg命令（stderr写入临时文件，避免管道写满后与stdin写入互相阻塞）
+            log_path = tmpdir_path / "ffmpeg.log"
+            with open(log_path, 'w+b') as log_file:
+                try:
+                    proc = subprocess.Popen(
+                        cmd,
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.DEVNULL,
+                        stderr=log_file
+                    )
+                except FileNotFoundError:
+                    # FFmpeg未安装，返回模拟数据
+                    print("警告: FFmpeg未安装，返回模拟视频数据")
+                    yield io.BytesIO(self._create_mock_video(frames, config))
+                    return
+                
+                try:
+                    if decode_size is None:
+                        # PNG原样透传，由FFmpeg解码
+                        for frame_data in frames:
+                            proc.stdin.write(frame_data)
+                    else:
+                        self._write_frames(proc.stdin, frames, decode_size)
+                except BrokenPipeError:
+                    # FFmpeg提前退出，错误信息见日志
+                    pass
+                finally:
+                    try:
+                        proc.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                
+                if proc.wait() != 0:
+                    log_file.seek(0)
+                    stderr = log_file.read().decode("utf-8", errors="replace")
+                    raise RuntimeError(f"FFmpeg渲染失败: {stderr}")
             
-            # 读取输出视频
+            # 提供输出视频（临时目录在上下文退出后删除）
             with open(output_path, 'rb') as f:
-                return f.read()
+                yield f
+    
+    @staticmethod
+    def _frame_input(
+        frames: List[bytes],
+        resolution: Tuple[int, int]
+    ) -> Tuple[List[str], Optional[Tuple[int, int]]]:
+        """
+        根据帧的格式和尺寸选择FFmpeg输入方式（只读取文件头，不解码像素）
+        
+        参数:
+            frames: 分镜图像列表
+            resolution: 目标分辨率
+        
+        返回:
+            (FFmpeg输入参数, Python侧解码参数)；解码参数为None表示原样透传，
+            为分辨率元组时表示需要解码为rgb24，其中与目标分辨率不同则表示需要先缩放
+        """
+        headers = [Image.open(io.BytesIO(frame_data)) for frame_data in frames]
+        formats = {image.format for image in headers}
+        sizes = {image.size for image in headers}
+        
+        # 全部为PNG：原样透传，FFmpeg解码后直接缩放
+        if formats == {"PNG"}:
+            return ["-f", "image2pipe", "-c:v", "png"], None
+        
+        # 尺寸一致：以原始尺寸输出rgb24，缩放交给FFmpeg
+        if len(sizes) == 1:
+            (width, height), = sizes
+            return ["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}"], (width, height)
+        
+        # 尺寸不一致：rawvideo要求统一帧尺寸，只能先在Python侧缩放
+        width, height = resolution
+        return ["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}"], resolution
+    
+    @staticmethod
+    def _write_frames(
+        stream,
+        frames: List[bytes],
+        resolution: Tuple[int, int]
+    ) -> None:
+        """
+        逐帧解码并写入FFmpeg的stdin（帧原始尺寸与resolution不同时先缩放）
+        
+        LANCZOS缩放是CPU密集型，帧数较多时分散到多个进程；
+        executor.map 按输入顺序产出结果，写入与后续帧的处理重叠进行。
+        """
+        tasks = [(frame_data, resolution) for frame_data in frames]
+        workers = min(os.cpu_count() or 1, len(tasks))
+        if len(tasks) >= FRAME_PREPARE_PARALLEL_MIN_FRAMES and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for pixels in executor.map(_prepare_frame, tasks, chunksize=4):
+                    stream.write(pixels)
+        else:
+            for task in tasks:
+                stream.write(_prepare_frame(task))
     
     def _create_mock_video(
         self,
@@ -9,7 +9,7 @@ from enum import Enum
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, field
 
-from app.services.sound_effect_matcher import SoundEffectMatcher
+from app.services.sound_effect_matcher import get_sound_effect_matcher
 from app.services.character_consistency import CharacterConsistencyEngine
 from app.services.lip_sync import ChineseLipSyncEngine
 from app.services.video_rendering import VideoRenderingEngine, AspectRatio, VideoQuality
@@ -149,7 +149,7 @@ class WorkflowOrchestrator:
             return
         
         # 初始化各个引擎
-        self.sound_matcher = SoundEffectMatcher()
+        self.sound_matcher = get_sound_effect_matcher()
         self.character_engine = CharacterConsistencyEngine()
         self.lip_sync_engine = ChineseLipSyncEngine()
         self.video_engine = VideoRenderingEngine()
@@ -149,15 +149,17 @@ export const storyboardApi = {
     }
   },
 
-  async reorderStoryboards(_projectId: string, frameOrders: { id: string; frame_number: number }[]): Promise<void> {
-    // Supabase doesn't support bulk update easily in client, so we loop (not ideal for large lists but fine for MVP)
-    // Or we could use an RPC function if we created one.
-    
-    const updates = frameOrders.map(({ id, frame_number }) => 
-      supabase.from('scenes').update({ sequence_number: frame_number }).eq('id', id)
-    );
-
-    await Promise.all(updates);
+  async reorderStoryboards(projectId: string, frameOrders: { id: string; frame_number: number }[]): Promise<void> {
+    // Single RPC call = single transaction; the (project_id, sequence_number)
+    // unique constraint is deferred, so swapped numbers are checked at commit.
+    const { error } = await supabase.rpc('reorder_scenes', {
+      p_project_id: projectId,
+      p_orders: frameOrders.map(({ id, frame_number }) => ({ id, sequence_number: frame_number })),
+    });
+
+    if (error) {
+      throw error;
+    }
   },
 
   async generateImage(id: string, characterId?: string, style: string = 'anime', referenceImageUrl?: string): Promise<{ image_url: string }> {
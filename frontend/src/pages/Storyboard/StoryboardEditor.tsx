@@ -136,7 +136,7 @@ export function StoryboardEditor() {
       await storyboardApi.reorderStoryboards(projectId, frameOrders);
       alert('顺序已保存');
     } catch (err: any) {
-      alert('保存失败：' + (err.response?.data?.detail || '未知错误'));
+      alert('保存失败：' + (err.response?.data?.detail || err.message || '未知错误'));
     }
   };
 
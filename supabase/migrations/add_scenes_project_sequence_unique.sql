@@ -0,0 +1,61 @@
+-- 1) Renumber projects that already contain duplicate sequence numbers
+--    (older MAX+1 logic in the backend and frontend could race)
+with duplicated as (
+  select project_id
+  from public.scenes
+  group by project_id
+  having count(*) <> count(distinct sequence_number)
+),
+renumbered as (
+  select s.id,
+         row_number() over (
+           partition by s.project_id
+           order by s.sequence_number, s.created_at, s.id
+         ) as new_sequence_number
+  from public.scenes s
+  join duplicated d on d.project_id = s.project_id
+)
+update public.scenes s
+  set sequence_number = r.new_sequence_number
+  from renumbered r
+  where s.id = r.id
+    and s.sequence_number is distinct from r.new_sequence_number;
+
+-- 2) Unique (project_id, sequence_number), checked at commit so swaps inside
+--    one transaction do not trip over intermediate states
+do $$
+begin
+  if exists (
+    select 1
+    from pg_constraint
+    where conname = 'scenes_project_sequence_key'
+      and not condeferrable
+  ) then
+    alter table public.scenes
+      drop constraint scenes_project_sequence_key;
+  end if;
+
+  if not exists (
+    select 1
+    from pg_constraint
+    where conname = 'scenes_project_sequence_key'
+  ) then
+    alter table public.scenes
+      add constraint scenes_project_sequence_key
+      unique (project_id, sequence_number)
+      deferrable initially deferred;
+  end if;
+end $$;
+
+-- 3) Reorder all scenes of a project in a single transaction
+--    p_orders: [{"id": "<scene uuid>", "sequence_number": 1}, ...]
+create or replace function public.reorder_scenes(p_project_id uuid, p_orders jsonb)
+returns void
+language sql
+as $$
+  update public.scenes s
+    set sequence_number = o.sequence_number
+    from jsonb_to_recordset(p_orders) as o(id uuid, sequence_number integer)
+    where s.id = o.id
+      and s.project_id = p_project_id;
+$$;
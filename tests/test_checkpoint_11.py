@@ -12,7 +12,7 @@ from app.services.workflow_orchestrator import (
     WorkflowStatus,
     WorkflowStep
 )
-from app.services.sound_effect_matcher import SoundEffectMatcher
+from app.services.sound_effect_matcher import SoundEffectMatcher, get_sound_effect_matcher
 from app.services.character_consistency import CharacterConsistencyEngine
 from app.services.lip_sync import ChineseLipSyncEngine
 from app.services.video_rendering import VideoRenderingEngine
@@ -343,8 +343,8 @@ class TestSystemReadiness:
     def test_all_services_singleton(self):
         """测试所有服务使用单例模式"""
         # 音效匹配器
-        matcher1 = SoundEffectMatcher()
-        matcher2 = SoundEffectMatcher()
+        matcher1 = get_sound_effect_matcher()
+        matcher2 = get_sound_effect_matcher()
         assert matcher1 is matcher2
         
         # 角色一致性引擎
@@ -382,7 +382,7 @@ class TestSystemReadiness:
         orchestrator = WorkflowOrchestrator()
         
         # 验证所有引擎都已初始化
-        assert orchestrator.sound_matcher._initialized
+        assert orchestrator.sound_matcher is get_sound_effect_matcher()
         assert orchestrator.character_engine._initialized
         assert orchestrator.lip_sync_engine._initialized
         assert orchestrator.video_engine._initialized
@@ -270,6 +270,27 @@ class TestAudioAnalysis:
         assert data["sample_rate"] == 16000
         assert data["transcript"] == "你好"
         assert "created_at" in data
+    
+    def test_audio_analysis_to_json_and_dump(self, tmp_path):
+        """测试音频分析结果JSON序列化与写入文件"""
+        import json
+        
+        phonemes = [
+            {"phoneme": "n", "start_time": 0.0, "end_time": 0.1, "tone": 0, "word": "你"}
+        ]
+        
+        analysis = AudioAnalysis(
+            phonemes=phonemes,
+            duration=1.0,
+            sample_rate=16000,
+            transcript="你好"
+        )
+        
+        assert json.loads(analysis.to_json()) == analysis.to_dict()
+        
+        path = tmp_path / "analysis.json"
+        analysis.dump(str(path))
+        assert json.loads(path.read_text(encoding="utf-8")) == analysis.to_dict()
 
 
 class TestLipKeyframe:
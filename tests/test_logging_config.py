@@ -0,0 +1,37 @@
+"""日志配置测试"""
+import logging
+from logging.handlers import QueueHandler
+
+from app.core.logging_config import setup_queue_logging, shutdown_queue_logging
+
+
+class TestQueueLogging:
+    """队列日志测试"""
+
+    def test_records_reach_original_handlers_via_queue(self):
+        """测试日志经由队列写到原处理器，关闭后恢复原处理器"""
+        root = logging.getLogger()
+        original_handlers = root.handlers[:]
+        original_level = root.level
+        records = []
+
+        class ListHandler(logging.Handler):
+            def emit(self, record):
+                records.append(record)
+
+        capture = ListHandler()
+        root.addHandler(capture)
+        try:
+            listener = setup_queue_logging()
+            assert setup_queue_logging() is listener
+            assert all(isinstance(h, QueueHandler) for h in root.handlers)
+
+            logging.getLogger("app.test").warning("导出失败 %s", "a.png")
+            shutdown_queue_logging()
+
+            assert [r.getMessage() for r in records] == ["导出失败 a.png"]
+            assert capture in root.handlers
+        finally:
+            shutdown_queue_logging()
+            root.handlers[:] = original_handlers
+            root.setLevel(original_level)
@@ -0,0 +1,157 @@
+"""监控服务测试"""
+import pytest
+
+from app.services.monitoring import (
+    MetricType,
+    AlertLevel,
+    Metric,
+    Alert,
+    MonitoringService,
+    get_monitoring_service
+)
+
+
+class TestMetric:
+    """指标测试"""
+
+    def test_histogram_percentiles(self):
+        """测试直方图百分位数"""
+        metric = Metric("latency", MetricType.HISTOGRAM)
+        for i in range(100):
+            metric.observe(float(i))
+
+        assert metric.get_percentiles([50, 95, 99]) == [50.0, 95.0, 99.0]
+        assert metric.get_percentile(50) == 50.0
+
+    def test_histogram_keeps_recent_samples(self):
+        """测试直方图只保留最近的样本"""
+        metric = Metric("latency", MetricType.HISTOGRAM)
+        for i in range(1500):
+            metric.observe(float(i))
+
+        assert len(metric.samples) == 1000
+        assert metric.samples[0] == 500.0
+        assert metric.total_count == 1500
+        assert metric.get_value() == pytest.approx(sum(range(500, 1500)) / 1000)
+
+    def test_mismatched_update_is_ignored(self):
+        """测试与指标类型不匹配的更新被忽略"""
+        gauge = Metric("gauge", MetricType.GAUGE)
+        gauge.inc(5)
+        gauge.observe(3)
+        gauge.set(2)
+
+        assert gauge.value == 2
+        assert len(gauge.samples) == 0
+
+    def test_update_dispatches_by_type(self):
+        """测试update按指标类型分派"""
+        counter = Metric("counter", MetricType.COUNTER)
+        counter.update(2)
+        counter.update(3)
+
+        assert counter.value == 5
+
+    def test_labels_render_cache_invalidation(self):
+        """测试标签字符串在标签变更后重新渲染"""
+        metric = Metric("requests", MetricType.COUNTER)
+        assert metric._render_labels() == ""
+
+        metric.inc(labels={"method": "GET"})
+        assert metric._render_labels() == '{method="GET"}'
+
+        metric.inc(labels={"path": "/api"})
+        assert metric._render_labels() == '{method="GET",path="/api"}'
+
+
+class TestAlert:
+    """告警测试"""
+
+    @pytest.mark.parametrize("comparison,expected", [
+        (">", [False, False, True]),
+        ("<", [True, False, False]),
+        (">=", [False, True, True]),
+        ("<=", [True, True, False]),
+        ("==", [False, True, False]),
+    ])
+    def test_check_comparison(self, comparison, expected):
+        """测试各比较运算符"""
+        alert = Alert("test", AlertLevel.WARNING, "msg", "metric", 1.0, comparison)
+
+        assert [alert.check(v) for v in (0.5, 1.0, 2.0)] == expected
+
+    def test_trigger_count_on_transition(self):
+        """测试仅在状态从未触发变为触发时计数"""
+        alert = Alert("test", AlertLevel.WARNING, "msg", "metric", 1.0, ">")
+
+        alert.check(2.0)
+        alert.check(3.0)
+        alert.check(0.0)
+        alert.check(2.0)
+
+        assert alert.trigger_count == 2
+        assert alert.triggered_at is not None
+
+
+class TestCheckAlerts:
+    """批量告警检查测试"""
+
+    def test_check_alerts_trigger_and_reset(self):
+        """测试告警触发、复位与历史记录"""
+        service = MonitoringService()
+        gauge = service.register_metric("connections", MetricType.GAUGE)
+        service.register_alert("high", AlertLevel.WARNING, "msg", "connections", 50, ">")
+        service.register_alert("low", AlertLevel.INFO, "msg", "connections", 10, "<=")
+        service.register_alert("missing", AlertLevel.ERROR, "msg", "no_such_metric", 0, ">=")
+
+        gauge.set(60)
+        triggered = service.check_alerts()
+        assert [a["name"] for a in triggered] == ["high"]
+        assert triggered[0]["metric_value"] == 60
+
+        gauge.set(5)
+        triggered = service.check_alerts()
+        assert [a["name"] for a in triggered] == ["low"]
+        assert service.alerts["high"].triggered is False
+        assert service.alerts["missing"].triggered is False
+        assert len(service.get_alert_history()) == 2
+
+
+class TestPrometheusExport:
+    """Prometheus导出测试"""
+
+    def test_histogram_quantile_lines(self):
+        """测试直方图百分位数行格式正确"""
+        service = MonitoringService()
+        metric = service.register_metric("latency_seconds", MetricType.HISTOGRAM)
+        metric.observe(0.2, labels={"path": "/api"})
+
+        output = service.export_prometheus_format()
+
+        assert 'latency_seconds{quantile="0.50",path="/api"} 0.2' in output
+        assert 'latency_seconds_bucket{le="0.25",path="/api"} 1' in output
+        assert 'latency_seconds_bucket{le="+Inf",path="/api"} 1' in output
+        assert 'latency_seconds_count{path="/api"} 1' in output
+
+    def test_export_cache_invalidated_by_counter(self):
+        """测试计数器变更后导出缓存失效"""
+        service = MonitoringService()
+        metric = service.register_metric("requests_total", MetricType.COUNTER)
+
+        first = service.export_prometheus_format()
+        assert service.export_prometheus_format() is first
+
+        metric.inc()
+        assert "requests_total 1.0" in service.export_prometheus_format()
+
+
+class TestGlobalMonitoringService:
+    """全局监控服务测试"""
+
+    def test_get_monitoring_service_is_singleton_with_defaults(self):
+        """测试全局实例延迟初始化并注册默认指标和告警"""
+        service = get_monitoring_service()
+
+        assert service is get_monitoring_service()
+        assert service.get_metric("api_requests_total") is not None
+        assert "high_db_connections" in service.alerts
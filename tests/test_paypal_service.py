@@ -0,0 +1,174 @@
+"""PayPal服务测试"""
+import base64
+import json
+import zlib
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+from app.models.user import SubscriptionTier
+from app.services.paypal_service import PayPalService
+
+
+CERT_URL = "https://api.paypal.com/v1/notifications/certs/CERT-TEST"
+WEBHOOK_ID = "WH-TEST"
+BODY = '{"event_type": "PAYMENT.CAPTURE.COMPLETED"}'
+
+
+@pytest.fixture(scope="module")
+def signing_key():
+    """生成测试用RSA密钥和自签名证书"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "paypal-test")])
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.utcnow())
+        .not_valid_after(datetime.utcnow() + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return key, cert
+
+
+def _signed_headers(key, body=BODY):
+    message = f"T-1|2024-01-01T00:00:00Z|{WEBHOOK_ID}|{zlib.crc32(body.encode())}"
+    signature = key.sign(message.encode(), padding.PKCS1v15(), hashes.SHA256())
+    return {
+        "paypal-transmission-id": "T-1",
+        "paypal-transmission-time": "2024-01-01T00:00:00Z",
+        "paypal-transmission-sig": base64.b64encode(signature).decode(),
+        "paypal-cert-url": CERT_URL,
+        "paypal-auth-algo": "SHA256withRSA",
+    }
+
+
+class TestVerifyWebhookSignature:
+    """Webhook签名验证测试"""
+
+    @pytest.mark.asyncio
+    async def test_valid_signature(self, signing_key):
+        """测试有效签名通过验证"""
+        key, cert = signing_key
+        service = PayPalService(db=None)
+
+        with patch("app.services.paypal_service._load_webhook_cert", return_value=cert):
+            assert await service.verify_webhook_signature(_signed_headers(key), BODY, WEBHOOK_ID)
+
+    @pytest.mark.asyncio
+    async def test_tampered_body_rejected(self, signing_key):
+        """测试篡改请求体后验证失败"""
+        key, cert = signing_key
+        service = PayPalService(db=None)
+
+        with patch("app.services.paypal_service._load_webhook_cert", return_value=cert):
+            assert not await service.verify_webhook_signature(_signed_headers(key), BODY + " ", WEBHOOK_ID)
+
+    @pytest.mark.asyncio
+    async def test_foreign_cert_url_rejected(self, signing_key):
+        """测试非PayPal域名的证书地址被拒绝"""
+        key, cert = signing_key
+        service = PayPalService(db=None)
+        headers = _signed_headers(key)
+        headers["paypal-cert-url"] = "https://evil.example.com/cert.pem"
+
+        with patch("app.services.paypal_service._load_webhook_cert", return_value=cert) as load:
+            assert not await service.verify_webhook_signature(headers, BODY, WEBHOOK_ID)
+            load.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_cert_downloaded_once_via_shared_client(self, signing_key):
+        """测试证书通过共享异步客户端下载，并按地址缓存"""
+        key, cert = signing_key
+        service = PayPalService(db=None)
+        pem = cert.public_bytes(serialization.Encoding.PEM)
+        client = MagicMock()
+        client.get = AsyncMock(return_value=httpx.Response(200, content=pem, request=httpx.Request("GET", CERT_URL)))
+
+        with patch.object(service, "_http", AsyncMock(return_value=client)), \
+                patch.dict("app.services.paypal_service._webhook_certs", clear=True):
+            assert await service.verify_webhook_signature(_signed_headers(key), BODY, WEBHOOK_ID)
+            assert await service.verify_webhook_signature(_signed_headers(key), BODY, WEBHOOK_ID)
+
+        client.get.assert_awaited_once_with(CERT_URL)
+
+
+class TestActivateSubscription:
+    """订阅激活测试"""
+
+    @pytest.mark.asyncio
+    async def test_capture_failed_skips_activation(self):
+        """测试支付捕获未完成时不激活订阅"""
+        db = MagicMock()
+        service = PayPalService(db=db)
+        service.capture_order = AsyncMock(return_value={"status": "failed"})
+
+        result = await service.activate_subscription("user-1", "ORDER-1", SubscriptionTier.PROFESSIONAL)
+
+        assert result["success"] is False
+        assert result["message"] == "支付未完成"
+        db.add.assert_not_called()
+        db.commit.assert_not_called()
+
+
+class TestCaptureOrder:
+    """订单捕获测试"""
+
+    @pytest.mark.asyncio
+    async def test_capture_sends_idempotency_key_and_reuses_response(self):
+        """测试捕获请求带幂等键，且订单详情取自捕获响应"""
+        order = {
+            "id": "ORDER-1",
+            "status": "COMPLETED",
+            "payer": {"email_address": "buyer@example.com"},
+            "purchase_units": [{"payments": {"captures": [
+                {"id": "TX-1", "status": "COMPLETED", "amount": {"value": "9.99", "currency_code": "USD"}}
+            ]}}],
+        }
+        response = MagicMock(status_code=201, content=json.dumps(order).encode())
+        response.json.return_value = order
+        client = MagicMock()
+        client.post = AsyncMock(return_value=response)
+
+        service = PayPalService(db=None)
+        service._get_access_token = AsyncMock(return_value="token")
+        service._http = AsyncMock(return_value=client)
+
+        capture_result, details = await service.capture_and_detail("ORDER-1")
+
+        headers = client.post.call_args.kwargs["headers"]
+        assert headers["PayPal-Request-Id"] == "capture-ORDER-1"
+        assert client.post.await_count == 1
+        assert capture_result["status"] == "completed"
+        assert capture_result["transaction_id"] == "TX-1"
+        assert details["payer"]["email_address"] == "buyer@example.com"
+
+
+class TestCreateOrder:
+    """订单创建测试"""
+
+    @pytest.mark.asyncio
+    async def test_create_order_sends_serialized_body(self):
+        """测试订单请求体预先序列化为JSON字节"""
+        order = {"id": "ORDER-1", "status": "CREATED", "links": [{"rel": "approve", "href": "https://pay"}]}
+        response = MagicMock(status_code=201, content=json.dumps(order).encode())
+        client = MagicMock()
+        client.post = AsyncMock(return_value=response)
+
+        service = PayPalService(db=None)
+        service._get_access_token = AsyncMock(return_value="token")
+        service._http = AsyncMock(return_value=client)
+
+        result = await service.create_order(9.99)
+
+        body = json.loads(client.post.call_args.kwargs["content"])
+        assert body["purchase_units"][0]["amount"]["value"] == "9.99"
+        assert result["approval_url"] == "https://pay"
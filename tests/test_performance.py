@@ -40,6 +40,33 @@ class TestPerformanceOptimizer:
         assert "user_id:123" in key3
         assert "asset_type:image" in key3
     
+    def test_key_builder_matches_cache_key(self):
+        """测试专用键构造函数与通用cache_key结果一致"""
+        optimizer = PerformanceOptimizer()
+        build_key = optimizer._make_key_builder("user")
+        
+        for args, kwargs in [
+            (("123",), {}),
+            (("u1", 2, 1.5, True), {}),
+            ((), {}),
+            ((("proj1", 3),), {}),
+            (("u1",), {"tenant": "t1"}),
+        ]:
+            assert build_key(args, kwargs) == optimizer.cache_key("user", *args, **kwargs)
+    
+    def test_cache_key_non_primitive_args(self):
+        """测试非原始类型参数的缓存键"""
+        optimizer = PerformanceOptimizer()
+        
+        # 原始类型短元组直接拼接
+        assert optimizer.cache_key("frames", ("proj1", 3)) == "frames:proj1-3"
+        
+        # 其他参数生成8位十六进制摘要，且结果稳定
+        key = optimizer.cache_key("search", {"q": "猫"})
+        assert len(key.split(":")[1]) == 8
+        assert key == optimizer.cache_key("search", {"q": "猫"})
+        assert key != optimizer.cache_key("search", {"q": "狗"})
+    
     @pytest.mark.asyncio
     async def test_cached_decorator(self):
         """测试缓存装饰器"""
@@ -76,6 +103,89 @@ class TestPerformanceOptimizer:
             assert result3 == 20
             assert call_count == 2
     
+    @pytest.mark.asyncio
+    async def test_cached_decorator_single_flight(self):
+        """测试冷键并发未命中时只计算一次"""
+        optimizer = PerformanceOptimizer()
+        store = {}
+        call_count = 0
+        
+        async def fake_get(key):
+            return store.get(key)
+        
+        async def fake_set(key, value, expire=None):
+            store[key] = value
+            return True
+        
+        with patch.object(cache_manager, 'get', side_effect=fake_get), \
+             patch.object(cache_manager, 'set', side_effect=fake_set):
+            
+            @optimizer.cached("test", ttl=60)
+            async def slow_function(value: int):
+                nonlocal call_count
+                call_count += 1
+                await asyncio.sleep(0.01)
+                return value * 2
+            
+            results = await asyncio.gather(*(slow_function(5) for _ in range(5)))
+            
+            assert results == [10] * 5
+            assert call_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_cached_many_decorator(self):
+        """测试批量缓存装饰器只计算未命中的ID"""
+        optimizer = PerformanceOptimizer()
+        
+        with patch.object(cache_manager, 'mget', new_callable=AsyncMock) as mock_mget, \
+             patch.object(cache_manager, 'set', new_callable=AsyncMock) as mock_set:
+            mock_mget.return_value = [{"id": "a"}, None]
+            
+            @optimizer.cached_many("project", ttl=60)
+            async def get_projects(project_ids):
+                return {pid: {"id": pid} for pid in project_ids}
+            
+            results = await get_projects(["a", "b"])
+            
+            assert results == {"a": {"id": "a"}, "b": {"id": "b"}}
+            mock_mget.assert_awaited_once_with(["project:a", "project:b"])
+            mock_set.assert_awaited_once_with("project:b", {"id": "b"}, expire=60)
+    
+    @pytest.mark.asyncio
+    async def test_cache_manager_roundtrip(self):
+        """测试缓存值序列化往返（含datetime/UUID）"""
+        import uuid
+        from app.core.cache import CacheManager
+        
+        store = {}
+        fake_redis = Mock()
+        fake_redis.set = AsyncMock(side_effect=lambda k, v: store.__setitem__(k, v))
+        fake_redis.get = AsyncMock(side_effect=lambda k: store.get(k))
+        fake_redis.mget = AsyncMock(side_effect=lambda keys: [store.get(k) for k in keys])
+        
+        manager = CacheManager()
+        manager._redis = fake_redis
+        
+        project_id = uuid.uuid4()
+        await manager.set("p", {"id": project_id, "updated_at": datetime(2024, 1, 2, 3, 4, 5), "name": "项目"})
+        
+        value = await manager.get("p")
+        assert value == {"id": str(project_id), "updated_at": "2024-01-02T03:04:05", "name": "项目"}
+        assert await manager.mget(["p", "missing"]) == [value, None]
+    
+    def test_cached_result_strips_orm_state(self):
+        """测试ORM实例转换为不含会话状态的字典"""
+        from app.services.performance import _to_cacheable
+        
+        class FakeRow:
+            def __init__(self, name):
+                self._sa_instance_state = object()
+                self.name = name
+        
+        assert _to_cacheable(FakeRow("a")) == {"name": "a"}
+        assert _to_cacheable([FakeRow("a"), FakeRow("b")]) == [{"name": "a"}, {"name": "b"}]
+        assert _to_cacheable({"name": "a"}) == {"name": "a"}
+    
     @pytest.mark.asyncio
     async def test_invalidate_cache(self):
         """测试缓存失效"""
@@ -108,6 +218,48 @@ class TestPerformanceOptimizer:
 class TestDatabaseOptimizer:
     """数据库优化器测试"""
     
+    def test_eager_loading_strategy_by_relationship(self):
+        """测试集合关系使用selectinload，单值关系使用joinedload"""
+        from sqlalchemy import Column, ForeignKey, Integer, select
+        from sqlalchemy.orm import declarative_base, relationship
+        
+        LocalBase = declarative_base()
+        
+        class Parent(LocalBase):
+            __tablename__ = "parents"
+            id = Column(Integer, primary_key=True)
+            children = relationship("Child", back_populates="parent")
+        
+        class Child(LocalBase):
+            __tablename__ = "children"
+            id = Column(Integer, primary_key=True)
+            parent_id = Column(Integer, ForeignKey("parents.id"))
+            parent = relationship("Parent", back_populates="children")
+        
+        parent_query = DatabaseOptimizer.optimize_query_with_eager_loading(select(Parent), Parent.children)
+        child_query = DatabaseOptimizer.optimize_query_with_eager_loading(select(Child), Child.parent)
+        
+        # selectinload 不在主查询中JOIN子表，joinedload 则JOIN父表
+        assert "children" not in str(parent_query)
+        assert "JOIN parents" in str(child_query)
+    
+    def test_add_indexes_is_idempotent(self):
+        """测试添加索引可重复执行并跳过不存在的表"""
+        from sqlalchemy import create_engine, inspect, text
+        
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE projects (id TEXT PRIMARY KEY, user_id TEXT, name TEXT, updated_at DATETIME)"
+            ))
+        
+        created = DatabaseOptimizer.add_indexes(engine)
+        assert created == ["idx_projects_user_updated_id"]
+        assert DatabaseOptimizer.add_indexes(engine) == created
+        
+        index_names = {index["name"] for index in inspect(engine).get_indexes("projects")}
+        assert "idx_projects_user_updated_id" in index_names
+    
     def test_paginate_query(self):
         """测试分页查询"""
         # 创建模拟查询对象
@@ -146,6 +298,43 @@ class TestDatabaseOptimizer:
         
         # 验证偏移量
         mock_query.offset.assert_called_with(80)
+    
+    def test_paginate_query_keyset(self):
+        """测试键集分页按游标逐页读取"""
+        from sqlalchemy import Column, Integer, create_engine
+        from sqlalchemy.orm import Session, declarative_base
+        
+        LocalBase = declarative_base()
+        
+        class Item(LocalBase):
+            __tablename__ = "items"
+            id = Column(Integer, primary_key=True)
+            rank = Column(Integer, nullable=False)
+        
+        engine = create_engine("sqlite://")
+        LocalBase.metadata.create_all(engine)
+        
+        with Session(engine) as session:
+            # rank 有重复值，id 作为决胜列保证顺序唯一
+            session.add_all(Item(id=i, rank=i // 2) for i in range(7))
+            session.commit()
+            
+            seen = []
+            cursor = None
+            while True:
+                result = DatabaseOptimizer.paginate_query(
+                    session.query(Item),
+                    page_size=3,
+                    keyset_columns=(Item.rank, Item.id),
+                    cursor=cursor
+                )
+                seen.extend(item.id for item in result["items"])
+                if not result["has_more"]:
+                    break
+                cursor = result["next_cursor"]
+            
+            assert seen == [6, 5, 4, 3, 2, 1, 0]
+            assert "total" not in result
 
 
 class TestAsyncTask:
@@ -385,6 +574,14 @@ class TestCacheIntegration:
             # 验证已删除
             assert not await cache_manager.exists("test_key")
 
+    
+    def test_cache_serializes_non_str_keys(self):
+        """测试非字符串键的字典可以缓存（与json.dumps行为一致）"""
+        from app.core.serialization import dumps, loads
+        
+        assert loads(dumps({1: "a", None: "b"})) == {"1": "a", "null": "b"}
+        assert loads(dumps({"big": 1 << 70})) == {"big": 1 << 70}
+
 
 class TestPerformanceMetrics:
     """性能指标测试"""
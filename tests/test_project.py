@@ -1,5 +1,7 @@
 """项目管理单元测试"""
 import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
 from uuid import uuid4
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -384,3 +386,23 @@ class TestProjectPermissions:
         # 验证项目仍然存在
         existing_project = await service.get_project(project.id, user1.id)
         assert existing_project is not None
+
+
+@pytest.mark.asyncio
+class TestProjectUpdateSession:
+    """项目更新的会话处理测试（不依赖数据库）"""
+    
+    async def test_update_keeps_identity_map_instance_attached(self):
+        """UPDATE ... RETURNING 返回的实例不移出会话，提交后刷新"""
+        project = SimpleNamespace(name="新名称")
+        db = MagicMock()
+        db.execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=MagicMock(return_value=project)))
+        db.commit = AsyncMock()
+        db.refresh = AsyncMock()
+        
+        result = await ProjectService(db).update_project(uuid4(), uuid4(), ProjectUpdate(name="新名称"))
+        
+        assert result is project
+        db.expunge.assert_not_called()
+        db.commit.assert_awaited_once()
+        db.refresh.assert_awaited_once_with(project)
@@ -72,7 +72,7 @@ class TestProjectExportService:
         )
         
         # 验证ZIP文件
-        assert isinstance(zip_buffer, BytesIO), "应该返回BytesIO对象"
+        assert zip_buffer.tell() == 0, "应该返回定位到开头的文件对象"
         
         # 读取ZIP内容
         with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
@@ -208,3 +208,177 @@ class TestProjectExportService:
                     json.loads(json_content)
                 except json.JSONDecodeError:
                     pytest.fail(f"{filename} 不是有效的JSON格式")
+
+
+class TestExportJsonSerialization:
+    """导出清单JSON序列化测试"""
+    
+    def test_dump_json_native_types(self):
+        """测试datetime与UUID直接序列化，格式与isoformat/str一致"""
+        import uuid
+        from datetime import datetime
+        from app.core.serialization import dumps
+        
+        item_id = uuid.uuid4()
+        created_at = datetime(2024, 1, 2, 3, 4, 5, 678000)
+        
+        data = json.loads(dumps({"id": item_id, "name": "角色", "created_at": created_at, "character_id": None}, indent=True))
+        
+        assert data == {
+            "id": str(item_id),
+            "name": "角色",
+            "created_at": created_at.isoformat(),
+            "character_id": None
+        }
+
+
+class TestExportFilename:
+    """导出文件名测试"""
+    
+    @pytest.mark.parametrize("name,expected", [
+        ("Test Export Project", "Test_Export_Project"),
+        ("我的短剧: 第1集/终章!", "我的短剧_第1集终章"),
+        ("  a-b_c?*  ", "a-b_c"),
+        ("①²", "①²"),
+    ])
+    def test_unsafe_characters_removed(self, name, expected):
+        """测试移除不安全字符，结果与逐字符isalnum过滤一致"""
+        from types import SimpleNamespace
+        from unittest.mock import MagicMock
+        
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = SimpleNamespace(name=name)
+        
+        filename = ProjectExportService(db).get_export_filename("0123456789abcdef")
+        
+        legacy = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).strip().replace(' ', '_')
+        assert filename == f"{expected}_01234567.zip"
+        assert expected == legacy
+
+
+class TestExportMedia:
+    """导出媒体文件测试"""
+    
+    def test_add_media_to_zip_downloads_concurrently_and_skips_failures(self, caplog):
+        """测试媒体文件并发下载写入ZIP，下载失败的文件被跳过并记录警告"""
+        from unittest.mock import patch
+        
+        def fake_stream(object_key, chunk_size):
+            if "missing" in object_key:
+                raise FileNotFoundError(object_key)
+            return iter([object_key[:3].encode(), object_key[3:].encode()])
+        
+        media = [
+            ("/storage/chars/a.png", "characters/1/reference_image"),
+            ("https://s3.example.com/frames/b.jpg", "storyboard/frame_0001"),
+            ("/storage/audio/missing.mp3", "audio/2"),
+        ]
+        
+        zip_buffer = BytesIO()
+        with patch("app.services.project_export.storage_manager") as storage:
+            storage.stream_file.side_effect = fake_stream
+            with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
+                ProjectExportService(None)._add_media_to_zip(zip_file, media)
+        
+        with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
+            assert sorted(zip_file.namelist()) == [
+                "characters/1/reference_image.png",
+                "storyboard/frame_0001.jpg"
+            ]
+            assert zip_file.read("storyboard/frame_0001.jpg") == b"frames/b.jpg"
+            assert all(info.compress_type == zipfile.ZIP_STORED for info in zip_file.infolist())
+        
+        warnings = [r for r in caplog.records if r.name == "app.services.project_export"]
+        assert len(warnings) == 1
+        assert "/storage/audio/missing.mp3" in warnings[0].getMessage()
+        assert warnings[0].exc_info is not None
+    
+    def test_collect_media_skips_missing_urls(self):
+        """测试媒体收集跳过空URL，ZIP内路径与清单一致"""
+        from types import SimpleNamespace
+        
+        characters = [
+            SimpleNamespace(id=1, reference_image_url="/storage/a.png", consistency_model_url=None),
+            SimpleNamespace(id=2, reference_image_url="/storage/b.png", consistency_model_url="/storage/b.safetensors"),
+        ]
+        frames = [
+            SimpleNamespace(sequence_number=1, image_url="/storage/f1.jpg"),
+            SimpleNamespace(sequence_number=2, image_url=None),
+        ]
+        audio_tracks = [SimpleNamespace(id=7, audio_file_url="/storage/t.mp3")]
+        
+        assert ProjectExportService._collect_media(characters, frames, audio_tracks) == [
+            ("/storage/a.png", "characters/1/reference_image"),
+            ("/storage/b.png", "characters/2/reference_image"),
+            ("/storage/b.safetensors", "characters/2/consistency_model"),
+            ("/storage/f1.jpg", "storyboard/frame_0001"),
+            ("/storage/t.mp3", "audio/7"),
+        ]
+    
+    def test_export_project_compresses_manifests_only(self):
+        """测试JSON清单以deflate压缩，媒体文件直接存储"""
+        from types import SimpleNamespace
+        from unittest.mock import MagicMock, patch
+        
+        project = SimpleNamespace(
+            id="p1", name="项目", aspect_ratio="9:16", duration_minutes=1.0,
+            script="剧本" * 200, created_at=None, updated_at=None,
+            characters=[], audio_tracks=[],
+            storyboard_frames=[SimpleNamespace(
+                id="f1", sequence_number=1, character_id=None, scene_description="场景",
+                image_url="/storage/f1.jpg", duration_seconds=2.0,
+                lip_sync_keyframes=None, created_at=None
+            )]
+        )
+        db = MagicMock()
+        db.query.return_value.options.return_value.filter.return_value.first.return_value = project
+        
+        # 模型映射在测试环境中无法完整配置，预加载选项替换为占位
+        with patch("app.services.project_export.selectinload"), \
+                patch("app.services.project_export.storage_manager") as storage:
+            storage.stream_file.return_value = iter([b"jpeg"])
+            zip_buffer = ProjectExportService(db).export_project("p1")
+        
+        with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
+            types = {info.filename: info.compress_type for info in zip_file.infolist()}
+            assert json.loads(zip_file.read("project.json"))["script"] == "剧本" * 200
+        
+        assert types == {
+            "project.json": zipfile.ZIP_DEFLATED,
+            "characters.json": zipfile.ZIP_DEFLATED,
+            "storyboard.json": zipfile.ZIP_DEFLATED,
+            "audio.json": zipfile.ZIP_DEFLATED,
+            "storyboard/frame_0001.jpg": zipfile.ZIP_STORED,
+        }
+    
+    def test_export_archive_spools_to_disk_when_large(self):
+        """测试导出文件超出内存上限后转存磁盘，分块读取后关闭"""
+        from types import SimpleNamespace
+        from unittest.mock import MagicMock, patch
+        from app.api.project_export import _iter_archive
+        
+        project = SimpleNamespace(
+            id="p1", name="项目", aspect_ratio="9:16", duration_minutes=1.0,
+            script="", created_at=None, updated_at=None,
+            characters=[], audio_tracks=[],
+            storyboard_frames=[SimpleNamespace(
+                id="f1", sequence_number=1, character_id=None, scene_description="",
+                image_url="/storage/f1.jpg", duration_seconds=2.0,
+                lip_sync_keyframes=None, created_at=None
+            )]
+        )
+        db = MagicMock()
+        db.query.return_value.options.return_value.filter.return_value.first.return_value = project
+        
+        with patch("app.services.project_export.selectinload"), \
+                patch("app.services.project_export.EXPORT_SPOOL_MAX_SIZE", 1024), \
+                patch("app.services.project_export.storage_manager") as storage:
+            storage.stream_file.return_value = iter([b"x" * 4096])
+            archive = ProjectExportService(db).export_project("p1")
+        
+        assert archive._rolled
+        data = b"".join(_iter_archive(archive))
+        assert archive.closed
+        
+        with zipfile.ZipFile(BytesIO(data), 'r') as zip_file:
+            assert zip_file.read("storyboard/frame_0001.jpg") == b"x" * 4096
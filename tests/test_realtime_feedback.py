@@ -1,7 +1,9 @@
 """实时反馈服务测试"""
 import pytest
 import asyncio
+import json
 from datetime import datetime
+from unittest.mock import patch
 
 from app.services.realtime_feedback import (
     ProgressTracker,
@@ -99,6 +101,29 @@ class TestProgressTracker:
         assert data["total_steps"] == 10
         assert data["percentage"] == 50.0
         assert data["current_step_description"] == "处理中"
+    
+    def test_payload_json_cached_until_update(self):
+        """测试序列化进度在状态变化前复用"""
+        tracker = ProgressTracker("task1", 10)
+        tracker.start()
+        
+        payload = tracker.payload_json()
+        assert tracker.payload_json() is payload
+        assert json.loads(payload) == tracker.to_dict()
+        
+        tracker.update(3, "处理中")
+        assert json.loads(tracker.payload_json())["current_step"] == 3
+    
+    def test_timestamp_assignment_refreshes_iso_and_payload(self):
+        """测试直接修改时间戳后ISO字符串与缓存同步更新"""
+        tracker = ProgressTracker("task1", 10)
+        tracker.start()
+        tracker.payload_json()
+        
+        tracker.completed_at = datetime(2024, 1, 2, 3, 4, 5)
+        
+        assert tracker.to_dict()["completed_at"] == "2024-01-02T03:04:05"
+        assert json.loads(tracker.payload_json())["completed_at"] == "2024-01-02T03:04:05"
 
 
 class MockWebSocket:
@@ -118,8 +143,8 @@ class MockWebSocket:
         self.messages.append(data)
     
     async def send_text(self, text):
-        """发送文本消息"""
-        self.messages.append(text)
+        """发送文本消息（服务端发送已序列化的JSON）"""
+        self.messages.append(json.loads(text))
     
     async def receive_text(self):
         """接收文本消息"""
@@ -142,16 +167,38 @@ class TestConnectionManager:
         assert "user1" in manager.active_connections
         assert ws in manager.active_connections["user1"]
     
-    def test_disconnect_websocket(self):
+    @pytest.mark.asyncio
+    async def test_disconnect_websocket(self):
         """测试断开WebSocket连接"""
         manager = ConnectionManager()
         ws = MockWebSocket()
         
-        manager.active_connections["user1"] = {ws}
+        await manager.connect(ws, "user1")
         manager.disconnect(ws, "user1")
         
         assert "user1" not in manager.active_connections
     
+    @pytest.mark.asyncio
+    async def test_disconnect_swaps_last_connection(self):
+        """测试断开中间连接时末尾连接补位，之后仍可正确断开"""
+        manager = ConnectionManager()
+        ws1, ws2, ws3 = MockWebSocket(), MockWebSocket(), MockWebSocket()
+        
+        for ws in (ws1, ws2, ws3, ws2):
+            await manager.connect(ws, "user1")
+        assert manager.active_connections["user1"] == [ws1, ws2, ws3]
+        
+        manager.disconnect(ws1, "user1")
+        assert manager.active_connections["user1"] == [ws3, ws2]
+        
+        manager.disconnect(ws3, "user2")
+        manager.disconnect(ws3, "user1")
+        assert manager.active_connections["user1"] == [ws2]
+        
+        manager.disconnect(ws2, "user1")
+        assert "user1" not in manager.active_connections
+        assert manager._positions == {}
+    
     @pytest.mark.asyncio
     async def test_send_personal_message(self):
         """测试发送个人消息"""
@@ -165,6 +212,25 @@ class TestConnectionManager:
         assert ws.messages[0]["type"] == "test"
         assert ws.messages[0]["message"] == "hello"
     
+    @pytest.mark.asyncio
+    async def test_send_personal_message_drops_failed_connection(self):
+        """测试多连接发送时失败的连接被移除，其他连接正常接收"""
+        manager = ConnectionManager()
+        ws_ok = MockWebSocket()
+        ws_broken = MockWebSocket()
+        
+        async def broken_send(text):
+            raise ConnectionError("closed")
+        
+        ws_broken.send_text = broken_send
+        
+        await manager.connect(ws_ok, "user1")
+        await manager.connect(ws_broken, "user1")
+        await manager.send_personal_message({"type": "test"}, "user1")
+        
+        assert ws_ok.messages == [{"type": "test"}]
+        assert manager.active_connections["user1"] == [ws_ok]
+    
     @pytest.mark.asyncio
     async def test_broadcast_message(self):
         """测试广播消息"""
@@ -177,8 +243,8 @@ class TestConnectionManager:
         
         await manager.broadcast({"type": "broadcast", "message": "hello all"})
         
-        assert len(ws1.messages) == 1
-        assert len(ws2.messages) == 1
+        assert ws1.messages == [{"type": "broadcast", "message": "hello all"}]
+        assert ws2.messages == ws1.messages
     
     def test_create_progress_tracker(self):
         """测试创建进度跟踪器"""
@@ -270,6 +336,29 @@ class TestConnectionManager:
         manager.cleanup_old_trackers(max_age_hours=24)
         
         assert "task1" not in manager.progress_trackers
+    
+    def test_cleanup_keeps_recent_running_and_replaced_trackers(self):
+        """测试清理只移除过期的已结束跟踪器"""
+        from datetime import timedelta
+        manager = ConnectionManager()
+        
+        recent = manager.create_progress_tracker("recent", 10)
+        recent.complete()
+        running = manager.create_progress_tracker("running", 10)
+        running.start()
+        
+        # 旧跟踪器过期后，同一任务ID被新的跟踪器替换
+        old = manager.create_progress_tracker("reused", 10)
+        old.fail("错误")
+        old.completed_at = datetime.utcnow() - timedelta(hours=30)
+        replacement = manager.create_progress_tracker("reused", 10)
+        
+        manager.cleanup_old_trackers(max_age_hours=24)
+        
+        assert manager.progress_trackers["recent"] is recent
+        assert manager.progress_trackers["running"] is running
+        assert manager.progress_trackers["reused"] is replacement
+        assert manager._completion_heap and manager._completion_heap[0][2] == "recent"
 
 
 class TestRealtimeFeedbackService:
@@ -320,6 +409,19 @@ class TestRealtimeFeedbackService:
         assert len(ws.messages) == 2  # 进度更新 + 成功消息
         tracker = manager.get_progress_tracker("task1")
         assert tracker.status == ProgressStatus.COMPLETED
+        # 同一事件的两条消息共用一个时间戳
+        assert ws.messages[0]["timestamp"] == ws.messages[1]["timestamp"]
+    
+    @pytest.mark.asyncio
+    async def test_messages_to_disconnected_user_are_skipped(self):
+        """测试用户未连接时不构建也不发送消息"""
+        manager = ConnectionManager()
+        
+        with patch.object(manager, "send_personal_message") as send:
+            await manager.send_info_message("user1", "hello")
+            await manager.send_error_message("user1", "boom")
+        
+        send.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_fail_task(self):
@@ -7,6 +7,7 @@
 """
 import pytest
 import asyncio
+import json
 from hypothesis import given, strategies as st, settings, assume
 from datetime import datetime
 
@@ -44,8 +45,8 @@ class MockWebSocket:
         self.messages.append(data)
     
     async def send_text(self, text):
-        """发送文本消息"""
-        self.messages.append(text)
+        """发送文本消息（服务端发送已序列化的JSON）"""
+        self.messages.append(json.loads(text))
 
 
 class TestRealtimeFeedbackProperties:
@@ -0,0 +1,228 @@
+"""Replicate客户端测试"""
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from app.services import replicate_client
+from app.services.replicate_client import ReplicateClient, get_replicate_client
+
+
+@pytest.fixture
+def client():
+    """创建测试客户端"""
+    return ReplicateClient(api_token="test-token")
+
+
+@pytest.fixture(autouse=True)
+def clear_result_cache():
+    """每个测试前后清空结果缓存"""
+    ReplicateClient.clear_cache()
+    yield
+    ReplicateClient.clear_cache()
+
+
+class TestReplicateClient:
+    """客户端基础行为测试"""
+
+    def test_unknown_model_lists_supported_models(self, client):
+        """测试不支持的模型报错并列出支持的模型"""
+        with pytest.raises(ValueError, match="whisper"):
+            client.run_model("unknown", {})
+
+    def test_env_token_written_once(self):
+        """测试相同Token只写入一次环境变量"""
+        ReplicateClient(api_token="token-a")
+        os.environ["REPLICATE_API_TOKEN"] = "overridden"
+        ReplicateClient(api_token="token-a")
+        assert os.environ["REPLICATE_API_TOKEN"] == "overridden"
+
+        ReplicateClient(api_token="token-b")
+        assert os.environ["REPLICATE_API_TOKEN"] == "token-b"
+
+    def test_clients_share_http_transport(self):
+        """测试多个客户端共享同一个连接池"""
+        first = ReplicateClient(api_token="token-a")._client._client
+        second = ReplicateClient(api_token="token-b")._client._client
+
+        assert first._transport._wrapped_transport is replicate_client._http_transport
+        assert second._transport._wrapped_transport is replicate_client._http_transport
+
+    @pytest.mark.asyncio
+    async def test_arun_model_runs_in_thread(self, client):
+        """测试异步调用在工作线程中执行同步调用"""
+        caller_thread = threading.get_ident()
+        seen = {}
+
+        def fake_run(model_version, input):
+            seen["thread"] = threading.get_ident()
+            seen["model_version"] = model_version
+            return "https://example.com/out.png"
+
+        with patch.object(client._client, "run", side_effect=fake_run):
+            result = await client.arun_model("sdxl", {"prompt": "test"})
+
+        assert result == ["https://example.com/out.png"]
+        assert seen["model_version"] == ReplicateClient.MODELS["sdxl"]
+        assert seen["thread"] != caller_thread
+
+    @pytest.mark.asyncio
+    async def test_async_sibling_parses_result(self, client):
+        """测试异步版本与同步版本返回相同的解析结果"""
+        with patch.object(client._client, "run", return_value="https://example.com/a.png"):
+            assert await client.agenerate_image("prompt") == ["https://example.com/a.png"]
+
+
+class TestOutputCoercion:
+    """模型输出规范化测试"""
+
+    @pytest.mark.parametrize("model_name,raw,expected", [
+        ("whisper", {"text": "你好"}, {"text": "你好"}),
+        ("whisper", "你好", {"text": "你好"}),
+        ("wav2lip", ["https://example.com/v.mp4"], "https://example.com/v.mp4"),
+        ("sdxl", "https://example.com/a.png", ["https://example.com/a.png"]),
+        ("photomaker", ["https://example.com/a.png"], ["https://example.com/a.png"]),
+    ])
+    def test_run_model_normalizes_output(self, client, model_name, raw, expected):
+        """测试run_model按模型统一规范化输出"""
+        with patch.object(client._client, "run", return_value=raw):
+            assert client.run_model(model_name, {"input": "x"}) == expected
+
+    def test_streaming_output_is_materialized_and_cached(self, client):
+        """测试生成器输出被完整取出，并可从缓存重复返回"""
+        def stream():
+            yield "https://example.com/1.png"
+            yield "https://example.com/2.png"
+
+        with patch.object(client._client, "run", side_effect=lambda *a, **k: stream()) as run:
+            first = client.generate_character_image("prompt", "https://example.com/ref.png", seed=42)
+            second = client.generate_character_image("prompt", "https://example.com/ref.png", seed=42)
+
+        expected = ["https://example.com/1.png", "https://example.com/2.png"]
+        assert first == expected
+        assert second == expected
+        assert run.call_count == 1
+
+    def test_unexpected_format_raises_value_error(self, client):
+        """测试意外的输出格式抛出ValueError而非API调用失败"""
+        with patch.object(client._client, "run", return_value=[]):
+            with pytest.raises(ValueError, match="Wav2Lip"):
+                client.generate_lip_sync("face.png", "audio.mp3")
+
+
+class TestResultCache:
+    """模型结果缓存测试"""
+
+    def test_identical_inputs_hit_cache(self, client):
+        """测试相同输入（键顺序不同）命中缓存"""
+        with patch.object(client._client, "run", return_value=["https://example.com/a.png"]) as run:
+            first = client.run_model("sdxl", {"prompt": "cat", "width": 512, "seed": 1})
+            first.append("mutated")
+            second = client.run_model("sdxl", {"seed": 1, "width": 512, "prompt": "cat"})
+
+        assert run.call_count == 1
+        assert second == ["https://example.com/a.png"]
+
+    def test_nested_results_are_isolated_from_callers(self, client):
+        """测试修改转录结果中的嵌套 segments 不影响缓存"""
+        transcript = {"text": "你好", "segments": [{"start": 0.0, "end": 1.0, "text": "你好"}]}
+        with patch.object(client._client, "run", return_value=transcript) as run:
+            first = client.transcribe_audio("https://example.com/a.mp3")
+            first["segments"][0]["text"] = "mutated"
+            first["segments"].append({})
+            second = client.transcribe_audio("https://example.com/a.mp3")
+
+        assert run.call_count == 1
+        assert second["segments"] == [{"start": 0.0, "end": 1.0, "text": "你好"}]
+
+    def test_bypass_cache_and_different_inputs(self, client):
+        """测试bypass_cache与不同输入都会重新调用"""
+        with patch.object(client._client, "run", return_value="out") as run:
+            client.run_model("sdxl", {"prompt": "cat", "seed": 1})
+            client.run_model("sdxl", {"prompt": "cat", "seed": 1}, bypass_cache=True)
+            client.run_model("sdxl", {"prompt": "dog", "seed": 1})
+            client.run_model("wav2lip", {"prompt": "cat", "seed": 1})
+
+        assert run.call_count == 4
+
+    def test_expired_and_evicted_entries(self, client):
+        """测试过期条目失效，超出容量时淘汰最早条目"""
+        with patch.object(client._client, "run", return_value="out") as run, \
+                patch.object(replicate_client, "RESULT_CACHE_MAX_ENTRIES", 2), \
+                patch.object(replicate_client.time, "monotonic", return_value=0.0) as clock:
+            client.run_model("wav2lip", {"face": "a"})
+            client.run_model("wav2lip", {"face": "b"})
+            client.run_model("wav2lip", {"face": "c"})
+            client.run_model("wav2lip", {"face": "b"})
+            assert run.call_count == 3
+
+            client.run_model("wav2lip", {"face": "a"})
+            assert run.call_count == 4
+
+            clock.return_value = replicate_client.RESULT_CACHE_TTL_SECONDS + 1
+            client.run_model("wav2lip", {"face": "a"})
+            assert run.call_count == 5
+
+    def test_unseeded_sampling_regenerates(self, client):
+        """测试未指定seed的采样模型每次重新生成，指定seed时命中缓存"""
+        with patch.object(client._client, "run", return_value=["https://example.com/a.png"]) as run:
+            client.generate_image("cat")
+            client.generate_image("cat")
+            assert run.call_count == 2
+            
+            client.generate_image("cat", seed=7)
+            client.generate_image("cat", seed=7)
+            assert run.call_count == 3
+            assert run.call_args.kwargs["input"]["seed"] == 7
+            
+            client.generate_image("cat", seed=7, bypass_cache=True)
+            client.generate_lip_sync("face.png", "audio.mp3")
+            client.generate_lip_sync("face.png", "audio.mp3", bypass_cache=True)
+            assert run.call_count == 6
+    
+    def test_cache_ttl_below_delivery_url_lifetime(self):
+        """测试缓存时长明显短于Replicate输出链接的1小时有效期"""
+        assert replicate_client.RESULT_CACHE_TTL_SECONDS <= 3600 / 2
+    
+    def test_file_inputs_are_not_cached(self, client, tmp_path):
+        """测试包含文件对象的输入不缓存"""
+        image = tmp_path / "ref.png"
+        image.write_bytes(b"png")
+
+        with patch.object(client._client, "run", return_value="out") as run, open(image, "rb") as f:
+            client.run_model("photomaker", {"input_image": f, "seed": 1})
+            client.run_model("photomaker", {"input_image": f, "seed": 1})
+
+        assert run.call_count == 2
+
+
+class TestGetReplicateClient:
+    """全局客户端测试"""
+
+    def test_concurrent_calls_create_single_instance(self):
+        """测试并发获取只创建一个实例"""
+        created = []
+
+        class CountingClient(ReplicateClient):
+            def __init__(self):
+                created.append(self)
+                super().__init__(api_token="test-token")
+
+        barrier = threading.Barrier(8)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(get_replicate_client())
+
+        with patch.object(replicate_client, "_client_instance", None), \
+                patch.object(replicate_client, "ReplicateClient", CountingClient):
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        assert len(created) == 1
+        assert all(r is created[0] for r in results)
@@ -0,0 +1,59 @@
+"""JSON序列化工具测试"""
+import json
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+from app.core import serialization
+from app.core.serialization import dumps, loads
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def backend(request):
+    """分别在orjson与标准库路径下运行"""
+    if request.param == "orjson" and serialization.orjson is None:
+        pytest.skip("orjson未安装")
+    if request.param == "stdlib":
+        with patch.object(serialization, "orjson", None):
+            yield request.param
+    else:
+        yield request.param
+
+
+class TestDumps:
+    """序列化测试"""
+    
+    def test_native_types_and_unicode(self, backend):
+        """测试datetime/UUID与非ASCII字符的输出在两条路径下一致"""
+        item_id = uuid.uuid4()
+        created_at = datetime(2024, 1, 2, 3, 4, 5, 678000)
+        
+        raw = dumps({"id": item_id, "name": "角色", "created_at": created_at})
+        
+        assert raw == (
+            '{"id":"%s","name":"角色","created_at":"%s"}' % (item_id, created_at.isoformat())
+        ).encode("utf-8")
+    
+    def test_indent_and_sort_keys_match_stdlib(self, backend):
+        """测试缩进与键排序输出与标准库一致"""
+        data = {"b": [1, 2], "a": {"c": None}}
+        
+        assert dumps(data, indent=True, sort_keys=True) == json.dumps(
+            data, indent=2, sort_keys=True
+        ).encode("utf-8")
+    
+    def test_non_str_keys(self, backend):
+        """测试非字符串键转为字符串（与json.dumps一致）"""
+        assert loads(dumps({1: "a", None: "b"})) == {"1": "a", "null": "b"}
+    
+    def test_values_orjson_cannot_encode(self, backend):
+        """测试超过64位的整数与孤立代理字符回退标准库，输出仍是合法JSON"""
+        assert loads(dumps({"big": 1 << 70})) == {"big": 1 << 70}
+        assert json.loads(dumps({"text": "\ud800"})) == {"text": "\ud800"}
+    
+    def test_default_none_rejects_unknown_values(self, backend):
+        """测试default=None时无法序列化的值抛出TypeError"""
+        with pytest.raises(TypeError):
+            dumps({"value": object()}, default=None)
@@ -1,11 +1,13 @@
 """
 音效匹配器单元测试和属性测试
 """
+import numpy as np
 import pytest
 from hypothesis import given, strategies as st, settings
 
 from app.services.sound_effect_matcher import (
     SoundEffectMatcher,
+    get_sound_effect_matcher,
     ScriptParser,
     SoundEffectLibrary,
     SceneSegment,
@@ -87,6 +89,68 @@ class TestScriptParser:
         characters = parser._extract_characters(text)
         
         assert "小明" in characters or "小红" in characters
+    
+    def test_extract_characters_keeps_first_appearance_order(self):
+        """测试角色按首次出现顺序去重，最多5个"""
+        parser = ScriptParser()
+        text = "小红：嗨 小明：嗨 小红：走 甲：一 乙：二 丙：三 丁：四"
+        
+        assert parser._extract_characters(text) == ["小红", "小明", "甲", "乙", "丙"]
+    
+    @given(st.text(alphabet=st.sampled_from(list("惊讶恐惧愤怒害怕开心打跑room painfight ")), max_size=40))
+    @settings(max_examples=200)
+    def test_keyword_matching_equals_substring_scan(self, text):
+        """测试单次正则扫描与逐个关键词子串检查结果一致（含重叠与前缀关键词）"""
+        parser = ScriptParser()
+        text_lower = text.lower()
+        
+        all_keywords = parser.ACTION_KEYWORDS + parser.ENVIRONMENT_KEYWORDS + [
+            kw for kws in parser.EMOTION_KEYWORDS.values() for kw in kws
+        ]
+        assert parser._find_keywords(text) == {kw for kw in all_keywords if kw in text_lower}
+    
+    @given(st.lists(st.sampled_from(list("惊恐怕害笑哭怒开心生气讶 ") + ["angry", "sad"]), max_size=20).map("".join))
+    @settings(max_examples=200)
+    def test_emotion_reverse_lookup_matches_keyword_scan(self, text):
+        """测试情感反查表与逐个情感检查关键词的结果一致"""
+        parser = ScriptParser()
+        expected = [
+            emotion for emotion, keywords in parser.EMOTION_KEYWORDS.items()
+            if any(kw in text.lower() for kw in keywords)
+        ] or [EmotionType.NEUTRAL]
+        
+        assert parser._extract_emotions(text) == expected
+    
+    @given(st.lists(st.sampled_from(list("小明跑了的！，。…— \t\nab_1:'\"(") + ["the", "是"]), max_size=40).map("".join))
+    @settings(max_examples=200)
+    def test_extract_keywords_equals_punctuation_split(self, text):
+        """测试单次分词与先替换标点再按空白切分的结果一致"""
+        import re
+        
+        parser = ScriptParser()
+        stop_words = {'的', '了', '在', '是', '我', '你', '他', '她', 'the', 'a', 'an', 'is', 'are'}
+        words = re.sub(r'[^\w\s]', ' ', text).split()
+        expected = [w for w in words if len(w) > 1 and w.lower() not in stop_words][:10]
+        
+        assert parser._extract_keywords(text) == expected
+    
+    def test_scene_segment_to_dict_round_trip(self):
+        """测试场景片段序列化字段顺序与往返一致，且实例不带 __dict__"""
+        scene = SceneSegment(
+            scene_id="scene_1", text="小明跑进房间", scene_type=SceneType.ACTION,
+            actions=["跑"], emotions=[EmotionType.HAPPY, EmotionType.SURPRISE],
+            characters=["小明"], start_time=1.5, duration=3.0, keywords=["跑", "房间"]
+        )
+        
+        data = scene.to_dict()
+        assert list(data) == [
+            "scene_id", "text", "scene_type", "actions", "emotions",
+            "characters", "start_time", "duration", "keywords"
+        ]
+        assert data["scene_type"] == SceneType.ACTION.value
+        assert data["emotions"] == [EmotionType.HAPPY.value, EmotionType.SURPRISE.value]
+        assert SceneSegment.from_dict(data) == scene
+        assert not hasattr(scene, "__dict__")
 
 
 class TestSoundEffectLibrary:
@@ -121,6 +185,63 @@ class TestSoundEffectLibrary:
         assert retrieved is not None
         assert retrieved.name == "测试音效"
     
+    def test_effects_snapshot_rebuilt_only_on_change(self):
+        """测试音效快照在音效库变更前复用同一个元组"""
+        library = SoundEffectLibrary()
+        snapshot = library.effects_snapshot
+        
+        assert library.effects_snapshot is snapshot
+        assert library.get_all_effects() == list(snapshot)
+        
+        library.add_effect(SoundEffect("snap_001", "新音效", "", "test", [], 1.0, "x.mp3"))
+        
+        assert library.effects_snapshot is not snapshot
+        assert library.effects_snapshot[-1].effect_id == "snap_001"
+    
+    def test_embedding_is_normalized_hashed_vector(self):
+        """测试音效向量为归一化的float32特征哈希向量，序列化往返不变"""
+        library = SoundEffectLibrary()
+        effect = library.get_effect("sfx_001")
+        
+        vector = library._generate_embedding(effect)
+        assert vector.dtype == np.float32
+        assert vector.shape == (128,)
+        assert np.linalg.norm(vector) == pytest.approx(1.0, abs=1e-6)
+        
+        # 库内以int8量化存储，还原误差不超过半个量化步长
+        assert effect.embedding.dtype == np.int8
+        assert effect.embedding_scale == pytest.approx(np.abs(vector).max())
+        np.testing.assert_allclose(
+            effect.embedding_vector(), vector, atol=effect.embedding_scale / 254 + 1e-7
+        )
+        
+        data = effect.to_dict()
+        assert isinstance(data["embedding_b64"], str)
+        restored = SoundEffect.from_dict(data)
+        np.testing.assert_array_equal(restored.embedding, effect.embedding)
+        assert restored.embedding_scale == effect.embedding_scale
+        
+        # 兼容旧格式的浮点数列表，读入时量化
+        legacy = {**data, "embedding_b64": None, "embedding_scale": None, "embedding": vector.tolist()}
+        np.testing.assert_array_equal(SoundEffect.from_dict(legacy).embedding, effect.embedding)
+    
+    def test_effects_with_embeddings_compare_by_fields(self):
+        """测试带向量的音效可以比较相等（向量不参与 __eq__）"""
+        effect_a = SoundEffectLibrary().get_effect("sfx_001")
+        effect_b = SoundEffectLibrary().get_effect("sfx_001")
+        
+        assert effect_a is not effect_b
+        assert effect_a == effect_b
+        assert effect_b in [SoundEffectLibrary().get_effect("sfx_002"), effect_a]
+    
+    def test_embedding_ignores_tag_order(self):
+        """测试向量只与词和二元组的出现次数有关，与标签顺序无关"""
+        library = SoundEffectLibrary()
+        a = SoundEffect("a", "雨声", "下雨的声音", "environment", ["雨", "下雨", "雨天"], 1.0, "a.mp3")
+        b = SoundEffect("b", "雨声", "下雨的声音", "environment", ["雨天", "雨", "下雨"], 1.0, "b.mp3")
+        
+        np.testing.assert_array_equal(library._generate_embedding(a), library._generate_embedding(b))
+    
     def test_search_by_category(self):
         """测试按类别搜索"""
         library = SoundEffectLibrary()
@@ -145,8 +266,8 @@ class TestSoundEffectMatcher:
     
     def test_singleton_pattern(self):
         """测试单例模式"""
-        matcher1 = SoundEffectMatcher()
-        matcher2 = SoundEffectMatcher()
+        matcher1 = get_sound_effect_matcher()
+        matcher2 = get_sound_effect_matcher()
         
         assert matcher1 is matcher2
     
@@ -201,6 +322,22 @@ class TestSoundEffectMatcher:
         assert all("start_time" in r for r in results)
         assert all("duration" in r for r in results)
     
+    def test_auto_place_with_precomputed_scene_map(self):
+        """测试传入预先构建的场景映射时结果一致，未知场景或音效被跳过"""
+        matcher = SoundEffectMatcher()
+        segments = matcher.parse_script("场景1：打斗场面\n场景2：对话场景")
+        placements = [
+            (segments[0].scene_id, "sfx_001"),
+            ("missing_scene", "sfx_001"),
+            (segments[1].scene_id, "missing_effect"),
+        ]
+        scene_map = {seg.scene_id: seg for seg in segments}
+        
+        results = matcher.auto_place_sound_effects(segments, placements, scene_map=scene_map)
+        
+        assert results == matcher.auto_place_sound_effects(segments, placements)
+        assert [(r["scene_id"], r["effect_id"]) for r in results] == [(segments[0].scene_id, "sfx_001")]
+    
     def test_upload_custom_effect(self):
         """测试上传自定义音效"""
         matcher = SoundEffectMatcher()
@@ -255,6 +392,95 @@ class TestSoundEffectMatcherProperties:
             # 某些随机文本可能导致解析失败，这是可接受的
             pass
     
+    @given(
+        scene_type=st.sampled_from(list(SceneType)),
+        emotions=st.lists(st.sampled_from(list(EmotionType)), max_size=3),
+        keywords=st.lists(st.sampled_from(["打斗", "门", "森林", "雨", "笑", "掌声", "惊吓", "无关"]), max_size=4),
+        top_k=st.integers(min_value=0, max_value=20)
+    )
+    @settings(max_examples=100)
+    def test_vectorized_scores_match_scalar_ranking(self, scene_type, emotions, keywords, top_k):
+        """测试向量化推荐与逐个评分后稳定排序的结果一致"""
+        matcher = SoundEffectMatcher()
+        scene = SceneSegment(
+            scene_id="test", text="", scene_type=scene_type, actions=keywords[:1],
+            emotions=emotions, characters=[], start_time=0.0, duration=5.0, keywords=keywords
+        )
+        
+        expected = sorted(
+            ((e, matcher._calculate_similarity(scene, e)) for e in matcher.library.get_all_effects()),
+            key=lambda x: x[1],
+            reverse=True
+        )[:top_k]
+        
+        assert matcher.recommend_sound_effects(scene, top_k=top_k) == expected
+    
+    @given(
+        scene_type=st.sampled_from(list(SceneType)),
+        emotions=st.lists(st.sampled_from(list(EmotionType)), max_size=2),
+        keywords=st.lists(st.sampled_from(["t0", "t1", "t2", "t3", "快乐", "惊"]), max_size=3),
+        top_k=st.integers(min_value=1, max_value=40)
+    )
+    @settings(max_examples=50)
+    def test_inverted_index_top_k_on_large_library(self, scene_type, emotions, keywords, top_k):
+        """测试倒排表补位路径在较大音效库上与逐个评分结果一致"""
+        from app.services.sound_effect_matcher import _ScoringIndex
+        
+        matcher = SoundEffectMatcher()
+        categories = ["action", "dialogue", "environment", "emotional", "other"]
+        effects = [
+            SoundEffect(f"e{i}", f"e{i}", "惊喜" if i % 17 == 0 else "", categories[i % 5],
+                        [f"t{i % 7}"] + (["快乐"] if i % 11 == 0 else []), 1.0, "x.mp3")
+            for i in range(300)
+        ]
+        index = _ScoringIndex(effects, matcher.SCENE_TYPE_CATEGORIES, matcher.EMOTION_TAGS)
+        scene = SceneSegment(
+            scene_id="s", text="", scene_type=scene_type, actions=[], emotions=emotions,
+            characters=[], start_time=0.0, duration=1.0, keywords=keywords
+        )
+        
+        expected = sorted(
+            ((e, matcher._calculate_similarity(scene, e)) for e in effects),
+            key=lambda x: x[1],
+            reverse=True
+        )[:top_k]
+        
+        assert index.top_k(scene, top_k) == expected
+    
+    @given(
+        scores=st.lists(st.sampled_from([0.0, 0.3, 0.5, 0.7, 1.0]), min_size=1, max_size=60),
+        k=st.integers(min_value=1, max_value=70)
+    )
+    @settings(max_examples=200)
+    def test_partial_top_order_matches_full_sort(self, scores, k):
+        """测试先分区再排序候选的前k选择与完整稳定排序一致（大量同分）"""
+        from app.services.sound_effect_matcher import _ScoringIndex
+        
+        scores = np.array(scores)
+        positions = np.random.default_rng(len(scores)).permutation(len(scores))
+        
+        expected = np.lexsort((positions, -scores))[:k]
+        np.testing.assert_array_equal(_ScoringIndex._top_order(positions, scores, k), expected)
+    
+    def test_score_index_rebuilt_after_add_effect(self):
+        """测试音效库变更后评分索引重建"""
+        matcher = SoundEffectMatcher()
+        matcher.recommend_sound_effects(SceneSegment(
+            scene_id="s", text="", scene_type=SceneType.ACTION, actions=[], emotions=[],
+            characters=[], start_time=0.0, duration=1.0, keywords=[]
+        ))
+        effect = SoundEffect("sfx_index_test", "独特音效", "", "other", ["独特标签"], 1.0, "sfx/x.mp3")
+        matcher.library.add_effect(effect)
+        
+        scene = SceneSegment(
+            scene_id="s", text="", scene_type=SceneType.DIALOGUE, actions=[], emotions=[],
+            characters=[], start_time=0.0, duration=1.0, keywords=["独特标签"]
+        )
+        top_effect, score = matcher.recommend_sound_effects(scene, top_k=1)[0]
+        
+        assert top_effect is effect
+        assert score == pytest.approx(0.4)
+    
     @given(
         top_k=st.integers(min_value=1, max_value=10)
     )
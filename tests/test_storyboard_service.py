@@ -0,0 +1,171 @@
+"""分镜服务单元测试"""
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.models.storyboard import StoryboardFrame
+from app.schemas.storyboard import StoryboardFrameCreate, StoryboardFrameUpdate
+from app.services.storyboard import StoryboardService
+
+
+def _make_db(max_rows):
+    db = MagicMock()
+    db.execute.return_value = iter(max_rows)
+    db.scalars.side_effect = lambda stmt, payload: MagicMock(
+        all=MagicMock(return_value=[MagicMock(**row) for row in payload])
+    )
+    return db
+
+
+@pytest.fixture(autouse=True)
+def clear_sequence_cache():
+    StoryboardService._seq_cache.clear()
+    yield
+    StoryboardService._seq_cache.clear()
+
+
+def _make_single_db(max_seq):
+    db = MagicMock()
+    db.execute.return_value.scalar.return_value = max_seq
+    return db
+
+
+@pytest.fixture
+def frame_model():
+    """以轻量对象代替ORM模型构造，避免触发映射器配置"""
+    model = MagicMock(side_effect=lambda **kwargs: SimpleNamespace(**kwargs))
+    with patch("app.services.storyboard.StoryboardFrame", model), \
+            patch("app.services.storyboard.select"), \
+            patch("app.services.storyboard.func"):
+        yield model
+
+
+@pytest.mark.usefixtures("frame_model")
+class TestCreateFrame:
+    def test_max_query_runs_once_per_project(self):
+        project_id = uuid4()
+        db = _make_single_db(7)
+        service = StoryboardService(db)
+        data = StoryboardFrameCreate(project_id=project_id, scene_description="s")
+
+        first = service.create_frame(data)
+        second = service.create_frame(data)
+
+        assert (first.sequence_number, second.sequence_number) == (8, 9)
+        assert db.execute.call_count == 1
+
+    def test_integrity_error_invalidates_and_retries(self):
+        project_id = uuid4()
+        StoryboardService._seq_cache[project_id] = 2
+        db = _make_single_db(5)
+        db.commit.side_effect = [IntegrityError("stmt", {}, Exception()), None]
+
+        frame = StoryboardService(db).create_frame(
+            StoryboardFrameCreate(project_id=project_id, scene_description="s")
+        )
+
+        db.rollback.assert_called_once()
+        assert db.execute.call_count == 1
+        assert frame.sequence_number == 6
+        assert StoryboardService._seq_cache[project_id] == 6
+
+    def test_second_integrity_error_is_raised(self):
+        project_id = uuid4()
+        db = _make_single_db(0)
+        db.commit.side_effect = IntegrityError("stmt", {}, Exception())
+
+        with pytest.raises(IntegrityError):
+            StoryboardService(db).create_frame(
+                StoryboardFrameCreate(project_id=project_id, scene_description="s")
+            )
+        assert project_id not in StoryboardService._seq_cache
+
+
+class TestCreateFramesBulk:
+    def test_empty_input_skips_database(self):
+        db = MagicMock()
+        assert StoryboardService(db).create_frames_bulk([]) == []
+        db.execute.assert_not_called()
+        db.commit.assert_not_called()
+
+    def test_sequence_numbers_per_project(self):
+        project_a, project_b = uuid4(), uuid4()
+        character_id = uuid4()
+        db = _make_db([(project_a, 3)])
+        items = [
+            StoryboardFrameCreate(project_id=project_a, scene_description="a1", character_id=character_id),
+            StoryboardFrameCreate(project_id=project_b, scene_description="b1"),
+            StoryboardFrameCreate(project_id=project_a, scene_description="a2"),
+        ]
+
+        StoryboardService(db).create_frames_bulk(items)
+
+        # 最大序号只查询一次，插入与提交各一次
+        assert db.execute.call_count == 1
+        assert db.scalars.call_count == 1
+        db.commit.assert_called_once()
+
+        payload = db.scalars.call_args.args[1]
+        assert [(row["project_id"], row["sequence_number"]) for row in payload] == [
+            (project_a, 4), (project_b, 1), (project_a, 5)
+        ]
+        assert payload[0]["description"] == "a1"
+        assert payload[0]["character_ids"] == [character_id]
+        assert payload[1]["character_ids"] == []
+        assert all(row["status"] == "pending" for row in payload)
+        assert StoryboardService._seq_cache == {project_a: 5, project_b: 1}
+
+    def test_returned_frames_are_detached_before_commit(self):
+        project_id = uuid4()
+        db = _make_db([])
+        items = [StoryboardFrameCreate(project_id=project_id, scene_description="s")] * 2
+
+        frames = StoryboardService(db).create_frames_bulk(items)
+
+        assert [frame.sequence_number for frame in frames] == [1, 2]
+        assert db.expunge.call_count == 2
+
+
+class TestUpdateFrame:
+    def test_sequence_conflict_raises_value_error(self):
+        project_id = uuid4()
+        StoryboardService._seq_cache[project_id] = 4
+        db = MagicMock()
+        db.get.return_value = SimpleNamespace(project_id=project_id, sequence_number=1)
+        db.commit.side_effect = IntegrityError("stmt", {}, Exception())
+
+        with pytest.raises(ValueError, match="序号已被"):
+            StoryboardService(db).update_frame(uuid4(), StoryboardFrameUpdate(sequence_number=2))
+
+        db.rollback.assert_called_once()
+        db.refresh.assert_not_called()
+        assert project_id not in StoryboardService._seq_cache
+
+    def test_sequence_constraint_is_deferred(self):
+        """序号唯一约束延迟到提交时检查，同一事务内可交换序号"""
+        constraint = next(
+            c for c in StoryboardFrame.__table__.constraints
+            if c.name == "scenes_project_sequence_key"
+        )
+        assert constraint.deferrable is True
+        assert constraint.initially == "DEFERRED"
+
+
+@pytest.mark.usefixtures("frame_model")
+class TestDeleteFrame:
+    def test_delete_invalidates_sequence_cache(self):
+        project_id = uuid4()
+        StoryboardService._seq_cache[project_id] = 5
+        db = _make_single_db(4)
+        db.get.return_value = SimpleNamespace(project_id=project_id, sequence_number=5)
+        service = StoryboardService(db)
+
+        assert service.delete_frame(uuid4()) is True
+        assert project_id not in StoryboardService._seq_cache
+
+        # 删除最大序号后重新查询 MAX，序号被复用
+        frame = service.create_frame(StoryboardFrameCreate(project_id=project_id, scene_description="s"))
+        assert frame.sequence_number == 5
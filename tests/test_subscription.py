@@ -1,11 +1,18 @@
 """订阅管理单元测试"""
 import pytest
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import uuid
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session
 
+from app.services import subscription as subscription_module
 from app.services.subscription import SubscriptionService
 from app.services.auth import AuthenticationService
 from app.models.user import User, SubscriptionTier
+from app.models.subscription import Subscription
 
 
 class TestSubscriptionCreation:
@@ -248,3 +255,109 @@ class TestSubscriptionPermissions:
         assert active_subscription is not None
         assert active_subscription.plan == SubscriptionTier.PROFESSIONAL
         assert active_subscription.end_date > datetime.utcnow()
+
+
+class TestSubscriptionServiceLogic:
+    """订阅服务逻辑测试（不依赖数据库）"""
+    
+    @pytest.fixture
+    def mock_db(self):
+        db = MagicMock()
+        db.get.return_value = SimpleNamespace(
+            id=uuid.uuid4(),
+            subscription_tier=SubscriptionTier.FREE,
+            remaining_quota_minutes=0.0
+        )
+        with patch(
+            "app.services.subscription.Subscription",
+            side_effect=lambda **kwargs: SimpleNamespace(**kwargs)
+        ):
+            yield db
+    
+    def test_activate_subscription_fetches_user_once(self, mock_db):
+        """激活订阅只获取一次用户，并在内部方法间传递"""
+        user_id = uuid.uuid4()
+        user, subscription = SubscriptionService(mock_db).activate_subscription(
+            user_id, SubscriptionTier.PROFESSIONAL
+        )
+        
+        mock_db.get.assert_called_once_with(User, user_id)
+        mock_db.query.assert_not_called()
+        assert subscription.user_id == user.id
+        assert user.subscription_tier == SubscriptionTier.PROFESSIONAL
+        assert user.remaining_quota_minutes == 50.0
+    
+    def test_missing_user_raises(self, mock_db):
+        """用户不存在时抛出 ValueError"""
+        mock_db.get.return_value = None
+        with pytest.raises(ValueError, match="用户不存在"):
+            SubscriptionService(mock_db).create_subscription(uuid.uuid4(), SubscriptionTier.FREE)
+    
+    def test_switch_plan_ends_active_subscriptions_with_one_update(self, mock_db):
+        """切换计划以单条 UPDATE 结束活跃订阅"""
+        subscription_model = subscription_module.Subscription
+        subscription_model.end_date.__gt__.return_value = MagicMock()
+        with patch("app.services.subscription.update") as mock_update:
+            SubscriptionService(mock_db).switch_subscription_plan(
+                uuid.uuid4(), SubscriptionTier.ENTERPRISE
+            )
+        
+        mock_db.query.assert_not_called()
+        mock_update.assert_called_once_with(subscription_model)
+        mock_db.execute.assert_called_once_with(
+            mock_update.return_value.where.return_value.values.return_value
+        )
+    
+    def test_plan_durations_precomputed(self, mock_db):
+        """订阅时长按计划预先计算，按量付费按10年计"""
+        service = SubscriptionService(mock_db)
+        subscription = service.create_subscription(uuid.uuid4(), SubscriptionTier.PAY_PER_USE)
+        
+        assert subscription.end_date - subscription.start_date == timedelta(days=3650)
+        assert service._PLAN_DURATION[SubscriptionTier.PROFESSIONAL] == timedelta(days=30)
+        with pytest.raises(TypeError):
+            service.SUBSCRIPTION_PLANS[SubscriptionTier.FREE] = {}
+
+
+class TestSubscriptionUtcComparison:
+    """订阅到期比较统一使用数据库端UTC时间"""
+    
+    def test_postgresql_compares_against_utc_now(self):
+        """PostgreSQL 下将 now() 换算为UTC后再与 naive 的 end_date 比较"""
+        db = MagicMock()
+        db.get.return_value = SimpleNamespace(id=uuid.uuid4())
+        service = SubscriptionService(db)
+        with patch.object(service, "_activate_subscription", return_value=(None, None)):
+            service.switch_subscription_plan(uuid.uuid4(), SubscriptionTier.PROFESSIONAL)
+        
+        sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        assert sql.count("timezone('UTC', now())") == 2
+        assert "subscriptions.end_date > timezone('UTC', now())" in sql
+    
+    def test_sqlite_expiry_filters_use_utc(self):
+        """以 datetime.utcnow() 写入的到期时间在数据库端按UTC正确判定"""
+        engine = create_engine("sqlite://")
+        table = Subscription.__table__
+        table.create(engine)
+        user_id = uuid.uuid4()
+        now = datetime.utcnow()
+        rows = [
+            ("expired", now - timedelta(minutes=1)),
+            ("active", now + timedelta(minutes=1)),
+        ]
+        with engine.begin() as conn:
+            for status, end_date in rows:
+                conn.execute(insert(table).values(
+                    id=uuid.uuid4(), user_id=user_id, plan=SubscriptionTier.PROFESSIONAL,
+                    status=status, quota_minutes=50.0, start_date=now - timedelta(days=1),
+                    end_date=end_date, auto_renew=True
+                ))
+            active = conn.execute(
+                select(table.c.status).where(table.c.end_date > subscription_module.utc_now())
+            ).scalars().all()
+            expired = conn.execute(
+                select(table.c.status).where(table.c.end_date <= subscription_module.utc_now())
+            ).scalars().all()
+        
+        assert active == ["active"]
+        assert expired == ["expired"]
@@ -0,0 +1,260 @@
+"""额度管理和使用统计单元测试"""
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy.dialects import sqlite
+
+from app.models.user import SubscriptionTier, User
+from app.services.usage import UsageService
+
+
+@pytest.fixture
+def mock_db():
+    db = MagicMock()
+    db.get_bind.return_value.dialect.name = "sqlite"
+    with patch(
+        "app.services.usage.UsageRecord",
+        side_effect=lambda **kwargs: SimpleNamespace(**kwargs)
+    ):
+        yield db
+
+
+class TestUsageRecording:
+    """使用记录写入测试（不依赖数据库）"""
+    
+    def test_record_usage_adds_record_and_upserts_daily_stat(self, mock_db):
+        """写入明细并以 ON CONFLICT 累加当天统计"""
+        user_id = uuid.uuid4()
+        UsageService(mock_db)._record_usage(user_id, "video_export", 2.5, 25.0)
+        
+        record = mock_db.add.call_args.args[0]
+        assert (record.user_id, record.action_type, record.duration_minutes, record.cost) == (
+            user_id, "video_export", 2.5, 25.0
+        )
+        
+        statement = mock_db.execute.call_args.args[0]
+        sql = str(statement.compile(dialect=sqlite.dialect()))
+        assert sql.startswith("INSERT INTO usage_daily_stats")
+        assert "ON CONFLICT (user_id, action_type, day) DO UPDATE" in sql
+        assert "total_duration = (usage_daily_stats.total_duration + excluded.total_duration)" in sql
+    
+    def test_statistics_sum_daily_rows_per_action_type(self, mock_db):
+        """统计结果由按天汇总的行合计得出"""
+        mock_db.get.return_value = SimpleNamespace(
+            subscription_tier=SubscriptionTier.PROFESSIONAL,
+            remaining_quota_minutes=12.0
+        )
+        mock_db.query.return_value.filter.return_value.group_by.return_value.all.return_value = [
+            ("video_export", 3, 7.5, 0.0),
+            ("render", 1, 1.0, 10.0),
+        ]
+        
+        statistics = UsageService(mock_db).get_usage_statistics(uuid.uuid4(), days=7)
+        
+        assert statistics["usage_count"] == 4
+        assert statistics["total_usage_minutes"] == 8.5
+        assert statistics["total_cost"] == 10.0
+        assert statistics["by_action_type"]["video_export"] == {
+            "count": 3, "duration_minutes": 7.5, "cost": 0.0
+        }
+    
+    def test_history_selects_columns_in_index_order(self):
+        """历史记录按 created_at 倒序分页，只查询所需列"""
+        created_at = datetime(2026, 10, 17, 12, 0)
+        row = SimpleNamespace(
+            id=uuid.uuid4(), action_type="video_export",
+            duration_minutes=1.5, cost=15.0, created_at=created_at
+        )
+        db = MagicMock()
+        query = db.query.return_value.filter.return_value.order_by.return_value
+        query.limit.return_value.all.return_value = [row]
+        
+        history = UsageService(db).get_usage_history(uuid.uuid4(), limit=10)
+        
+        columns = db.query.call_args.args
+        assert [column.key for column in columns] == [
+            "id", "action_type", "duration_minutes", "cost", "created_at"
+        ]
+        order = db.query.return_value.filter.return_value.order_by.call_args.args[0]
+        assert str(order) == "usage_records.created_at DESC"
+        query.limit.assert_called_once_with(10)
+        assert history == [{
+            "id": str(row.id),
+            "action_type": "video_export",
+            "duration_minutes": 1.5,
+            "cost": 15.0,
+            "created_at": created_at.isoformat()
+        }]
+
+
+class TestUserLookup:
+    """用户查询测试（不依赖数据库）"""
+    
+    def test_read_paths_use_identity_map_lookup(self, mock_db):
+        """统计与费用计算通过 Session.get 获取用户，不发起额外的主键查询"""
+        user_id = uuid.uuid4()
+        mock_db.get.return_value = SimpleNamespace(
+            subscription_tier=SubscriptionTier.PAY_PER_USE,
+            remaining_quota_minutes=1.0
+        )
+        mock_db.query.return_value.filter.return_value.group_by.return_value.all.return_value = []
+        service = UsageService(mock_db)
+        
+        service.get_usage_statistics(user_id)
+        cost_info = service.calculate_export_cost(user_id, 3.0)
+        
+        assert mock_db.get.call_count == 2
+        assert all(call.args == (User, user_id) for call in mock_db.get.call_args_list)
+        mock_db.query.return_value.filter.return_value.first.assert_not_called()
+        assert cost_info["cost"] == 3.0 * UsageService.PAY_PER_USE_PRICE
+    
+    def test_missing_user_raises(self, mock_db):
+        """用户不存在时抛出 ValueError"""
+        mock_db.get.return_value = None
+        with pytest.raises(ValueError, match="用户不存在"):
+            UsageService(mock_db).calculate_export_cost(uuid.uuid4(), 1.0)
+
+
+class TestExportCost:
+    """导出费用计算测试（不依赖数据库）"""
+    
+    @pytest.mark.parametrize("tier, remaining, expected_cost, expected_message", [
+        (SubscriptionTier.PROFESSIONAL, 5.0, 0.0, "使用额度：2.0分钟，剩余额度：3.0分钟"),
+        (SubscriptionTier.PAY_PER_USE, 1.0, 20.0, "按量付费：2.0分钟 × ¥10.0/分钟 = ¥20.0"),
+        (SubscriptionTier.PROFESSIONAL, 0.5, 15.0, "额度不足1.5分钟，需支付：¥15.0。建议升级订阅计划。"),
+    ])
+    def test_cost_and_message(self, mock_db, tier, remaining, expected_cost, expected_message):
+        """费用与提示消息基于同一次计算结果"""
+        mock_db.get.return_value = SimpleNamespace(
+            subscription_tier=tier,
+            remaining_quota_minutes=remaining
+        )
+        
+        cost_info = UsageService(mock_db).calculate_export_cost(uuid.uuid4(), 2.0)
+        
+        assert cost_info["cost"] == expected_cost
+        assert cost_info["needs_payment"] is (expected_cost > 0)
+        assert cost_info["message"] == expected_message
+
+
+class TestQuotaUpdates:
+    """额度扣减与恢复测试（不依赖数据库）"""
+    
+    def test_deduct_within_quota_is_single_atomic_update(self, mock_db):
+        """额度充足时一条 UPDATE ... RETURNING 完成扣减，不再 refresh"""
+        user = SimpleNamespace(remaining_quota_minutes=3.0)
+        with patch.object(UsageService, "_update_user_returning", return_value=user) as update_user:
+            result, cost = UsageService(mock_db).deduct_quota(uuid.uuid4(), 2.0)
+        
+        assert (result, cost) == (user, 0.0)
+        update_user.assert_called_once()
+        mock_db.expunge.assert_not_called()
+        mock_db.commit.assert_called_once()
+        mock_db.refresh.assert_not_called()
+    
+    def test_deduct_pay_per_use_over_quota_charges(self, mock_db):
+        """按量付费用户额度不足时清零额度并按时长计费"""
+        user = SimpleNamespace(remaining_quota_minutes=0.0)
+        with patch.object(UsageService, "_update_user_returning", side_effect=[None, user]):
+            result, cost = UsageService(mock_db).deduct_quota(uuid.uuid4(), 2.0)
+        
+        assert result is user
+        assert cost == 2.0 * UsageService.PAY_PER_USE_PRICE
+    
+    def test_deduct_insufficient_quota_raises(self, mock_db):
+        """订阅制用户额度不足时报错且不提交"""
+        mock_db.get.return_value = SimpleNamespace(remaining_quota_minutes=1.0)
+        with patch.object(UsageService, "_update_user_returning", return_value=None):
+            with pytest.raises(ValueError, match="额度不足"):
+                UsageService(mock_db).deduct_quota(uuid.uuid4(), 2.0)
+        
+        mock_db.commit.assert_not_called()
+    
+    def test_deduct_missing_user_raises(self, mock_db):
+        """用户不存在时报错"""
+        mock_db.get.return_value = None
+        with patch.object(UsageService, "_update_user_returning", return_value=None):
+            with pytest.raises(ValueError, match="用户不存在"):
+                UsageService(mock_db).deduct_quota(uuid.uuid4(), 2.0)
+    
+    def test_restore_missing_user_raises(self, mock_db):
+        """恢复额度时用户不存在报错"""
+        with patch.object(UsageService, "_update_user_returning", return_value=None):
+            with pytest.raises(ValueError, match="用户不存在"):
+                UsageService(mock_db).restore_quota(uuid.uuid4(), 2.0)
+
+
+class TestBatchDeduction:
+    """批量扣减测试（不依赖数据库）"""
+    
+    @pytest.fixture
+    def batch_db(self):
+        db = MagicMock()
+        db.get_bind.return_value.dialect.name = "sqlite"
+        return db
+    
+    @staticmethod
+    def _users(db, *users):
+        query = db.query.return_value.filter.return_value.with_for_update.return_value
+        query.all.return_value = [
+            SimpleNamespace(id=user_id, remaining_quota_minutes=quota, subscription_tier=tier)
+            for user_id, quota, tier in users
+        ]
+    
+    def test_batch_follows_sequential_rules_with_one_commit(self, batch_db):
+        """逐项结算规则与依次扣减一致，整批一条 UPDATE、一条明细 INSERT、一次提交"""
+        user_a, user_b = uuid.uuid4(), uuid.uuid4()
+        self._users(
+            batch_db,
+            (user_a, 5.0, SubscriptionTier.PROFESSIONAL),
+            (user_b, 1.0, SubscriptionTier.PAY_PER_USE),
+        )
+        
+        costs = UsageService(batch_db).deduct_quota_many([
+            (user_a, 2.0, "video_export"),
+            (user_b, 2.0, "video_export"),
+            (user_a, 3.0, "render"),
+            (user_b, 0.5, "video_export"),
+        ])
+        
+        assert costs == [0.0, 20.0, 0.0, 5.0]
+        
+        (update_call, insert_call, upsert_call) = batch_db.execute.call_args_list
+        update_params = update_call.args[1]
+        assert sorted(update_params, key=lambda p: p["b_remaining"]) == [
+            {"b_user_id": user_a, "b_remaining": 0.0},
+            {"b_user_id": user_b, "b_remaining": 0.0},
+        ]
+        assert "UPDATE users SET remaining_quota_minutes" in str(
+            update_call.args[0].compile(dialect=sqlite.dialect())
+        )
+        assert [row["cost"] for row in insert_call.args[1]] == costs
+        
+        sql = str(upsert_call.args[0].compile(dialect=sqlite.dialect()))
+        assert "count = (usage_daily_stats.count + excluded.count)" in sql
+        # (用户, 操作类型) 合并为三行
+        assert sql.count("?, ?, ?, ?, ?, ?, ?, ?") == 3
+        batch_db.commit.assert_called_once()
+    
+    def test_batch_insufficient_quota_writes_nothing(self, batch_db):
+        """任一项额度不足时整批不写入"""
+        user_id = uuid.uuid4()
+        self._users(batch_db, (user_id, 3.0, SubscriptionTier.PROFESSIONAL))
+        
+        with pytest.raises(ValueError, match="额度不足"):
+            UsageService(batch_db).deduct_quota_many([
+                (user_id, 2.0, "video_export"),
+                (user_id, 2.0, "video_export"),
+            ])
+        
+        batch_db.execute.assert_not_called()
+        batch_db.commit.assert_not_called()
+    
+    def test_batch_missing_user_raises(self, batch_db):
+        """涉及不存在的用户时报错"""
+        self._users(batch_db)
+        with pytest.raises(ValueError, match="用户不存在"):
+            UsageService(batch_db).deduct_quota_many([(uuid.uuid4(), 1.0, "video_export")])
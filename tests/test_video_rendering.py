@@ -6,7 +6,11 @@ import json
 import pytest
 from PIL import Image
 from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
 
+from app.services import video_rendering
 from app.services.video_rendering import (
     VideoRenderingEngine,
     VideoProjectConfig,
@@ -66,6 +70,20 @@ class TestVideoProjectConfig:
         
         assert config.resolution == (2160, 3840)
     
+    def test_resolution_table_covers_all_combinations(self):
+        """测试每种比例与质量组合都有偶数分辨率"""
+        for aspect_ratio in AspectRatio:
+            for quality in VideoQuality:
+                width, height = VideoProjectConfig(
+                    aspect_ratio=aspect_ratio, quality=quality
+                ).resolution
+                assert width % 2 == 0 and height % 2 == 0
+        
+        assert VideoProjectConfig(
+            aspect_ratio=AspectRatio.HORIZONTAL_16_9,
+            quality=VideoQuality.HD_720P
+        ).resolution == (1280, 720)
+    
     def test_duration_validation(self):
         """测试时长范围"""
         # 有效时长
@@ -188,6 +206,17 @@ class TestCompositionOptimizer:
         assert optimized.width == optimized.height
         assert optimized.width == 1080  # 取较小的边
     
+    def test_optimize_skips_crop_when_ratio_matches(self):
+        """测试比例已符合时直接返回原图，不复制像素"""
+        optimizer = CompositionOptimizer()
+        
+        square = self.create_test_image(1080, 1080)
+        vertical = self.create_test_image(1080, 1920)
+        
+        assert optimizer.optimize_for_square(square) is square
+        assert optimizer.optimize_for_vertical(vertical) is vertical
+        assert optimizer.optimize_for_square(vertical).size == (1080, 1080)
+    
     def test_optimize_composition_vertical(self):
         """测试构图优化（竖屏）"""
         optimizer = CompositionOptimizer()
@@ -237,6 +266,30 @@ class TestCompositionOptimizer:
         for position in ["top", "center", "bottom"]:
             image_with_text = optimizer.add_text_overlay(image, text, position=position)
             assert image_with_text.size == image.size
+    
+    def test_text_overlay_font_cached_per_size(self):
+        """测试同一字号的字体只加载一次"""
+        optimizer = CompositionOptimizer()
+        image = self.create_test_image(1080, 1920)
+        
+        truetype = video_rendering.ImageFont.truetype
+        loaded = []
+        
+        def fake_truetype(font, size=10, *args, **kwargs):
+            # 系统字体不存在时回退默认字体（新版Pillow的默认字体也经由 truetype 加载）
+            if font == "arial.ttf":
+                loaded.append(size)
+                raise OSError("cannot open resource")
+            return truetype(font, size, *args, **kwargs)
+        
+        video_rendering._get_font.cache_clear()
+        with patch("app.services.video_rendering.ImageFont.truetype", side_effect=fake_truetype):
+            for _ in range(3):
+                optimizer.add_text_overlay(image, "测试", font_size=40)
+            optimizer.add_text_overlay(image, "测试", font_size=48)
+        video_rendering._get_font.cache_clear()
+        
+        assert loaded == [40, 48]
 
 
 class TestVideoRenderingEngine:
@@ -249,6 +302,16 @@ class TestVideoRenderingEngine:
         
         assert engine1 is engine2
     
+    def test_storage_client_shared(self):
+        """测试引擎与构图优化器共享模块级存储客户端"""
+        from app.core.storage import storage_manager
+        
+        engine = VideoRenderingEngine()
+        
+        assert engine.storage is storage_manager
+        assert engine.composition_optimizer.storage is storage_manager
+        assert CompositionOptimizer().storage is storage_manager
+    
     def test_create_project_config(self):
         """测试创建项目配置"""
         engine = VideoRenderingEngine()
@@ -393,6 +456,159 @@ class TestVideoRenderingEngine:
         assert isinstance(video_path, str)
         assert len(video_path) > 0
     
+    @staticmethod
+    def _run_with_fake_ffmpeg(engine, frames, config, min_frames=2):
+        """以伪造的FFmpeg进程渲染，返回 (命令, 写入stdin的数据)"""
+        processes = []
+        
+        class FakeProcess:
+            """记录写入stdin的数据，并以失败状态退出"""
+            def __init__(self, cmd, stdin, stdout, stderr):
+                self.cmd = cmd
+                self.stdin = io.BytesIO()
+                self.data = b""
+                self.stdin.close = lambda: setattr(self, "data", self.stdin.getvalue())
+                stderr.write(b"stop")
+                processes.append(self)
+            
+            def wait(self):
+                return 1
+        
+        with patch("app.services.video_rendering.FRAME_PREPARE_PARALLEL_MIN_FRAMES", min_frames), \
+                patch("app.services.video_rendering.subprocess.Popen", side_effect=FakeProcess):
+            with pytest.raises(RuntimeError, match="stop"):
+                engine._render_video_internal(frames, config)
+        
+        return processes[0].cmd, processes[0].data
+    
+    @staticmethod
+    def _encode_frames(sizes, image_format):
+        frames = []
+        for i, size in enumerate(sizes):
+            image = Image.new('RGB', size, color=(i * 20, 0, 0))
+            image_bytes = io.BytesIO()
+            image.save(image_bytes, format=image_format)
+            frames.append(image_bytes.getvalue())
+        return frames
+    
+    def test_png_frames_passed_through_to_ffmpeg(self):
+        """测试PNG帧原样经stdin透传，缩放由FFmpeg的scale滤镜完成"""
+        engine = VideoRenderingEngine()
+        config = VideoProjectConfig(aspect_ratio=AspectRatio.VERTICAL_9_16, duration_minutes=1.0)
+        width, height = config.resolution
+        frames = self._encode_frames([(90, 160), (180, 320)], 'PNG')
+        
+        cmd, data = self._run_with_fake_ffmpeg(engine, frames, config)
+        
+        assert cmd[cmd.index("-f") + 1] == "image2pipe"
+        assert cmd[cmd.index("-i") + 1] == "pipe:0"
+        assert cmd[cmd.index("-vf") + 1] == f"scale={width}:{height}:flags=lanczos"
+        assert data == b"".join(frames)
+    
+    def test_raw_frames_piped_at_native_size(self):
+        """测试非PNG且尺寸一致的帧以原始尺寸的rgb24传入（进程池与顺序处理顺序一致）"""
+        engine = VideoRenderingEngine()
+        config = VideoProjectConfig(aspect_ratio=AspectRatio.VERTICAL_9_16, duration_minutes=1.0)
+        frames = self._encode_frames([(90, 160)] * 10, 'BMP')
+        frame_size = 90 * 160 * 3
+        
+        # 进程池路径与顺序路径
+        for min_frames in (2, 100):
+            cmd, data = self._run_with_fake_ffmpeg(engine, frames, config, min_frames)
+            
+            assert cmd[cmd.index("-f") + 1] == "rawvideo"
+            assert cmd[cmd.index("-s") + 1] == "90x160"
+            assert len(data) == frame_size * len(frames)
+            assert [data[i * frame_size] for i in range(len(frames))] == [i * 20 for i in range(10)]
+    
+    def test_mixed_size_raw_frames_resized_before_piping(self):
+        """测试非PNG且尺寸不一致的帧先缩放到目标分辨率"""
+        engine = VideoRenderingEngine()
+        config = VideoProjectConfig(aspect_ratio=AspectRatio.VERTICAL_9_16, duration_minutes=1.0)
+        width, height = config.resolution
+        frames = self._encode_frames([(90, 160), (45, 80)], 'BMP')
+        
+        cmd, data = self._run_with_fake_ffmpeg(engine, frames, config)
+        
+        assert cmd[cmd.index("-s") + 1] == f"{width}x{height}"
+        assert len(data) == width * height * 3 * len(frames)
+    
+    def test_available_encoders_parsed_once(self):
+        """测试 ffmpeg -encoders 输出只解析视频编码器，且每个进程只查询一次"""
+        output = (
+            "Encoders:\n"
+            " V..... = Video\n"
+            " ------\n"
+            " V....D libx264              libx264 H.264 / AVC\n"
+            " V....D h264_nvenc           NVIDIA NVENC H.264 encoder\n"
+            " A....D aac                  AAC (Advanced Audio Coding)\n"
+        )
+        video_rendering._available_encoders.cache_clear()
+        try:
+            with patch(
+                "app.services.video_rendering.subprocess.run",
+                return_value=SimpleNamespace(stdout=output)
+            ) as run:
+                assert video_rendering._hardware_preview_encoder_args()[1] == "h264_nvenc"
+                assert "aac" not in video_rendering._available_encoders()
+                assert run.call_count == 1
+        finally:
+            video_rendering._available_encoders.cache_clear()
+    
+    def test_preview_falls_back_to_software_encoder(self):
+        """测试硬件编码失败时预览回退到x264 ultrafast"""
+        engine = VideoRenderingEngine()
+        config = VideoProjectConfig(quality=VideoQuality.FULL_HD_1080P)
+        hardware_args = video_rendering.HARDWARE_PREVIEW_ENCODER_ARGS[0]
+        calls = []
+        
+        def fake_render(frames, preview_config, audio_path, encoder_args):
+            calls.append(encoder_args)
+            if encoder_args is hardware_args:
+                raise RuntimeError("FFmpeg渲染失败: No NVENC capable devices found")
+            assert preview_config.quality == VideoQuality.HD_720P
+            return b"video"
+        
+        with patch(
+            "app.services.video_rendering._hardware_preview_encoder_args",
+            return_value=hardware_args
+        ), patch.object(engine, "_render_video_internal", side_effect=fake_render):
+            assert engine.generate_preview([b"frame"], config) == b"video"
+        
+        assert calls == [hardware_args, video_rendering.PREVIEW_ENCODER_ARGS]
+        assert "ultrafast" in video_rendering.PREVIEW_ENCODER_ARGS
+    
+    def test_render_video_streams_output_file_to_storage(self):
+        """测试渲染结果直接以FFmpeg输出文件上传，不整体读入内存"""
+        engine = VideoRenderingEngine()
+        config = VideoProjectConfig(aspect_ratio=AspectRatio.VERTICAL_9_16, duration_minutes=1.0)
+        frames = self._encode_frames([(90, 160)] * 2, 'PNG')
+        uploaded = {}
+        
+        class FakeProcess:
+            """把视频写到命令行指定的输出路径并成功退出"""
+            def __init__(self, cmd, stdin, stdout, stderr):
+                Path(cmd[-1]).write_bytes(b"mp4-data")
+                self.stdin = io.BytesIO()
+            
+            def wait(self):
+                return 0
+        
+        def fake_upload(file, object_key):
+            uploaded.update(name=file.name, data=file.read(), key=object_key)
+            return f"/storage/{object_key}"
+        
+        storage = SimpleNamespace(upload_file=fake_upload)
+        with patch.object(engine, "storage", storage), \
+                patch("app.services.video_rendering.subprocess.Popen", side_effect=FakeProcess):
+            storage_path = engine.render_video(frames, config, output_path="videos/out.mp4")
+        
+        assert storage_path == "/storage/videos/out.mp4"
+        assert uploaded["data"] == b"mp4-data"
+        assert uploaded["name"].endswith("output.mp4")
+        # 临时目录在上传完成后删除
+        assert not Path(uploaded["name"]).exists()
+    
     def test_render_video_empty_frames(self):
         """测试渲染空帧列表"""
         engine = VideoRenderingEngine()